@@ -1,7 +1,7 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
 
-import uuid
+import os, uuid, socket, itertools
 from datetime import timedelta
 
 from front.lib import db, gametime, get_uuid, event, xjson
@@ -10,6 +10,15 @@ from front.callbacks import run_callback, TIMER_CB
 import logging
 logger = logging.getLogger(__name__)
 
+# If a worker's claim on a user's deferred rows is older than this number of minutes then the worker
+# has failed and the rows are claimed and run again by another worker. See run_deferred_claimed.
+LOCK_TIMEOUT = 5
+# The number of users with due deferred rows a worker looks for at a time in run_deferred_claimed.
+CLAIM_BATCH_USERS = 50
+# If a user's batch of deferred rows fails and its oldest row has been due for longer than this number of
+# hours then the batch has been failing repeatedly, blocking all of the user's deferreds, and an error is logged.
+FAILING_BATCH_ALERT_HOURS = 1
+
 class DeferredRow(object):
     """
     Wraps the fields from a a deferred database row.
@@ -23,8 +32,11 @@ class DeferredRow(object):
         if self.payload is not None:
             self.payload = xjson.loads(self.payload)
 
-    def delete(self, ctx):
+    def delete(self, ctx, user=None):
+        """ Delete this row. If the user is given their pending_deferreds are kept up to date. """
         db.run(ctx, 'deferred/delete_deferred', deferred_id=self.deferred_id)
+        if user is not None:
+            user.pending_deferred_removed(self.deferred_type, self.subtype)
 
     def __repr__(self):
         payload = None if self.payload is None else ",".join(sorted(self.payload.keys()))
@@ -40,7 +52,23 @@ class types(object):
     TIMER = "TIMER"
     ALL = set([EMAIL, MESSAGE, TARGET_ARRIVED, MISSION_DONE_AFTER, TIMER])
 
-def run_on_timer(ctx, timer_subtype, user, delay, **kwargs):
+# How run_later treats an action with the same deferred_type and subtype already queued for the user.
+# Actions queued with any dedup mode are only ever queued once per user, deferred_type and subtype.
+class dedup(object):
+    # Leave the queued action as it is and do not queue another.
+    IF_NOT_QUEUED = "IF_NOT_QUEUED"
+    # Move the queued action's run_at to the new run_at if that is earlier, otherwise leave it.
+    EARLIER = "EARLIER"
+    # Move the queued action's run_at to the new run_at if that is later, otherwise leave it.
+    LATER = "LATER"
+
+_DEDUP_QUERIES = {
+    dedup.IF_NOT_QUEUED: "deferred/insert_deferred_if_not_queued",
+    dedup.EARLIER:       "deferred/insert_deferred_or_run_earlier",
+    dedup.LATER:         "deferred/insert_deferred_or_run_later"
+}
+
+def run_on_timer(ctx, timer_subtype, user, delay, _dedup=None, **kwargs):
     """
     Request that a timer_arrived_at event be dispatched to the timer_callbacks for the given TMR_ subtype.
     :param ctx: The database context.
@@ -50,6 +78,7 @@ def run_on_timer(ctx, timer_subtype, user, delay, **kwargs):
     :param kwargs: dict, Any additonal keyword arguments will be added to the deferred payload and passed
         to the timer callback as arguments. NOTE: These arguments must be able to be JSON serializable and
         also note that the size of the payload is not very large so keep the keys and values small.
+    :param _dedup: Optional dedup mode, see run_later.
     """
     assert timer_subtype.startswith("TMR_"), "Timer subtype keys must start with a TMR_ prefix."
     # If any extra arguments were supplied, pack them into a payload dictionary ready to
@@ -58,9 +87,9 @@ def run_on_timer(ctx, timer_subtype, user, delay, **kwargs):
         payload = dict(kwargs)
     else:
         payload = None
-    run_later(ctx, types.TIMER, timer_subtype, user, delay, _payload=payload)
+    run_later(ctx, types.TIMER, timer_subtype, user, delay, _payload=payload, dedup=_dedup)
 
-def run_later(ctx, deferred_type, subtype, user, delay, _payload=None):
+def run_later(ctx, deferred_type, subtype, user, delay, _payload=None, dedup=None):
     """
     Request that an action be run after a given delay.
     :param ctx: The database context.
@@ -71,6 +100,9 @@ def run_later(ctx, deferred_type, subtype, user, delay, _payload=None):
     :param _payload: Optional dict of JSON-ifyable data to associate with this deferred action.
         NOTE: It is intended that if payload is used, run_later will be wrapped by a function which
         enumerates in a clear manner what data should be placed into the payload, hence its private nature.
+    :param dedup: Optional dedup mode, one of the dedup constants. If an action with the same deferred_type and
+        subtype was queued for the user with a dedup mode, that action is kept and its run_at adjusted according
+        to the mode instead of queueing another. The payload of the queued action is never changed.
     """
     assert deferred_type in types.ALL, "Unknown deferred_type %s" % deferred_type
     if delay < 0:
@@ -91,23 +123,38 @@ def run_later(ctx, deferred_type, subtype, user, delay, _payload=None):
 
     # Save all data needed to run the action to the deferred table.
     with db.conn(ctx) as ctx:
-        db.run(ctx, "deferred/insert_deferred", **params)
+        if dedup is None:
+            db.run(ctx, "deferred/insert_deferred", **params)
+        else:
+            params['dedup_key'] = "%s:%s" % (deferred_type, subtype)
+            db.run(ctx, _DEDUP_QUERIES[dedup], **params)
+    user.pending_deferred_added(deferred_type, subtype, dedup=dedup is not None)
 
-def is_queued_to_run_later_for_user(ctx, deferred_type, subtype, user):
+def is_queued_to_run_later_for_user(ctx, deferred_type, subtype, user, live=False):
     """
     Return True if there is at least one deferred action in the queue for the
     given deferred_type and subtype for the given user. False otherwise.
-    See run_later for parameter documentation.
+    The user's queued actions are loaded once into user.pending_deferreds (or by user.load_row_cache)
+    and are kept up to date as actions are queued and deleted through this user instance, so any further
+    checks do not query the database. Actions deleted by another UserModel instance or process (e.g. the
+    deferred runner) are not seen, so the answer may be stale within a request.
+    :param live: bool, if True query the database instead, for callers which need a current answer.
+    See run_later for other parameter documentation.
     """
-    with db.conn(ctx) as ctx:
-        row = db.row(ctx, "deferred/deferred_type_exists_for_user",
-                       deferred_type=deferred_type, subtype=subtype, user_id=user.user_id)
-        return row['exist'] == 1
+    if live:
+        with db.conn(ctx) as ctx:
+            row = db.row(ctx, "deferred/deferred_type_exists_for_user",
+                           deferred_type=deferred_type, subtype=subtype, user_id=user.user_id)
+            return row['exist'] == 1
+    return user.pending_deferreds[(deferred_type, subtype)] > 0
 
 def run_deferred_since(ctx, since):
     '''
     Find all rows in the deferred table where the run_at time has passed.
     Run action and delete row.
+    Each user's rows are run together in (run_at, deferred_id) order with a single user load and are deleted
+    in a single commit. If any of a user's rows fail the whole of that user's batch is rolled back and is tried
+    again the next time this runs, other users' batches are unaffected.
     :param ctx: The database context.
     :param since: datetime Run deferred actions with run_at times older than this.
     Returns the number of deferred actions run.
@@ -116,29 +163,135 @@ def run_deferred_since(ctx, since):
     from front.models import user as user_module
     with db.conn(ctx) as ctx:
         processed = 0
-        rows = db.rows(ctx, 'deferred/select_deferred_since', since=since)
-        for row in rows:
-            try:
-                deferred_row = DeferredRow(**row)
-                user = user_module.user_from_context(ctx, deferred_row.user_id)
-
-                # Process this deferred action.
-                process_row(ctx, user, deferred_row)
-
-                # If no exception ocurred for this deferred, delete it from the database and
-                # commit the transaction.
-                deferred_row.delete(ctx)
-                db.commit(ctx)
-                processed += 1
-
-            except:
-                # If any exception occurs processing this row, rollback the transaction
-                # and try the next deferred row. process_row is responsible for logging
-                # any exceptions that occur.
-                db.rollback(ctx)
+        # Stream the rows as there might be a large backlog of deferreds to process.
+        # The SQL returns each user's rows next to each other, oldest first.
+        rows = db.iter_rows(ctx, 'deferred/select_deferred_since', since=since)
+        for user_id, user_rows in itertools.groupby(rows, key=lambda row: row['user_id']):
+            processed += _run_user_batch(ctx, user_module, get_uuid(user_id), list(user_rows))
 
     return processed
 
+def worker_name():
+    """ Returns a name identifying the current process to use as the worker in run_deferred_claimed. """
+    return "%s:%d:%s" % (socket.gethostname()[:32], os.getpid(), uuid.uuid4().hex[:8])
+
+def run_deferred_claimed(ctx, since, worker, batch_users=CLAIM_BATCH_USERS):
+    '''
+    Run the deferred actions with run_at times older than since, like run_deferred_since, except that any
+    number of workers can do this at the same time without holding a global lock.
+    A worker claims a user by marking all of that user's due deferred rows as locked_by itself, then runs
+    those rows as a batch, see _run_user_batch.
+    A user is only claimed when none of their rows are claimed by another worker, so each user's deferreds
+    are still run in order. A claim older than LOCK_TIMEOUT minutes was abandoned by a failed worker and the
+    user's rows are claimed again. If any of a user's deferreds fail the whole batch is rolled back and the
+    rows stay claimed, so that they are tried again once the claim has timed out.
+    A worker checks that it still holds the claim before running a user's batch, and the rows stay locked
+    until the batch is committed, so a claim older than LOCK_TIMEOUT minutes cannot be taken over while the
+    batch is running, see _run_user_batch. A worker which waits too long for, or deadlocks on, the locks of
+    a user's rows skips that user.
+    :param ctx: The database context.
+    :param since: datetime Run deferred actions with run_at times older than this.
+    :param worker: str Unique name of this worker, e.g. from worker_name().
+    :param batch_users: int Number of users to look for and claim at a time.
+    Returns the number of deferred actions run.
+    '''
+    # Have to import user_module this way to avoid a cyclic dependency import error.
+    from front.models import user as user_module
+    with db.conn(ctx) as ctx:
+        processed = 0
+        while True:
+            lock_timeout = gametime.now() - timedelta(minutes=LOCK_TIMEOUT)
+            rows = db.rows(ctx, 'deferred/select_unclaimed_deferred_users', since=since, lock_timeout=lock_timeout, limit=batch_users)
+            db.commit(ctx)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                user_id = get_uuid(row['user_id'])
+                if _claim_user(ctx, user_id, since, worker, lock_timeout):
+                    processed += _run_claimed_for_user(ctx, user_module, user_id, worker)
+
+    return processed
+
+def _claim_user(ctx, user_id, since, worker, lock_timeout):
+    """ Claim the given user's deferred rows with run_at times older than since for the given worker.
+        Returns False if another worker already holds a claim on any of the user's rows or none are due, or
+        if the rows could not be locked. """
+    # Locking all of the user's rows makes checking for and making a claim atomic.
+    try:
+        locks = db.rows(ctx, 'deferred/select_deferred_locks_for_update', user_id=user_id)
+    except Exception, e:
+        # Another worker holds the rows locked while running them or making its own claim.
+        if not db.is_lock_error(e):
+            raise
+        logger.warning("Unable to lock deferred actions to claim them, skipping user [%s][%s]", user_id, e)
+        db.rollback(ctx)
+        return False
+    claimed = any(lock['locked_by'] is not None and lock['locked_at'] >= lock_timeout for lock in locks)
+    # Another worker might also have run and deleted the user's due rows since they were looked for.
+    due = any(lock['run_at'] <= since for lock in locks)
+    if claimed or not due:
+        db.rollback(ctx)
+        return False
+    db.run(ctx, 'deferred/update_deferred_claim_for_user', user_id=user_id, since=since,
+           locked_by=worker, locked_at=gametime.now())
+    db.commit(ctx)
+    return True
+
+def _run_claimed_for_user(ctx, user_module, user_id, worker):
+    """ Run every deferred row claimed by the given worker for the given user, see _run_user_batch. """
+    rows = db.rows(ctx, 'deferred/select_claimed_deferred_for_user', user_id=user_id, locked_by=worker)
+    return _run_user_batch(ctx, user_module, user_id, rows, worker=worker)
+
+def _run_user_batch(ctx, user_module, user_id, rows, worker=None):
+    """
+    Run the given deferred rows for the given user, in the order given, against a single load of the user.
+    The user's models are updated in place by every action so each action sees the changes made by those
+    before it. The rows are deleted before any action is run, so an action may queue another action with
+    the same deferred_type and subtype as itself (e.g. with a dedup mode), and the transaction is committed
+    once every action has run, or if any action fails the transaction is rolled back, restoring the rows.
+    If the rows were claimed by a worker, the batch is not run if that worker no longer holds the claim on
+    every row, as another worker has taken the claim over and is running the same rows.
+    Returns the number of deferred actions run.
+    """
+    if len(rows) == 0:
+        return 0
+    try:
+        deferred_rows = [DeferredRow(**row) for row in rows]
+        # The rows stay locked until the transaction ends, so the claim cannot be taken over while they run.
+        if worker is not None and not _still_claimed(ctx, deferred_rows, worker):
+            logger.error("Lost the claim on deferred actions before running them, rolling back [%s][%s]", user_id, worker)
+            db.rollback(ctx)
+            return 0
+        db.run(ctx, 'deferred/delete_deferred_ids', deferred_ids=[r.deferred_id for r in deferred_rows])
+
+        user = user_module.user_from_context(ctx, user_id)
+        # Load the data most callbacks read in a single round trip.
+        user.load_row_cache('callbacks-only')
+
+        # Process these deferred actions.
+        for deferred_row in deferred_rows:
+            process_row(ctx, user, deferred_row)
+
+        # If no exception ocurred for any deferred, commit the transaction.
+        db.commit(ctx)
+        return len(deferred_rows)
+
+    except:
+        # If any exception occurs processing the user's rows, rollback the transaction and move on
+        # to the next user. process_row is responsible for logging any exceptions that occur.
+        db.rollback(ctx)
+        oldest_run_at = min(row['run_at'] for row in rows)
+        if gametime.now() - oldest_run_at > timedelta(hours=FAILING_BATCH_ALERT_HOURS):
+            logger.error("Deferred actions for user have been failing since they were due, blocking all of their deferreds [%s][%s][%d]",
+                user_id, oldest_run_at, len(rows))
+        return 0
+
+def _still_claimed(ctx, deferred_rows, worker):
+    """ Returns True if every one of the given rows is still claimed by the given worker. The rows are locked
+        until the end of the transaction so the claim cannot be taken over before it is committed. """
+    locks = db.rows(ctx, 'deferred/select_deferred_locked_by_for_update', deferred_ids=[r.deferred_id for r in deferred_rows])
+    return len(locks) == len(deferred_rows) and all(lock['locked_by'] == worker for lock in locks)
+
 def process_row(ctx, user, row):
     if row.deferred_type == types.EMAIL:
         from front.lib import email_module
@@ -88,7 +88,7 @@ def _get_member_data(request, member_data):
         result['last_active'] = u.profile_approx_time_since_last_accessed()
         result['distance'] = str(u.profile_total_distance_traveled_rounded())+'m';
         result['photos_taken'] = len(u.all_picture_targets())
-        result['tags'] = '%d/%d' % (len(u.all_image_rects()), len(u.all_image_rects_with_species()))
+        result['tags'] = '%d/%d' % (u.species_tally.rect_count(), u.species_tally.rect_with_species_count())
         result['completed_missions'] = len(u.missions.done(root_only=True))
         result['tagged_plants'] = len(u.species.plants())
         result['tagged_animals'] = len(u.species.animals())
@@ -1,17 +1,49 @@
 # Copyright (c) 2010-2013 Lazy 8 Studios, LLC.
 # All rights reserved.
-from front.lib import urls, utils, gametime
-from front.backend import edmodo_backend
+from datetime import timedelta
+
+from front import Constants
+from front.lib import urls, utils, gametime, xjson
+from front.models import chips
+from front.backend import edmodo_backend, gamestate_cache
+
+# A cached snapshot of the user gamestate is never used for longer than this. Everything in the gamestate
+# is expected to change along with a chip, this bounds how long anything which does not stays stale.
+SNAPSHOT_MAX_AGE = timedelta(minutes=10)
+# Some time gated data changes shortly after the chip announcing it is delivered, e.g. a map tile stays in
+# the gamestate for TARGET_DATA_LEEWAY_SECONDS after its expiry_time, which is the arrival_time of the next
+# tile, whose chip is delivered TARGET_DATA_LEEWAY_SECONDS before that. A snapshot built within this long
+# of the newest chip is only used until this long after that chip.
+SNAPSHOT_SETTLE = timedelta(seconds=2 * Constants.TARGET_DATA_LEEWAY_SECONDS)
 
 def gamestate_for_user(u, request):
     """This is the top-level gamestate-building function.  It returns a Python
     dictionary which the caller can easily convert to JSON or whatever."""
+    gamestate = _gamestate_namespaces(u, request)
+    # Finally add the 'user' namespace with all of the user's game state.
     front_config = request.environ['front.config']
+    gamestate['user'] = _user_struct(u, gamestate_cache.cache_for_config(front_config))
+    return gamestate
 
-    # Ask the user object to load and cache all of the gamestate data so that only a few
-    # queries are executed instead of a large number of queries for every collection lazy loader.
-    # The results are cached in u.ctx.row_cache and used in the lazy loader functions.
-    u.load_gamestate_row_cache()
+def gamestate_json_chunks(u, request):
+    """
+    Returns the JSON encoding of the gamestate_for_user dictionary as a list of chunks, for use as a WSGI
+    response body. The 'user' namespace is encoded straight from the user's models in one serialization pass
+    (see chips.iter_json) instead of first being built as a dictionary and then encoded. Every chunk is built
+    before this returns, as is everything which needs the database, loading the user and looking up or storing
+    the snapshot, so the request's transaction can be committed and its connection released before the body is
+    written out to the client. The whole encoding is therefore held in memory, as with xjson.dumps.
+    """
+    gamestate = _gamestate_namespaces(u, request)
+    chunks = ['{' + ''.join('%s: %s, ' % (xjson.dumps(k), xjson.dumps(v)) for k, v in gamestate.iteritems()) + '"user": ']
+    front_config = request.environ['front.config']
+    chunks.extend(_user_json(u, gamestate_cache.cache_for_config(front_config)))
+    chunks.append('}')
+    return chunks
+
+def _gamestate_namespaces(u, request):
+    """ Returns the gamestate dictionary without the 'user' namespace. """
+    front_config = request.environ['front.config']
 
     # Construct the user map tile url base by including the user_id elements.
     user_map_tile_url = "%s/%s/%s" % (
@@ -37,10 +69,10 @@ def gamestate_for_user(u, request):
         'server_time':         utils.to_ts(gametime.now()),
         'last_seen_chip_time': utils.usec_js_from_dt(gametime.now()),
         'chip_fetch_interval': int(front_config['chip_fetch_interval']),
+        # Seconds the client should ask fetch_chips to wait for new chips, 0 to disable long polling.
+        'chip_long_poll_wait': int(front_config.get('chip_long_poll_wait', 0)),
         'use_social_networks': front_config['template.use_social_networks']
     }
-    # Finally add the 'user' namespace with all of the user's game state.
-    gamestate['user'] = u.to_struct()
 
     # If this user is a teacher who should have access to classroom data, build that struct now.
     # The attempt to fetch teacher credentials will either return None or a struct with
@@ -49,5 +81,79 @@ def gamestate_for_user(u, request):
     if edmodo_credentials:
         gamestate['classroom'] = edmodo_backend.get_classroom_data(request, edmodo_credentials['access_token'],
                                     edmodo_credentials['user_token'], edmodo_credentials['sandbox'])
-    
+
     return gamestate
+
+def _user_struct(u, cache):
+    """
+    Returns the 'user' namespace of the gamestate, from the snapshot cache if possible.
+    A snapshot is keyed by the user's epoch and the newest chip they can see, and is only used until the
+    next chip the user has been sent becomes visible, so time gated data (e.g. target images hidden
+    until arrival_time) is never served after the chip which reveals it is due.
+    """
+    snapshot_key = _snapshot_key(u, cache)
+    if snapshot_key is None:
+        return _build_user_struct(u)
+    key, now_micros, valid_until = snapshot_key
+    snapshot = cache.get(u.user_id, key, now_micros)
+    if snapshot is not None:
+        return xjson.loads(snapshot)
+
+    struct = _build_user_struct(u)
+    cache.put(u.user_id, key, now_micros, valid_until, xjson.dumps(struct))
+    return struct
+
+def _user_json(u, cache):
+    """ Yields the JSON encoding of the 'user' namespace of the gamestate in chunks. See _user_struct. """
+    snapshot_key = _snapshot_key(u, cache)
+    if snapshot_key is None:
+        for chunk in _iter_user_json(u):
+            yield chunk
+        return
+    key, now_micros, valid_until = snapshot_key
+    snapshot = cache.get(u.user_id, key, now_micros)
+    if snapshot is not None:
+        yield snapshot
+        return
+
+    # The chunks are kept to store the snapshot once the user has been completely encoded.
+    chunks = []
+    for chunk in _iter_user_json(u):
+        chunks.append(chunk)
+        yield chunk
+    cache.put(u.user_id, key, now_micros, valid_until, ''.join(chunks))
+
+def _snapshot_key(u, cache):
+    """
+    Returns a (key, now, valid_until) tuple for storing or looking up the user's snapshot, both times in
+    microseconds, or None if the snapshot cache is disabled or there is no way to tell when the gamestate changes.
+    """
+    if cache is None:
+        return None
+    now = gametime.now()
+    state = chips.chip_state(u.ctx, u.user_id, now)
+    # Without a chip watermark there is no way to tell when the gamestate changes.
+    if state is None:
+        return None
+    key = "%d:%d:%s:%s" % (utils.usec_db_from_dt(u.epoch), state['version'], state['time'], state['seq'])
+    now_micros = utils.usec_db_from_dt(now)
+    valid_until = utils.usec_db_from_dt(now + SNAPSHOT_MAX_AGE)
+    if state['next_time'] is not None:
+        valid_until = min(valid_until, state['next_time'])
+    if state['time'] is not None:
+        settled_at = utils.usec_db_from_dt(utils.usec_dt_from_db(state['time']) + SNAPSHOT_SETTLE)
+        if settled_at > now_micros:
+            valid_until = min(valid_until, settled_at)
+    return key, now_micros, valid_until
+
+def _build_user_struct(u):
+    # Ask the user object to load and cache all of the gamestate data in a single round trip instead of
+    # executing a large number of queries for every collection lazy loader.
+    # The results are cached in u.ctx.row_cache and used in the lazy loader functions.
+    u.load_row_cache('gamestate')
+    return u.to_struct()
+
+def _iter_user_json(u):
+    # See _build_user_struct.
+    u.load_row_cache('gamestate')
+    return chips.iter_json(u)
@@ -0,0 +1,164 @@
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Stores for the serialized gamestate snapshots cached by backend.gamestate.
+
+Each user has at most one snapshot, stored along with the version key it was built for and the
+range of gametime (in microseconds) during which it may be used. A snapshot is only returned by get
+if the key matches exactly and now is within that range, so a store never needs to be told when
+a user's gamestate changes. Errors from a store are logged and treated as a cache miss.
+
+The store is chosen by the gamestate_cache config value:
+ * none -- (default) no caching.
+ * lru -- an in-process least recently used cache of gamestate_cache.max_entries snapshots.
+ * sqlite -- a sqlite database file at gamestate_cache.path, shared by every process on the host.
+"""
+import os, threading, tempfile, sqlite3, collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), 'front_gamestate_cache.sqlite')
+# Seconds a sqlite connection waits for another process to release its lock.
+SQLITE_TIMEOUT_SECONDS = 1.0
+# Trim the sqlite store back to max_entries after this many puts.
+SQLITE_TRIM_INTERVAL = 100
+
+def cache_for_config(config):
+    """ Return the snapshot store for the given config, or None if gamestate caching is disabled. """
+    if _g_override is not None:
+        return _g_override
+    cache_type = str(config.get('gamestate_cache', 'none')).lower()
+    if cache_type == 'none':
+        return None
+    key = (os.getpid(), cache_type, config.get('gamestate_cache.path'), config.get('gamestate_cache.max_entries'))
+    cache = _g_caches.get(key)
+    if cache is None:
+        with _g_caches_lock:
+            cache = _g_caches.get(key)
+            if cache is None:
+                max_entries = int(config.get('gamestate_cache.max_entries', DEFAULT_MAX_ENTRIES))
+                if cache_type == 'lru':
+                    cache = LRUSnapshotCache(max_entries)
+                elif cache_type == 'sqlite':
+                    cache = SqliteSnapshotCache(config.get('gamestate_cache.path', DEFAULT_SQLITE_PATH), max_entries)
+                else:
+                    raise Exception("Unknown gamestate_cache in .ini [%s]" % cache_type)
+                _g_caches[key] = cache
+    return cache
+
+def set_cache(cache):
+    """
+    Use the given store regardless of the config, or go back to using the config if cache is None.
+    This is meant for tests and tools.
+    """
+    global _g_override
+    _g_override = cache
+
+# Maps (pid, config values) to the store for that configuration. The pid is part of the key so that
+# a forked process never shares its parent's sqlite connections.
+_g_caches = {}
+_g_caches_lock = threading.Lock()
+_g_override = None
+
+class _SnapshotCache(object):
+    """ The API shared by all stores. Subclasses implement _load, _store and _delete. """
+    def get(self, user_id, key, now):
+        """ Return the snapshot string for the given user if it was stored with key and is usable at now. """
+        try:
+            entry = self._load(str(user_id))
+        except Exception:
+            logger.exception("Failed to load gamestate snapshot [%s]", user_id)
+            return None
+        if entry is None:
+            return None
+        entry_key, built, valid_until, snapshot = entry
+        if entry_key != key or not (built <= now < valid_until):
+            return None
+        return snapshot
+
+    def put(self, user_id, key, built, valid_until, snapshot):
+        """ Store the snapshot string for the given user, replacing any previous snapshot. """
+        try:
+            self._store(str(user_id), (key, built, valid_until, snapshot))
+        except Exception:
+            logger.exception("Failed to store gamestate snapshot [%s]", user_id)
+
+    def invalidate(self, user_id):
+        """ Forget any snapshot for the given user. """
+        try:
+            self._delete(str(user_id))
+        except Exception:
+            logger.exception("Failed to delete gamestate snapshot [%s]", user_id)
+
+class LRUSnapshotCache(_SnapshotCache):
+    """ Holds up to max_entries snapshots in this process, discarding the least recently used. """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._entries[user_id] = entry
+            return entry
+
+    def _store(self, user_id, entry):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+class SqliteSnapshotCache(_SnapshotCache):
+    """
+    Holds snapshots in a sqlite database file so that every process on the host shares them.
+    The store is trimmed to roughly the max_entries most recently built snapshots.
+    """
+    def __init__(self, path=DEFAULT_SQLITE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshots (user_id TEXT PRIMARY KEY, key TEXT NOT NULL, "
+                         "built INTEGER NOT NULL, valid_until INTEGER NOT NULL, snapshot TEXT NOT NULL)")
+
+    def _conn(self):
+        # sqlite connections can not be shared between threads.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS)
+            conn.text_factory = str
+            self._local.conn = conn
+        return conn
+
+    def _load(self, user_id):
+        row = self._conn().execute("SELECT key, built, valid_until, snapshot FROM snapshots WHERE user_id=?",
+                                   (user_id,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def _store(self, user_id, entry):
+        key, built, valid_until, snapshot = entry
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO snapshots (user_id, key, built, valid_until, snapshot) VALUES (?, ?, ?, ?, ?)",
+                         (user_id, key, built, valid_until, snapshot))
+        self._puts += 1
+        if self._puts % SQLITE_TRIM_INTERVAL == 0:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM snapshots WHERE user_id NOT IN "
+                             "(SELECT user_id FROM snapshots ORDER BY built DESC LIMIT ?)", (self.max_entries,))
+
+    def _delete(self, user_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM snapshots WHERE user_id=?", (user_id,))
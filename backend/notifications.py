@@ -29,8 +29,9 @@ def send_activity_alert_at(ctx, at_time, notify_activity_callback, continue_on_f
     '''
     processed = 0
     with db.conn(ctx) as ctx:
-        rows = db.rows(ctx, 'notifications/select_pending_activity_alerts', now=at_time,
-                       activity_alert_inactive_threshold=Constants.ACTIVITY_ALERT_INACTIVE_THRESHOLD)
+        # Stream the rows as this sweeps every user with notifications enabled.
+        rows = db.iter_rows(ctx, 'notifications/select_pending_activity_alerts', now=at_time,
+                            activity_alert_inactive_threshold=Constants.ACTIVITY_ALERT_INACTIVE_THRESHOLD)
         for row in rows:
             try:
                 # Calculate the moment in time when the max_window_size would first have been exceeded
@@ -63,6 +64,7 @@ def send_activity_alert_at(ctx, at_time, notify_activity_callback, continue_on_f
 
                 # Lookup all unseen activity (messages, targets etc) for this user between activity_alert_window_start
                 # and at_time.
+                user.load_row_cache('notifications')
                 user_activity = activity.recent_activity_for_user(ctx, user, since=activity_alert_window_start, until=at_time)
 
                 # If this user has no activity to notify on, then update their window_start to now and move
@@ -132,7 +134,8 @@ def send_lure_alert_at(ctx, at_time, notify_activity_callback, continue_on_fail=
     '''
     processed = 0
     with db.conn(ctx) as ctx:
-        rows = db.rows(ctx, 'notifications/select_pending_lure_alerts', now=at_time, lure_threshold_seconds=Constants.LURE_ALERT_WINDOW)
+        # Stream the rows as this sweeps every user with notifications enabled.
+        rows = db.iter_rows(ctx, 'notifications/select_pending_lure_alerts', now=at_time, lure_threshold_seconds=Constants.LURE_ALERT_WINDOW)
         for row in rows:
             try:
                 # Load the row data.
@@ -149,6 +152,7 @@ def send_lure_alert_at(ctx, at_time, notify_activity_callback, continue_on_fail=
                     continue
 
                 # Lookup all lure activity (not done missions, unviewed messages, etc) for this user.
+                user.load_row_cache('notifications')
                 user_activity = activity.lure_activity_for_user(ctx, user)
 
                 # If there has been user activity during the lure window (as determined by the UserActivity
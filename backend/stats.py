@@ -337,8 +337,9 @@ def _db_rows_for_daily_chart(ctx, chart_name, days_ago, use_debug_data, **kwargs
     if use_debug_data:
         return get_db_rows_for_query('select_%s_stats' % chart_name)
     else:
+        # The daily charts only iterate over their rows once, so stream them.
         with db.conn(ctx) as ctx:
-            return db.rows(ctx, 'stats/select_%s_stats' % chart_name, start=start, end=end, date_format=DAY_FORMAT, **kwargs)
+            return db.iter_rows(ctx, 'stats/select_%s_stats' % chart_name, start=start, end=end, date_format=DAY_FORMAT, **kwargs)
 
 def _db_rows_for_hourly_chart(ctx, chart_name, hours_ago, use_debug_data):
     # Strip off the current minutes and seconds so that the upper bound is < the start of the current hour.
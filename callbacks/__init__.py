@@ -7,9 +7,15 @@ import inspect
 CALLBACK_PREFIX = "_Callbacks"
 # The base class name which provides default functionality.
 BASE_CALLBACKS_CLASS = "BaseCallbacks"
+# The class field a callback class can define to limit the event subtypes some of its callbacks react to,
+# see interested_subtypes. Maps a callback name to a collection of subtypes, e.g. for a mission which can only
+# be done when a given species is identified: EVENT_SUBTYPES = {'species_identified': ['SPC_ARTIFACT01']}
+EVENT_SUBTYPES_FIELD = "EVENT_SUBTYPES"
 
 # Lazy initialized mapping, see below for documentation.
 CALLBACK_MODULES = None
+# Lazy initialized mapping of module_name to the _DispatchTable for that callback module, see _get_dispatch_table.
+DISPATCH_TABLES = {}
 
 # Constants to use for module_name parameters.
 EMAIL_CB       = "email"
@@ -59,8 +65,7 @@ def run_all_callbacks(module_name, callback_name, ctx, user, *args, **kwargs):
     SEE: run_callback
     """
     return_values = []
-    for callback_class in get_all_callback_classes(module_name):
-        callback_func = getattr(callback_class, callback_name)
+    for callback_func in _get_dispatch_table(module_name).all_callback_funcs(callback_name):
         result = callback_func(ctx, user, *args, **kwargs)
         return_values.append(result)
     return return_values
@@ -91,37 +96,115 @@ def implements_callback(module_name, callback_name, subtype):
     else:
         return callback_class.__dict__.get(callback_name) != None
 
+def interested_subtypes(module_name, callback_name, event_subtype=None):
+    """
+    Returns the frozenset of subtypes in the given module whose callback class might react to callback_name being
+    run for an event with the given event_subtype. The BaseCallbacks function is the default which never reacts
+    to an event, so a subtype is not interested if neither its callback class nor any of its base classes below
+    BaseCallbacks overrides the callback function, or if the class which overrides it limits it to
+    EVENT_SUBTYPES which do not include event_subtype. Used by lib/event.dispatch to only run the callbacks of
+    the missions and achievements which can react to an event.
+    """
+    return _get_dispatch_table(module_name).interested_subtypes(callback_name, event_subtype)
+
+def reset_dispatch_tables():
+    """ Forget the resolved callback classes and functions for every callback module. This must be called
+        if a callback class is added to or removed from a callback module after it was first used,
+        e.g. when the unit tests inject a testing only callback class. """
+    DISPATCH_TABLES.clear()
+
 # These getters are public API but intended for testing and debug tools.
 def get_callback_class(module_name, subtype):
     """ Can return None. If no class implementation exists for the given subtype, the module is
         searched for a BASE_CALLBACKS_CLASS implemention which is used if found. """
-    module = _get_module_from_name(module_name)
-    if subtype is None:
-        return _get_callback_base_class(module)
-    try:
-        return getattr(module, subtype + CALLBACK_PREFIX)
-    # If the callback implementation for this subtype doesn't exist,
-    # attempt to load the BASE_CALLBACKS_CLASS class.
-    except AttributeError:
-        return _get_callback_base_class(module)
+    return _get_dispatch_table(module_name).callback_class(subtype)
 
 def get_all_callback_classes(module_name):
     """ Returns all callback classes defined in the given module, excluding any BaseCallbacks class. """
-    callback_classes = []
-    module = _get_module_from_name(module_name)
-    for name, callback_class in inspect.getmembers(module):
-        if name.endswith(CALLBACK_PREFIX) and inspect.isclass(callback_class):
-            callback_classes.append(callback_class)
-    return callback_classes
+    return list(_get_dispatch_table(module_name).all_classes)
+
+class _DispatchTable(object):
+    """
+    The callback classes defined in a callback module along with every callback function which has been looked
+    up in them, so that finding the function to run for a (subtype, callback_name) is a single dict lookup
+    after the first time. See reset_dispatch_tables.
+    """
+    def __init__(self, module):
+        self.module = module
+        # subtype -> callback class for every callback class in the module, excluding any BaseCallbacks class.
+        self.classes = {}
+        # The same classes in name order.
+        self.all_classes = []
+        for name, callback_class in inspect.getmembers(module):
+            if name.endswith(CALLBACK_PREFIX) and inspect.isclass(callback_class):
+                self.classes[name[:-len(CALLBACK_PREFIX)]] = callback_class
+                self.all_classes.append(callback_class)
+        # (subtype, callback_name) -> callback function.
+        self._funcs = {}
+        # callback_name -> list of the callback function in each of all_classes.
+        self._all_funcs = {}
+        # (callback_name, event_subtype) -> frozenset of interested subtypes or None, see interested_subtypes.
+        self._interested = {}
+
+    def callback_class(self, subtype):
+        if subtype is not None:
+            callback_class = self.classes.get(subtype)
+            if callback_class is not None:
+                return callback_class
+        # If the callback implementation for this subtype doesn't exist,
+        # attempt to load the BASE_CALLBACKS_CLASS class.
+        return _get_callback_base_class(self.module)
+
+    def callback_func(self, subtype, callback_name):
+        try:
+            return self._funcs[(subtype, callback_name)]
+        except KeyError:
+            func = getattr(self.callback_class(subtype), callback_name)
+            self._funcs[(subtype, callback_name)] = func
+            return func
+
+    def all_callback_funcs(self, callback_name):
+        try:
+            return self._all_funcs[callback_name]
+        except KeyError:
+            funcs = [getattr(c, callback_name) for c in self.all_classes]
+            self._all_funcs[callback_name] = funcs
+            return funcs
+
+    def interested_subtypes(self, callback_name, event_subtype):
+        try:
+            return self._interested[(callback_name, event_subtype)]
+        except KeyError:
+            interested = frozenset(subtype for subtype, callback_class in self.classes.iteritems()
+                                   if _is_interested(callback_class, callback_name, event_subtype))
+            self._interested[(callback_name, event_subtype)] = interested
+            return interested
 
 ## Private helper functions.
 def _get_callback_func(module_name, callback_name, subtype=None):
     """ Can return None. """
-    callback_class = get_callback_class(module_name, subtype)
-    if callback_class is None:
-        return None
-    else:
-        return getattr(callback_class, callback_name)
+    return _get_dispatch_table(module_name).callback_func(subtype, callback_name)
+
+def _get_dispatch_table(module_name):
+    try:
+        return DISPATCH_TABLES[module_name]
+    except KeyError:
+        table = _DispatchTable(_get_module_from_name(module_name))
+        DISPATCH_TABLES[module_name] = table
+        return table
+
+def _is_interested(callback_class, callback_name, event_subtype):
+    """ Returns True if the given callback function of the given class might react to an event with the
+        given subtype. See interested_subtypes. """
+    # Any EVENT_SUBTYPES limit is declared by the class which defines the callback function,
+    # so a subclass which overrides the function is not limited by its base class.
+    for defining_class in inspect.getmro(callback_class):
+        if defining_class.__name__ == BASE_CALLBACKS_CLASS:
+            return False
+        if callback_name in defining_class.__dict__:
+            subtypes = defining_class.__dict__.get(EVENT_SUBTYPES_FIELD, {}).get(callback_name)
+            return subtypes is None or event_subtype in subtypes
+    return False
 
 def _get_module_from_name(module_name):
     # Map a shorthand name to the callback module for that callback type.
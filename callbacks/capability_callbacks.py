@@ -10,8 +10,8 @@ class BaseCallbacks(object):
         """
         A callback which returns the current 'unlimited' field value for this capability based on the gamestate
         of the provided user or any other criteria desired.
-        NOTE: The capability object supplied might be in the process of being initialized and its current
-        unlimited or available value should not be used.
+        NOTE: The current unlimited or available value of the capability object supplied is being loaded
+        or refreshed and should not be used.
         The return value is an integer boolean, 1 or 0.
         """
         if capability.is_always_unlimited():
@@ -26,8 +26,8 @@ class BaseCallbacks(object):
         """
         A callback which returns the current 'available' field value for this capability based on the gamestate
         of the provided user or any other criteria desired.
-        NOTE: The capability object supplied might be in the process of being initialized and its current
-        unlimited or available value should not be used.
+        NOTE: The current unlimited or available value of the capability object supplied is being loaded
+        or refreshed and should not be used.
         The return value is an integer boolean, 1 or 0.
         """
         # If the user has any rover with the chassis listed in any available_on_rovers, then capability is available
@@ -44,10 +44,9 @@ class BaseCallbacks(object):
         A callback which is called just before the 'unlimited' field value for this capability is being changed.
         NOTE: This is NOT called during the initialization of a Capability object, only if the value changes later.
         """
-        # Inform the lazy loaded rover collection that some of its values might be changing as a capability's
-        # unlimited value is changing. This forces the lazy loaded collection to be loaded so original
-        # and new values can be compared for sending chips and the like.
-        user.rovers.callback_values_prepare_refresh()
+        # The callback derived rover fields which depend on this capability are refreshed, and chips sent,
+        # along with it, see chips.DependentField.
+        pass
 
     @classmethod
     def unlimited_value_changed(cls, capability, user, old_value, new_value):
@@ -58,9 +57,6 @@ class BaseCallbacks(object):
         """
         # Only equipped to deal a capability becoming unlimited currently.
         assert new_value == 1
-        # Inform the rover collection (and therefore every rover) that the capabilities have changed and that
-        # those objects should update any values they have which depend on capability state and send any chips.
-        user.rovers.callback_values_refresh()
 
     @classmethod
     def available_value_changing(cls, capability, user):
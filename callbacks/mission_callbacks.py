@@ -506,6 +506,7 @@ class MIS_TUT01a_Callbacks(SerialMissionChild):
 
 class MIS_TUT01b_Callbacks(SerialMissionChild):
     """ An identification mission which is done whenever the lander is identified. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_LANDER01']}
     @classmethod
     def create_specifics(cls, ctx, user, rover):
         """ rover is a required parameter when creating this mission type with add_mission. """
@@ -524,6 +525,7 @@ class MIS_TUT01b_Callbacks(SerialMissionChild):
 ## Mission event callback definitions.
 class MIS_ARTIFACT01_Callbacks(BaseCallbacks):
     """ An identification mission which is done whenever the first artifact is identified. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_ARTIFACT01']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_ARTIFACT01_WAYPOINT']
@@ -547,6 +549,7 @@ class MIS_ARTIFACT01_Callbacks(BaseCallbacks):
 
 class MIS_ARTIFACT01_CLOSEUP_Callbacks(BaseCallbacks):
     """ Kryptex asks the player to take another photo of the ARTIFACT01 """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_ARTIFACT01']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         # To prevent the player from cheating by tagging the artifact twice in the same photo,
@@ -662,6 +665,7 @@ class MIS_EXPLORE_ISLAND_Callbacks(BaseCallbacks):
 
 class MIS_FIND_STUCK_ROVER_Callbacks(BaseCallbacks):
     """ An identification mission which is done whenever the first artifact is identified. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_ROVER_DISASSEMBLED']}
     @classmethod
     def create_specifics(cls, ctx, user, target):
         # Record the stuck rover's location.
@@ -885,6 +889,7 @@ class MIS_AUDIO_MYSTERY06b_Callbacks(AudioMissionChildTagSource):
 #================
 class MIS_FIND_EM_SOURCE_Callbacks(BaseCallbacks):
     """ Mission callback for the central monument. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_UNKNOWN_ORIGIN08']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_EM_SOURCE_PINPOINT']
@@ -925,6 +930,7 @@ class MIS_FIND_GPS_UNIT_Callbacks(SerialMissionParent):
     CHILDREN = ['MIS_FIND_GPS_UNITa', 'MIS_FIND_GPS_UNITb']
 
 class MIS_FIND_GPS_UNITa_Callbacks(SerialMissionChild):
+    EVENT_SUBTYPES = {'species_identified': ['SPC_MANMADE005']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         # Mark the first half of the mission done if the player tagged the GPS unit.
@@ -938,6 +944,7 @@ class MIS_FIND_GPS_UNITb_Callbacks(SerialMissionChild):
 
 class MIS_VISIT_RUINS_Callbacks(BaseCallbacks):
     """ Mission callback for the first photo of the ruins. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_UNKNOWN_ORIGIN09']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_RUINS_PINPOINT']
@@ -958,6 +965,7 @@ class MIS_VISIT_RUINS_Callbacks(BaseCallbacks):
 
 class MIS_PHOTOGRAPH_RUINS_Callbacks(BaseCallbacks):
     """ Mission callback for 2 additional photos of the ruins. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_UNKNOWN_ORIGIN09']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         ruins_tagged = (identified.key == "SPC_UNKNOWN_ORIGIN09")
@@ -974,6 +982,7 @@ class MIS_PHOTOGRAPH_RUINS_Callbacks(BaseCallbacks):
 
 class MIS_PHOTOGRAPH_RUINS02_Callbacks(BaseCallbacks):
     """ Mission callback for 1 additional photo of the ruins. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_UNKNOWN_ORIGIN09']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         ruins_tagged = (identified.key == "SPC_UNKNOWN_ORIGIN09")
@@ -988,6 +997,7 @@ class MIS_PHOTOGRAPH_RUINS02_Callbacks(BaseCallbacks):
 
 class MIS_RUINS_SIGNAL_SOURCE_Callbacks(BaseCallbacks):
     """ Mission callback for photographing complete message. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_UNKNOWN_ORIGIN10']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_RUINS_SIGNAL_PINPOINT']
@@ -1028,6 +1038,7 @@ class MIS_1_MORE_OBELISK_Callbacks(BaseCallbacks):
 
 class MIS_CODED_LOC_Callbacks(BaseCallbacks):
     """ Mission callback for photographing the item at the coded location discovered by Kryptex. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_MANMADE006']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_CODED_LOC_PINPOINT']
@@ -1307,6 +1318,7 @@ class MIS_SCI_FIND_COMMON_Callbacks(MissionParent):
 
 class MIS_SCI_FIND_COMMONa_Callbacks(MissionChild):
     """ Find the serpentgrass """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT021']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         if (identified.key == 'SPC_PLANT021'):
@@ -1327,6 +1339,7 @@ class MIS_SCI_FIND_COMMONa_Callbacks(MissionChild):
 
 class MIS_SCI_FIND_COMMONb_Callbacks(MissionChild):
     """ Find the spindlepod """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT024']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         if (identified.key == 'SPC_PLANT024'):
@@ -1354,6 +1367,7 @@ class MIS_SCI_FIND_COMMONc_Callbacks(MissionChild):
 
 class MIS_SCI_CELLULARa_Callbacks(BaseCallbacks):
     """ Find 3 gordy trees. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT032']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         if (identified.key == 'SPC_PLANT032'):
@@ -1367,6 +1381,7 @@ class MIS_SCI_CELLULARa_Callbacks(BaseCallbacks):
 
 class MIS_SCI_LIFECYCLE_Callbacks(BaseCallbacks):
     """ Find all 3 life stages of the gordy tree. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT032']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         if (identified.key == 'SPC_PLANT032'):
@@ -1385,6 +1400,7 @@ class MIS_SCI_LIFECYCLE_Callbacks(BaseCallbacks):
 
 class MIS_SCI_VARIATION_Callbacks(BaseCallbacks):
     """ Find bristletongue variant """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_ANIMAL006']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_SCI_VARIATION_PINPOINT']
@@ -1399,6 +1415,7 @@ class MIS_SCI_VARIATION_Callbacks(BaseCallbacks):
 
 class MIS_SCI_FLOWERS_Callbacks(BaseCallbacks):
     """ Tag open and closed starspore flowers """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT028']}
     @classmethod
     def species_identified(cls, ctx, user, mission, target, identified, subspecies):
         if (identified.key == 'SPC_PLANT028'):
@@ -1430,6 +1447,7 @@ class MIS_SCI_BIOLUMINESCENCE_Callbacks(BaseCallbacks):
 
 class MIS_SCI_FLIGHT_Callbacks(BaseCallbacks):
     """ Photograph flying creatures. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_ANIMAL004']}
     @classmethod
     def region_list_not_done(cls, mission):
         return ['RGN_SCI_FLIGHT01', 'RGN_SCI_FLIGHT02', 'RGN_SCI_FLIGHT03']
@@ -1473,6 +1491,7 @@ class MIS_AUDIO_MYSTERY07a_Callbacks(SerialMissionChild):
 
 class MIS_AUDIO_MYSTERY07b_Callbacks(SerialMissionChild):
     """ Mission callback for tagging a breathing photobiont. """
+    EVENT_SUBTYPES = {'species_identified': ['SPC_PLANT014']}
     @classmethod
     def region_list_when_active(cls, mission):
         # After we've entered the zone, show a bunch of scattered pinpoints.
@@ -1699,10 +1718,10 @@ OBELISK_REGIONS  = ['RGN_AUDIO_MYSTERY01_ESTIMATE', 'RGN_AUDIO_MYSTERY02_ESTIMAT
 
 def get_done_obelisk_mission_count(user):
     # Count the number of completed obelisks missions.
-    done_missions = user.missions.done(root_only=True)
     tagged_obelisks = 0
-    for m in done_missions:
-        if m.mission_definition in OBELISK_MISSIONS:
+    for mission_definition in OBELISK_MISSIONS:
+        m = user.missions.get_only_by_definition(mission_definition)
+        if m is not None and m.is_done() and m.is_root_mission():
             tagged_obelisks += 1
     return tagged_obelisks
 
@@ -21,11 +21,36 @@ def run_deferred_actions(ctx, since):
         # No deferreds run.
         return 0
 
+def run_deferred_actions_claimed(conf, since):
+    """ Run deferred actions as one of several workers, see deferred.run_deferred_claimed. """
+    with db.commit_or_rollback(conf) as ctx:
+        return deferred.run_deferred_claimed(ctx, since, deferred.worker_name())
+
+def run_deferred_workers(conf, since, workers):
+    """ Fork the given number of worker processes to run deferred actions in parallel and wait for them all. """
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                with notify_on_exception():
+                    run_deferred_actions_claimed(conf, since)
+                status = 0
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    optparser = optparse.OptionParser(usage="%prog <deployment>")
+    optparser = optparse.OptionParser(usage="%prog [options] <deployment>")
+    optparser.add_option("-w", "--workers", dest="workers", type="int", default=0,
+                         help="Run deferred actions in this many worker processes which claim users' due actions "
+                              "instead of in this process while holding the global lock.")
     opts, args = optparser.parse_args(argv)
 
     if len(args) == 0:
@@ -37,7 +62,13 @@ def main(argv=None):
         optparser.error("Please specify deployment name, e.g. development or live")
 
     with notify_on_exception():
-        with db.commit_or_rollback(read_config_and_init(deployment)) as ctx:
+        conf = read_config_and_init(deployment)
+    if opts.workers > 0:
+        run_deferred_workers(conf, gametime.now(), opts.workers)
+        return
+
+    with notify_on_exception():
+        with db.commit_or_rollback(conf) as ctx:
             run_deferred_actions(ctx, since=gametime.now())
 
 if __name__ == "__main__":
@@ -12,15 +12,80 @@ from front.lib.exceptions import notify_on_exception
 # Delete chips older than this number of hours ago.
 DELETE_SINCE_HOURS = 1
 
+# When the chips table is partitioned by RANGE on time, each partition holds PARTITION_HOURS of chips
+# and vacuuming drops every partition which only holds chips older than since, which only changes table
+# metadata rather than deleting rows one at a time. This means chips are kept for up to PARTITION_HOURS
+# longer than DELETE_SINCE_HOURS. PARTITION_HOURS must divide 24.
+PARTITION_HOURS = 1
+# Partitions are created this many hours ahead of now so that new chips, including most future chips,
+# are stored in their own partition rather than the catch all FUTURE_PARTITION.
+PARTITIONS_AHEAD_HOURS = 48
+FUTURE_PARTITION = 'p_future'
+
 LOCK_NAME = 'VACUUM_OLD_CHIP'
 def vacuum_chips(ctx, since):
     try:
         with locking.acquire_db_lock_if_unlocked(ctx, LOCK_NAME):
             with db.conn(ctx) as ctx:
-                db.run(ctx, 'chips/delete_chips_since', since=utils.usec_db_from_dt(since))
+                partitions = chip_partitions(ctx)
+                if len(partitions) == 0:
+                    db.run(ctx, 'chips/delete_chips_since', since=utils.usec_db_from_dt(since))
+                else:
+                    drop_chip_partitions(ctx, partitions, since)
+                    add_chip_partitions(ctx, chip_partitions(ctx),
+                                        gametime.now() + timedelta(hours=PARTITIONS_AHEAD_HOURS))
     except (locking.LockAlreadyLocked, locking.LockTimeoutError):
         return
 
+def chip_partitions(ctx, table_name='chips'):
+    """ Returns the list of (name, less_than) partitions of the chips table, oldest first. less_than is
+        None for the FUTURE_PARTITION. Returns an empty list if the table is not partitioned. """
+    partitions = []
+    for row in db.rows(ctx, 'chips/select_chip_partitions', table_name=table_name):
+        less_than = None if row['less_than'] == 'MAXVALUE' else int(row['less_than'])
+        partitions.append((row['name'], less_than))
+    return partitions
+
+def drop_chip_partitions(ctx, partitions, since, table_name='chips'):
+    """ Drop every partition which only holds chips with a time before since. Returns the dropped partition names. """
+    since_micros = utils.usec_db_from_dt(since)
+    expired = [name for name, less_than in partitions if less_than is not None and less_than <= since_micros]
+    if len(expired) > 0:
+        db.run_ddl(ctx, "ALTER TABLE %s DROP PARTITION %s" % (table_name, ", ".join(expired)))
+    return expired
+
+def add_chip_partitions(ctx, partitions, until, table_name='chips'):
+    """ Split new PARTITION_HOURS partitions off of the FUTURE_PARTITION until there is one covering until.
+        Returns the added partition names.
+        Reorganizing the FUTURE_PARTITION copies every row in it. Usually it only holds the few future chips
+        beyond PARTITIONS_AHEAD_HOURS, but the first time this runs after the chips table was partitioned it holds
+        every existing chip, so that one run copies the whole table, see the partition_chips migration. """
+    ranged = [less_than for name, less_than in partitions if less_than is not None]
+    if len(ranged) > 0:
+        boundary = utils.usec_dt_from_db(max(ranged))
+    else:
+        # The first partition also holds every chip older than now.
+        boundary = _partition_start(gametime.now())
+    added = []
+    while boundary <= until:
+        boundary += timedelta(hours=PARTITION_HOURS)
+        added.append(boundary)
+    if len(added) == 0:
+        return []
+
+    definitions = ["PARTITION %s VALUES LESS THAN (%d)" % (_partition_name(b), utils.usec_db_from_dt(b)) for b in added]
+    definitions.append("PARTITION %s VALUES LESS THAN MAXVALUE" % FUTURE_PARTITION)
+    db.run_ddl(ctx, "ALTER TABLE %s REORGANIZE PARTITION %s INTO (%s)" % (
+        table_name, FUTURE_PARTITION, ", ".join(definitions)))
+    return [_partition_name(b) for b in added]
+
+def _partition_start(dt):
+    return dt.replace(hour=dt.hour - dt.hour % PARTITION_HOURS, minute=0, second=0, microsecond=0)
+
+def _partition_name(less_than):
+    # Partitions are named for the first hour they hold chips for, e.g. p2014082113
+    return "p" + (less_than - timedelta(hours=PARTITION_HOURS)).strftime("%Y%m%d%H")
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
@@ -361,6 +361,7 @@ GAMESTATE = {
             "server_time": {"type":"number", "format":"timestamp"},
             "last_seen_chip_time": {"type":"string"}, # e.g. "1352765719142900"
             "chip_fetch_interval": {"type":"number", "format":"int_positive"},
+            "chip_long_poll_wait": {"type":"number"},
             "use_social_networks": {"type":"boolean"}
         }},
         "urls": {"type": "object", "additionalProperties":False, "properties": {
@@ -211,7 +211,7 @@ def get_all_user_ids(ctx):
     return db._run_query_string(ctx, "SELECT user_id FROM users")
 
 # These are tables that have data tied directly to a user_id
-DELETE_USER_ID_TABLES = ['chips', 'deferred', 'messages', 'missions', 'rovers', 'target_sounds', 'target_image_rects',
+DELETE_USER_ID_TABLES = ['chips', 'chip_watermarks', 'deferred', 'messages', 'missions', 'rovers', 'target_sounds', 'target_image_rects',
                          'target_images', 'target_metadata', 'targets', 'species', 'user_map_tiles',
                          'users_notification', 'users_progress', 'achievements', 'users_metadata', 'capabilities',
                          'vouchers', 'users_shop', 'invoices', 'transactions', 'purchased_products']
@@ -396,6 +396,8 @@ def advance_game_for_user_by_seconds(ctx, u, seconds):
     db._run_query_string(ctx, "UPDATE chips SET time=time - :micros\
                                WHERE user_id=:user_id AND time > :end",
                                user_id=u.user_id, micros=micros, end=utils.usec_db_from_dt(end_time))
+    # The chip times have changed underneath the watermark.
+    chips.reset_watermark(ctx, u.user_id)
 
     return (deferred_rows, activated_chips)
 
@@ -425,7 +427,7 @@ def run_deferred_and_advance_now_until(ctx, u, until):
 
             # If no exception ocurred for this deferred, delete it from the database and
             # commit the transaction.
-            deferred_row.delete(ctx)
+            deferred_row.delete(ctx, u)
             processed.append(deferred_row)
     # Set the gametime to be the end of the window deferreds were run to.
     gametime.set_now(until)
@@ -444,7 +446,7 @@ def flush_deferred_until(ctx, u, until):
         processed = []
         for row in rows:
             deferred_row = deferred.DeferredRow(**row)
-            deferred_row.delete(ctx)
+            deferred_row.delete(ctx, u)
             processed.append(deferred_row)
     return processed
 
@@ -1,6 +1,6 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
-import os, collections
+import os, sys, collections, threading, time
 from front.lib.db import named_query
 
 import logging
@@ -16,9 +16,32 @@ CHARSET = "utf8"
 # this means TRADITIONAL and possibly innodb_strict_mode if supported.
 SQL_STRICT_MODE = False
 # After how many seconds should the named queries be refreshed from disk.
-# Should be short internal in development, long in production.
+# Should be short internal in development, long in production. A negative value
+# (named_query.NEVER_REFRESH) never checks the disk once a query has been loaded.
 STAT_INTERVAL_SECONDS = None
 
+# Connection pool defaults. Each value can be overridden per database configuration (per shard)
+# with the matching database.pool_* key in the .ini file, e.g. database.pool_max_size = 20
+# The number of connections to open as soon as the pool for a shard is first used.
+POOL_MIN_SIZE = 0
+# The maximum number of connections, idle and checked out, held per shard. Set to 0 to disable
+# pooling, in which case every connection is opened on checkout and closed on release.
+POOL_MAX_SIZE = 10
+# The number of seconds to wait for a connection to be returned to an exhausted pool before
+# raising a PoolTimeoutError.
+POOL_WAIT_SECONDS = 5
+# Idle connections which have not been used for this many seconds are pinged on checkout
+# to verify the server has not closed them.
+POOL_STALE_SECONDS = 30
+# If waiting for a pooled connection takes longer than this many seconds, log a warning.
+POOL_WAIT_WARNING_SECONDS = 0.5
+
+# The default number of rows fetched from the server at a time by iter_rows.
+ITER_ROWS_BATCH_SIZE = 500
+
+# The MySQL error codes for a lock wait timeout (ER_LOCK_WAIT_TIMEOUT) and a deadlock (ER_LOCK_DEADLOCK).
+LOCK_ERROR_CODES = frozenset([1205, 1213])
+
 def init_module(sql_strict_mode, stat_interval_seconds):
     global SQL_STRICT_MODE, STAT_INTERVAL_SECONDS
     SQL_STRICT_MODE = sql_strict_mode
@@ -46,11 +69,19 @@ class TooManyRowsError(DatabaseError):
         details = "Exactly one row expected from query, got %d. query=[%s]" % (count, query_name)
         super(DatabaseError, self).__init__(details)
 
+class PoolTimeoutError(DatabaseError):
+    """ Raised when no pooled connection became available before the pool wait time expired. """
+    def __init__(self, pool_name, wait_seconds):
+        details = "No pooled connection available after %.2f seconds. pool=[%s]" % (wait_seconds, pool_name)
+        super(DatabaseError, self).__init__(details)
+
 class DatabaseMiddleware(object):
     """
     A WSGI middlware compatible object which wraps the WSGI application in a context manager
     which commits and closes any open database connections after the response has been generated,
     or if there are any exceptions, rollsback and closes the connections.
+    The transaction is committed before a response body is written out, so a streamed body (any iterable
+    other than a list or tuple) must not use the database while it is being produced.
     """
     def __init__(self, app, config=None):
         self.app = app
@@ -128,17 +159,32 @@ class commit_or_rollback(object):
     def __exit__(self, exception_type, value, tb):
         # If there was no exception, commit the transaction.
         if exception_type is None:
-            self.wrapped_ctx.commit_connections()
+            try:
+                self.wrapped_ctx.commit_connections()
+            except:
+                # If flushing the write buffers or the commit itself failed, rollback and release
+                # the connections before raising so that none are left checked out of their pool.
+                exc_info = sys.exc_info()
+                try:
+                    try:
+                        self.wrapped_ctx.rollback_connections()
+                    finally:
+                        self.wrapped_ctx.close_connections()
+                except:
+                    logger.exception("Exception occurred during rollback after failed commit.")
+                raise exc_info[0], exc_info[1], exc_info[2]
             self.wrapped_ctx.close_connections()
         # Otherwise, if type is not None there was an exception, rollback the transaction.
         elif exception_type is not None:
             try:
-                self.wrapped_ctx.rollback_connections()
-                self.wrapped_ctx.close_connections()
+                # The connections are always released, even if the rollback fails (perhaps the DB
+                # connection has died), so that none are left checked out of their pool.
+                try:
+                    self.wrapped_ctx.rollback_connections()
+                finally:
+                    self.wrapped_ctx.close_connections()
             except:
-                # Run the rollback/close inside of a try/catch. If the rollback or close
-                # fail (perhaps the DB connection has died) then log that inner exception but
-                # raise the original exception so that the stack trace is clear.
+                # Log the inner exception but raise the original exception so that the stack trace is clear.
                 logger.exception("Exception occurred during rollback. Raising original exception.")
                 raise exception_type, value, tb
 
@@ -147,6 +193,8 @@ def run(ctx, query_name, **args):
     exception is raised. Intended to be used for INSERT, DELETE and similar queries.
     Will raise an assertion error if used for a query where results could be returned."""
     result = _run_query_by_name(ctx, query_name, **args)
+    # Any rows held in the row cache might no longer match the database.
+    _CtxWrapper.wrap(ctx).row_cache.clear()
     if not isinstance(result, tuple) or len(result) != 0:
         raise UnexpectedResultError(query_name)
     return result
@@ -172,17 +220,85 @@ def row(ctx, query_name, **args):
         raise TooManyRowsError(query_name, row_count)
     return result[0]
 
+def multi_rows(ctx, queries):
+    """
+    Run several named queries in a single round trip to the database server and return a list with
+    the result rows (a list of dicts, as from rows) of each query, in the same order.
+    queries is a list of (query_name, args) tuples, args being a dict of named query parameters.
+    Intended for loading many independent SELECTs at once, see _RowCache.set_rows_from_queries.
+    Use as::
+        with db.conn(ctx) as ctx:
+            users, rovers = db.multi_rows(ctx, [("get_user_row", {'user_id': user_id}),
+                                                ("select_rovers_by_user_id", {'user_id': user_id})])
+    """
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    assert wrapped_ctx.current_conn != None
+    if len(queries) == 0:
+        return []
+    wrapped_ctx.query_count += 1
+    return named_query.run_batch(wrapped_ctx.current_conn,
+                                 [(_named_query(query_name), args) for query_name, args in queries])
+
+def iter_rows(ctx, query_name, batch_size=ITER_ROWS_BATCH_SIZE, **args):
+    """
+    Execute a named query and return an iterator over the result rows which are streamed from the
+    server batch_size rows at a time, rather than the whole result set being loaded into memory.
+    Intended for queries which might return a very large number of rows, e.g. sweeps over every user.
+    The rows are lightweight read only named_query.Row objects which support row['column_name'] access.
+    Use as::
+        with db.conn(ctx) as ctx:
+            for row in db.iter_rows(ctx, "query_name...", since=since):
+                db.run(ctx, "other_query_name...", user_id=row['user_id'])
+                db.commit(ctx)
+
+    The query is run on a dedicated streaming connection which reads from its own transaction snapshot,
+    so the current connection remains free to run other queries, commit and rollback while iterating.
+    The query is executed when iter_rows is called. The streaming connection is released when the iterator
+    is exhausted or closed, or at the latest when the wrapping commit_or_rollback context manager exits.
+    """
+    import MySQLdb.cursors
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    assert wrapped_ctx.current_conn != None
+
+    dbconf = wrapped_ctx.dbconf
+    pool = _get_pool(dbconf)
+    if pool is not None:
+        conn = pool.checkout()
+    else:
+        conn = _connect(dbconf, dbname=_dbname(dbconf))
+    stream = (pool, conn)
+    wrapped_ctx.streaming_connections.append(stream)
+    wrapped_ctx.query_count += 1
+    try:
+        rows = _named_query(query_name).run_iter(conn.cursor(MySQLdb.cursors.SSCursor), args, batch_size)
+    except:
+        wrapped_ctx.release_streaming_connection(stream, exhausted=False)
+        raise
+    return _iter_and_release(wrapped_ctx, stream, rows)
+
+def _iter_and_release(wrapped_ctx, stream, rows):
+    exhausted = False
+    try:
+        for row in rows:
+            yield row
+        exhausted = True
+    finally:
+        wrapped_ctx.release_streaming_connection(stream, exhausted=exhausted, rows=rows)
+
 _g_named_queries = None
-def _run_query_by_name(ctx, query_name, **args):
-    """ Runs a named query with the specified arguments, returns a list of dicts, one for each row."""
+def _named_query(query_name):
     global _g_named_queries
     if _g_named_queries is None:
         query_dir = os.path.join(os.path.dirname(__file__), "queries")
         _g_named_queries = named_query.NamedQueryManager(os.path.abspath(os.path.realpath(query_dir)), stat_interval_seconds=STAT_INTERVAL_SECONDS)
+    return _g_named_queries.get(query_name)
 
+def _run_query_by_name(ctx, query_name, **args):
+    """ Runs a named query with the specified arguments, returns a list of dicts, one for each row."""
     wrapped_ctx = _CtxWrapper.wrap(ctx)
     assert wrapped_ctx.current_conn != None
-    res = _g_named_queries.get(query_name).run(wrapped_ctx.current_conn, args)
+    wrapped_ctx.query_count += 1
+    res = _named_query(query_name).run(wrapped_ctx.current_conn, args)
     return res
 
 def _run_query_string(ctx, query_string, **args):
@@ -193,6 +309,10 @@ def _run_query_string(ctx, query_string, **args):
     query = _construct_adhoc_query(ctx, query_string, **args)
     wrapped_ctx = _CtxWrapper.wrap(ctx)
     assert wrapped_ctx.current_conn != None
+    # Ad-hoc queries might read or modify buffered data (e.g. chips), so apply any pending writes first.
+    wrapped_ctx.flush_write_buffers()
+    wrapped_ctx.row_cache.clear()
+    wrapped_ctx.query_count += 1
     res = query.run(wrapped_ctx.current_conn, args)
     return res
 
@@ -254,6 +374,64 @@ def rollback(ctx):
     wrapped_ctx = _CtxWrapper.wrap(ctx)
     wrapped_ctx.rollback_connections()
 
+def is_lock_error(e):
+    """
+    Returns True if the given exception was raised by a query because a row lock could not be acquired,
+    the lock wait timed out or a deadlock was detected. The transaction should be rolled back, after which
+    it can be retried.
+    """
+    import MySQLdb
+    return isinstance(e, MySQLdb.OperationalError) and len(e.args) > 0 and e.args[0] in LOCK_ERROR_CODES
+
+def write_buffer(ctx, name, factory):
+    """
+    Return the write buffer registered under name for the given database context, calling factory()
+    to create and register it if this is the first use in this context.
+    A write buffer is used to collect many small writes during a request (or transaction) and apply them
+    in as few statements as possible at commit time. It must implement four methods:
+        has_pending()  Returns True if there are writes waiting to be flushed.
+        flush(ctx)     Apply the pending writes using the supplied, connected, ctx.
+        committed()    Called after the transaction the writes were flushed in has been committed.
+        discard()      Forget the pending writes, called when the transaction is rolled back.
+    Every registered buffer is flushed before commit() (and commit_or_rollback) commits, and by flush().
+    """
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    buf = wrapped_ctx.write_buffers.get(name)
+    if buf is None:
+        buf = wrapped_ctx.write_buffers[name] = factory()
+    return buf
+
+def flush(ctx):
+    """
+    Flush every write buffer in the given database context without committing. Code which reads data
+    that might still be held in a write buffer should call this first.
+    """
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    wrapped_ctx.flush_write_buffers()
+
+def run_ddl(ctx, statement):
+    """
+    Execute a schema changing statement, e.g. an ALTER TABLE, on the current connection. Identifiers
+    cannot be bound as query parameters so the statement is run as is and must never contain data
+    supplied by a user.
+    NOTE: MySQL implicitly commits the current transaction before and after any DDL statement.
+    """
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    assert wrapped_ctx.current_conn != None
+    wrapped_ctx.flush_write_buffers()
+    wrapped_ctx.query_count += 1
+    cursor = wrapped_ctx.current_conn.cursor()
+    try:
+        cursor.execute(statement)
+    finally:
+        cursor.close()
+
+def query_count(ctx):
+    """ Returns the number of round trips to the database made with the given database context, intended for
+        testing and benchmarks. A multi_rows call counts once however many queries it runs. """
+    wrapped_ctx = _CtxWrapper.wrap(ctx)
+    return wrapped_ctx.query_count
+
 def close_all_connections(ctx):
     """
     Close all open connections in the given database context.
@@ -298,12 +476,40 @@ def connect(ctx, timeout=None):
 
         dbconf = wrapped_ctx.dbconf
         # TODO JLP: Actually use shardname variable here to select hostname.
-        conn = _connect(dbconf, dbname=_dbname(dbconf), connection_timeout=timeout)
+        # A connection with a custom timeout is opened directly and closed on release as the timeout
+        # can only be applied when the connection is first opened.
+        pool = _get_pool(dbconf) if timeout is None else None
+        if pool is not None:
+            conn = pool.checkout()
+        else:
+            conn = _connect(dbconf, dbname=_dbname(dbconf), connection_timeout=timeout)
 
         openconns[shardname] = conn
+        wrapped_ctx.connection_pools[shardname] = pool
         wrapped_ctx.seen_shards.add(shardname)
         return conn
 
+def pool_stats():
+    """
+    Returns a list of dicts, one per connection pool opened by this process, describing the current
+    size of the pool and the number of checkouts, pings and time spent waiting for a connection.
+    Intended for monitoring and debugging tools.
+    """
+    with _g_pools_lock:
+        pools = [p for (pid, _key), p in _g_pools.iteritems() if pid == os.getpid()]
+    return [p.stats() for p in pools]
+
+def close_pools():
+    """
+    Close every idle pooled connection held by this process and forget the pools. Checked out
+    connections are closed when they are released. Intended for tools and unit testing.
+    """
+    with _g_pools_lock:
+        pools = _g_pools.values()
+        _g_pools.clear()
+    for p in pools:
+        p.close()
+
 ## Utility functions for direct database access. Intended for unit testing.
 def create_database(config, apply_schema=False):
     dbname = _dbname(config)
@@ -336,6 +542,8 @@ def create_database(config, apply_schema=False):
 def destroy_database(config):
     """ Only use for unit testing. """
     dbname = _dbname(config)
+    # Any pooled connections to the database being dropped are no longer usable.
+    _discard_pool(config)
     conn = _connect(config)
     curs = conn.cursor()
     curs.execute("DROP DATABASE IF EXISTS %s" % dbname)
@@ -399,6 +607,14 @@ class _RowCache(object):
         self._seen_queries = set()
         self._cache = collections.defaultdict(list)
 
+    def clear(self):
+        """
+        Forget every cached row. Called whenever the database might have been modified (db.run) and at the end
+        of every transaction, so the cache never returns rows which differ from what the database would.
+        """
+        self._seen_queries.clear()
+        self._cache.clear()
+
     def get_rows_from_query(self, query_name, *key_parts):
         """
         Returns any database rows (as a list of dicts) that were cached for the given named query.
@@ -421,13 +637,29 @@ class _RowCache(object):
         this could return the database id field which would be appended to the query_name.
         **args are passed to the db.rows function as named query parameters.
         """
-        if query_name in self._seen_queries:
-            logger.warn("Row caching query data that was already cached [%s]", query_name)
-        self._seen_queries.add(query_name)
         with conn(ctx) as ctx:
-            for r in rows(ctx, query_name, **args):
-                key = self._make_key(query_name, *key_func(r))
-                self._cache[key].append(r)
+            self._set_rows(query_name, key_func, rows(ctx, query_name, **args))
+
+    def set_rows_from_queries(self, ctx, loads):
+        """
+        The same as set_rows_from_query but for any number of named queries, all of which are run in a single
+        round trip to the database with db.multi_rows.
+        loads is a list of (cache_name, key_func, query_name, args) tuples. The rows returned by query_name are
+        cached under cache_name, which is the query_name to pass to get_rows_from_query. Using a cache_name other
+        than the query_name allows caching the rows for a query for a specific set of args, e.g. one user.
+        """
+        with conn(ctx) as ctx:
+            results = multi_rows(ctx, [(query_name, args) for cache_name, key_func, query_name, args in loads])
+        for (cache_name, key_func, query_name, args), result in zip(loads, results):
+            self._set_rows(cache_name, key_func, result)
+
+    def _set_rows(self, cache_name, key_func, rows):
+        if cache_name in self._seen_queries:
+            logger.warn("Row caching query data that was already cached [%s]", cache_name)
+        self._seen_queries.add(cache_name)
+        for r in rows:
+            key = self._make_key(cache_name, *key_func(r))
+            self._cache[key].append(r)
 
     def _make_key(self, *key_parts):
         return "__".join((str(p) for p in key_parts))
@@ -443,7 +675,8 @@ class _CtxWrapper(object):
     # the wrapped context object. They are stored in the wrapped context with a _ prefix.
     # Note that these specific values need to persist beyond the lifetime of this _CtxWrapper
     # instance, so those values are pushed into the context that gets passed into the constructor.
-    PROPERTIES = ['shard_key', 'current_conn', 'open_connections', 'seen_shards', 'row_cache']
+    PROPERTIES = ['shard_key', 'current_conn', 'open_connections', 'connection_pools', 'streaming_connections',
+                  'seen_shards', 'row_cache', 'write_buffers', 'query_count']
 
     def __init__(self, ctx):
         # Determine where on the ctx object values can be stored into a dict. If the ctx
@@ -458,6 +691,17 @@ class _CtxWrapper(object):
         # Initialize the open connections list if it is not in the wrapped context.
         if not '_open_connections' in self._storage:
             self._storage['_open_connections'] = {}
+        # Maps shardname to the pool the open connection was checked out from (or None).
+        if not '_connection_pools' in self._storage:
+            self._storage['_connection_pools'] = {}
+        # A list of (pool, connection) tuples for connections in use by iter_rows.
+        if not '_streaming_connections' in self._storage:
+            self._storage['_streaming_connections'] = []
+        # Maps a name to a write buffer object, see write_buffer. Flushed in registration order.
+        if not '_write_buffers' in self._storage:
+            self._storage['_write_buffers'] = collections.OrderedDict()
+        if not '_query_count' in self._storage:
+            self._storage['_query_count'] = 0
         if not '_seen_shards' in self._storage:
             self._storage['_seen_shards'] = set()
         # Initialize a row cache for this context if it does not already exist.
@@ -483,18 +727,91 @@ class _CtxWrapper(object):
         if old_current_conn:
             self.current_conn = old_current_conn
 
+    def flush_write_buffers(self):
+        for buf in self.write_buffers.itervalues():
+            if buf.has_pending():
+                with conn(self) as ctx:
+                    buf.flush(ctx)
+
     def commit_connections(self):
+        self.flush_write_buffers()
         for connection in self.open_connections.itervalues():
             connection.commit()
+        for buf in self.write_buffers.itervalues():
+            buf.committed()
+        self.row_cache.clear()
 
     def rollback_connections(self):
-        for connection in self.open_connections.itervalues():
-            connection.rollback()
+        """ Rollback every open connection. A connection whose rollback fails, e.g. because the server has gone
+            away, is closed and discarded instead of being returned to its pool later. The first rollback
+            exception is raised once every connection has been rolled back or discarded. """
+        for buf in self.write_buffers.itervalues():
+            buf.discard()
+        self.row_cache.clear()
+        exc_info = None
+        for shardname, connection in self.open_connections.items():
+            try:
+                connection.rollback()
+            except:
+                if exc_info is None:
+                    exc_info = sys.exc_info()
+                self._discard_connection(shardname, connection)
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _discard_connection(self, shardname, connection):
+        """ Close an open connection without returning it to the pool it was checked out from. """
+        pool = self.connection_pools.pop(shardname, None)
+        del self._storage['_open_connections'][shardname]
+        if pool is not None:
+            pool.discard(connection)
+        else:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def release_streaming_connection(self, stream, exhausted, rows=None):
+        """ Release a connection used by iter_rows. A connection with unread rows pending
+            is closed rather than returned to its pool as the rows would need to be read first. """
+        if stream not in self.streaming_connections:
+            return
+        self.streaming_connections.remove(stream)
+        pool, connection = stream
+        if not exhausted:
+            if pool is not None:
+                pool.discard(connection)
+            else:
+                connection.close()
+            if rows is not None:
+                try:
+                    rows.close()
+                except Exception:
+                    pass
+        elif pool is not None:
+            pool.checkin(connection)
+        else:
+            connection.close()
 
     def close_connections(self):
+        """ Close every open connection, or return it to the pool it was checked out from. """
+        for stream in list(self.streaming_connections):
+            self.release_streaming_connection(stream, exhausted=False)
+        exc_info = None
         for shardname, connection in self.open_connections.items():
-            connection.close()
+            pool = self.connection_pools.pop(shardname, None)
             del self._storage['_open_connections'][shardname]
+            # Keep releasing the remaining connections if closing one fails.
+            try:
+                if pool is not None:
+                    pool.checkin(connection)
+                else:
+                    connection.close()
+            except:
+                if exc_info is None:
+                    exc_info = sys.exc_info()
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
 
     # Override attribute set and get access and pass through our wrapped attributes
     # to the underlying wrapped objects storage.
@@ -518,6 +835,182 @@ class _CtxWrapper(object):
         else:
             return self._storage
 
+class _ConnectionPool(object):
+    """
+    A thread safe pool of open connections to a single database (shard). Connections are checked out
+    by connect() and returned by _CtxWrapper.close_connections, which is called by commit_or_rollback
+    after the transaction has been committed or rolled back.
+    On checkout, a connection which has been idle for longer than stale_seconds is pinged and replaced
+    if the server has gone away. On checkin, the connection is rolled back and its session state
+    (timezone and sql_mode) reset, so that no transaction or session change can leak between requests.
+    """
+    def __init__(self, name, config, dbname, min_size, max_size, wait_seconds, stale_seconds):
+        self.name = name
+        # Only hold onto the database settings, config might also be the storage of a ctx.
+        self._config = dict((k, v) for k, v in config.iteritems() if k.startswith('database.'))
+        self._dbname = dbname
+        self.min_size = min_size
+        self.max_size = max_size
+        self.wait_seconds = wait_seconds
+        self.stale_seconds = stale_seconds
+        # Idle connections as (connection, last_used) tuples, most recently used last.
+        self._idle = []
+        # The number of connections open, both idle and checked out.
+        self._size = 0
+        self._cond = threading.Condition()
+        self._metrics = collections.Counter()
+        self._max_wait = 0.0
+        self._closed = False
+
+        for i in range(self.min_size):
+            self._idle.append((self._open(), time.time()))
+            self._size += 1
+
+    def checkout(self):
+        """ Return an open connection, waiting up to wait_seconds if the pool is exhausted. """
+        started = time.time()
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = self.wait_seconds - (time.time() - started)
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(self.name, self.wait_seconds)
+                self._cond.wait(remaining)
+            self._record_wait(time.time() - started)
+            self._metrics['checkouts'] += 1
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                # Reserve a slot for the new connection while the lock is held.
+                conn, last_used = None, None
+                self._size += 1
+
+        if conn is None:
+            try:
+                return self._open()
+            except:
+                self._release_slot()
+                raise
+
+        if time.time() - last_used > self.stale_seconds:
+            self._count('pings')
+            try:
+                conn.ping()
+            except Exception, e:
+                logger.warning("Discarding stale pooled connection [%s][%s]", self.name, e)
+                self._count('ping_failures')
+                self._close_quietly(conn)
+                try:
+                    return self._open()
+                except:
+                    self._release_slot()
+                    raise
+        return conn
+
+    def checkin(self, conn):
+        """ Return a connection to the pool. The connection is discarded if it cannot be reset. """
+        try:
+            conn.rollback()
+            _init_session(conn.cursor())
+        except Exception, e:
+            logger.warning("Discarding pooled connection which failed to reset [%s][%s]", self.name, e)
+            self._count('reset_failures')
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append((conn, time.time()))
+                self._cond.notify()
+                return
+        # The pool was closed while this connection was checked out.
+        self._close_quietly(conn)
+        self._release_slot()
+
+    def discard(self, conn):
+        """ Close a checked out connection instead of returning it to the pool. """
+        self._close_quietly(conn)
+        self._release_slot()
+
+    def close(self):
+        """ Close every idle connection. Connections currently checked out are closed when checked in. """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, last_used in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({'name': self.name, 'size': self._size, 'idle': len(self._idle),
+                          'checked_out': self._size - len(self._idle), 'max_size': self.max_size,
+                          'max_wait_seconds': self._max_wait})
+        return stats
+
+    def _open(self):
+        conn = _connect(self._config, dbname=self._dbname)
+        self._count('opened')
+        return conn
+
+    def _count(self, metric):
+        with self._cond:
+            self._metrics[metric] += 1
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _record_wait(self, waited):
+        # Called with the lock held.
+        self._metrics['wait_microseconds'] += int(waited * 1000000)
+        self._max_wait = max(self._max_wait, waited)
+        if waited > POOL_WAIT_WARNING_SECONDS:
+            logger.warning("Waited %.3f seconds for pooled connection [%s][size=%d]", waited, self.name, self._size)
+
+    def _close_quietly(self, conn):
+        self._count('discarded')
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+# Maps (pid, pool key) to the _ConnectionPool for that database. The pid is part of the key so that
+# a forked process never shares the sockets of its parent's pooled connections.
+_g_pools = {}
+_g_pools_lock = threading.Lock()
+def _get_pool(config):
+    """ Return the connection pool for the given database configuration, or None if pooling is disabled. """
+    max_size = int(config.get('database.pool_max_size', POOL_MAX_SIZE))
+    if max_size <= 0:
+        return None
+    dbname = _dbname(config)
+    key = _pool_key(config)
+    pool = _g_pools.get(key)
+    if pool is None:
+        with _g_pools_lock:
+            pool = _g_pools.get(key)
+            if pool is None:
+                name = "%s/%s" % (config.get('database.host'), dbname)
+                pool = _ConnectionPool(name, config, dbname,
+                    min_size=int(config.get('database.pool_min_size', POOL_MIN_SIZE)),
+                    max_size=max_size,
+                    wait_seconds=float(config.get('database.pool_wait_seconds', POOL_WAIT_SECONDS)),
+                    stale_seconds=float(config.get('database.pool_stale_seconds', POOL_STALE_SECONDS)))
+                _g_pools[key] = pool
+    return pool
+
+def _discard_pool(config):
+    with _g_pools_lock:
+        pool = _g_pools.pop(_pool_key(config), None)
+    if pool is not None:
+        pool.close()
+
+def _pool_key(config):
+    return (os.getpid(), (config.get('database.host'), config.get('database.username'), _dbname(config)))
+
 def _connect(config, dbname="", connection_timeout=None):
     # mysql-connector-python version:
     # from mysql import connector
@@ -547,6 +1040,14 @@ def _connect(config, dbname="", connection_timeout=None):
         _enable_strict_mode(conn.cursor())
     return conn
 
+def _init_session(cursor):
+    """ Restore the session state _connect sets up, for a connection being returned to a pool. """
+    if SQL_STRICT_MODE:
+        cursor.execute("SET SESSION time_zone='" + UTC_TIMEZONE + "', sql_mode='TRADITIONAL'")
+    else:
+        cursor.execute("SET SESSION time_zone='" + UTC_TIMEZONE + "', sql_mode=@@GLOBAL.sql_mode")
+    cursor.close()
+
 def _enable_strict_mode(cursor):
     # NOTE: This only works on mysql 5.5+. Enable when all developer machines are 5.5+.
     # cursor.execute('SET SESSION innodb_strict_mode=ON')
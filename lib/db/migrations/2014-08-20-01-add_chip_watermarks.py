@@ -0,0 +1,15 @@
+forward = """
+CREATE TABLE chip_watermarks (
+  user_id binary(16) NOT NULL,
+  visible_time bigint(20) unsigned NOT NULL,
+  next_future_time bigint(20) unsigned DEFAULT NULL,
+  version int(10) unsigned NOT NULL DEFAULT '0',
+  PRIMARY KEY (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+INSERT INTO chip_watermarks (user_id, visible_time, next_future_time)
+  SELECT user_id, MAX(time), 0 FROM chips GROUP BY user_id;
+"""
+reverse = """
+DROP TABLE chip_watermarks;
+"""
+step(forward, reverse)
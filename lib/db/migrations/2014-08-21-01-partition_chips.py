@@ -0,0 +1,15 @@
+# Partition the chips table by RANGE on time so that old chips can be vacuumed by dropping partitions.
+# Every unique key must include the partitioning column, so time is added to the primary key.
+# The table starts with a single catch all partition, cron/vacuum_old_chips.py splits hourly partitions off of it.
+# NOTE: Both this migration and the first run of vacuum_old_chips.py afterwards copy every row in the chips table,
+# the latter as it reorganizes p_future which holds every existing chip. Run vacuum_old_chips.py just before
+# migrating, while it still deletes old chips, so that only the last DELETE_SINCE_HOURS of chips are copied.
+forward = """
+ALTER TABLE chips DROP PRIMARY KEY, ADD PRIMARY KEY (seq, `time`);
+ALTER TABLE chips PARTITION BY RANGE (`time`) (PARTITION p_future VALUES LESS THAN MAXVALUE);
+"""
+reverse = """
+ALTER TABLE chips REMOVE PARTITIONING;
+ALTER TABLE chips DROP PRIMARY KEY, ADD PRIMARY KEY (seq);
+"""
+step(forward, reverse)
@@ -0,0 +1,10 @@
+# Deferred rows are claimed by the worker running them, see deferred.run_deferred_claimed.
+# locked_by identifies the worker and locked_at is when it claimed the row, a claim older than
+# deferred.LOCK_TIMEOUT has been abandoned and the rows are claimed again.
+forward = """
+ALTER TABLE deferred ADD COLUMN locked_by char(64) NULL DEFAULT NULL, ADD COLUMN locked_at datetime NULL DEFAULT NULL, ADD KEY run_at (run_at);
+"""
+reverse = """
+ALTER TABLE deferred DROP KEY run_at, DROP COLUMN locked_at, DROP COLUMN locked_by;
+"""
+step(forward, reverse)
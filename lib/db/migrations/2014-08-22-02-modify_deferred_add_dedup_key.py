@@ -0,0 +1,19 @@
+# A deferred row queued with a dedup mode (see deferred.run_later) stores deferred_type:subtype in dedup_key,
+# which is unique per user, so that queueing it again is a single INSERT ... ON DUPLICATE KEY UPDATE.
+# TARGET_ARRIVED and MISSION_DONE_AFTER deferreds were already only queued once per user and subtype and are
+# now queued with a dedup mode, so the existing rows are given their dedup_key.
+# Any duplicates of those rows are deleted first, keeping the one which runs earliest, since MySQL cannot roll back
+# the ALTER TABLE which adds the column if adding the unique key were to fail afterwards.
+forward = """
+DELETE d1 FROM deferred d1 JOIN deferred d2
+    ON d1.user_id=d2.user_id AND d1.deferred_type=d2.deferred_type AND d1.subtype=d2.subtype
+    AND (d1.run_at > d2.run_at OR (d1.run_at = d2.run_at AND d1.deferred_id > d2.deferred_id))
+    WHERE d1.deferred_type IN ('TARGET_ARRIVED', 'MISSION_DONE_AFTER');
+ALTER TABLE deferred ADD COLUMN dedup_key char(65) NULL DEFAULT NULL;
+UPDATE deferred SET dedup_key=CONCAT(deferred_type, ':', subtype) WHERE deferred_type IN ('TARGET_ARRIVED', 'MISSION_DONE_AFTER');
+ALTER TABLE deferred ADD UNIQUE KEY user_id_dedup_key (user_id, dedup_key);
+"""
+reverse = """
+ALTER TABLE deferred DROP KEY user_id_dedup_key, DROP COLUMN dedup_key;
+"""
+step(forward, reverse)
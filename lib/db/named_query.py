@@ -33,6 +33,7 @@ API for running named queries.
 https://wiki.lindenlab.com/wiki/Named_Queries
 """
 
+import binascii
 import json
 import errno
 import os
@@ -51,6 +52,19 @@ DEBUG_QUERIES = ()
 
 NAMED_QUERY_SUFFIX = ".nq"
 
+# A stat_interval_seconds of less than zero disables refreshing named queries from disk entirely,
+# meaning a query is parsed and compiled once for the life of the process (production mode).
+NEVER_REFRESH = -1
+
+# Compiled once, these are used when converting the named query format to pyformat.
+_LITERAL_PERCENT_EXPR = re.compile("(?<=[^a-zA-Z0-9_-])%(?=[^:])")
+_LIKE_EXPR = re.compile("(%?):([a-zA-Z][a-zA-Z0-9_-]*)%")
+_INTEGER_EXPR = re.compile("#:([a-zA-Z][a-zA-Z0-9_-]*)")
+_NAME_EXPR = re.compile(":([a-zA-Z][a-zA-Z0-9_-]*)")
+# Used when compiling a query plan, to find the @:name array slots and the pyformat placeholders.
+_ARRAY_EXPR = re.compile("@%\(([a-zA-Z][a-zA-Z0-9_-]*)\)s")
+_PLACEHOLDER_EXPR = re.compile("%\(([a-zA-Z_][a-zA-Z0-9_-]*)\)s")
+
 def init_module(sql_debug_queries):
     global DEBUG
     DEBUG = sql_debug_queries
@@ -114,6 +128,56 @@ def run(connection, name, params, expect_rows = None):
     """
     return get(name).run(connection, params, expect_rows)
 
+def run_batch(connection, queries):
+    """
+    Given a connection, run several named queries in a single round trip to the server, as one
+    multi-statement query, and return their result sets in the same order.
+
+    :param connection: The connection to use. MySQLdb enables CLIENT.MULTI_STATEMENTS by default.
+    :param queries: A list of (NamedQuery, params) tuples.
+    :returns: Returns a list with the result set of each query as a list of dicts.
+
+    The parameters are escaped with the connection's ``literal`` method, exactly as
+    MySQLdb does itself when a query is executed with a dict of parameters.
+    """
+    statements = []
+    for query, params in queries:
+        full_query, params = query._construct_sql(params)
+        # The escaped parameters are encoded strings, so the query must be as well.
+        if isinstance(full_query, unicode):
+            full_query = full_query.encode(connection.character_set_name())
+        statements.append(full_query % dict((k, connection.literal(v)) for k, v in params.iteritems()))
+    if DEBUG:
+        names = [query.name() for query, params in queries]
+        if len(DEBUG_QUERIES) == 0 or set(names).intersection(DEBUG_QUERIES):
+            logger.debug(u'Query batch %s SQL: %s', names, ';\n'.join(statements))
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(';\n'.join(statements))
+        result_sets = []
+        while True:
+            result_set = []
+            if cursor.description:
+                names = [x[0] for x in cursor.description]
+                for row in cursor.fetchall():
+                    result_set.append(dict(zip(names, row)))
+            result_sets.append(result_set)
+            if not cursor.nextset():
+                break
+    finally:
+        # If a statement failed, read past any remaining result sets so the connection can
+        # still be rolled back. Any error doing so is secondary to the one being raised.
+        try:
+            while cursor.nextset():
+                pass
+        except Exception:
+            pass
+        cursor.close()
+    if len(result_sets) != len(queries):
+        raise ExpectationFailed("Query batch expected %d result sets, got %d." % (len(queries), len(result_sets)))
+    return result_sets
+
 class ExpectationFailed(Exception):
     """
     Exception that is raised when an expectation for the results of an
@@ -202,6 +266,8 @@ class NamedQuery(object):
         self._around = set()
         self._append = set()
         self._integer = set()
+        # Compiled query plans, keyed by the dynamic_where options selected by the params.
+        self._plans = {}
         self._options = self._contents.get('dynamic_where', {})
         for key in self._options:
             if isinstance(self._options[key], basestring):
@@ -219,6 +285,8 @@ class NamedQuery(object):
         self._base_query = self._convert_sql(self._contents['base'])
         self._query_suffix = self._convert_sql(
             self._contents.get('query_suffix', ''))
+        # Iterate the options in a fixed order so that plan keys are stable.
+        self._option_items = self._options.items()
 
     def _convert_sql(self, sql):
         """
@@ -235,17 +303,13 @@ class NamedQuery(object):
             # are meant to be literally passed through to mysql in the
             # query.  It leaves any %'s that are used for
             # like-expressions.
-            expr = re.compile("(?<=[^a-zA-Z0-9_-])%(?=[^:])")
-            sql = expr.sub('%%', sql)
+            sql = _LITERAL_PERCENT_EXPR.sub('%%', sql)
 
             # This should tackle the rest of the %'s in the query, by
             # converting them to LIKE clauses.
-            expr = re.compile("(%?):([a-zA-Z][a-zA-Z0-9_-]*)%")
-            sql = expr.sub(self._prepare_like, sql)
-            expr = re.compile("#:([a-zA-Z][a-zA-Z0-9_-]*)")
-            sql = expr.sub(self._prepare_integer, sql)
-            expr = re.compile(":([a-zA-Z][a-zA-Z0-9_-]*)")
-            sql = expr.sub("%(\\1)s", sql)
+            sql = _LIKE_EXPR.sub(self._prepare_like, sql)
+            sql = _INTEGER_EXPR.sub(self._prepare_integer, sql)
+            sql = _NAME_EXPR.sub("%(\\1)s", sql)
         return sql
 
     def _prepare_like(self, match):
@@ -457,45 +521,70 @@ class NamedQuery(object):
             return result_set[0]
         return result_set
 
+    def run_iter(self, cursor, params, batch_size):
+        """
+        Given a cursor, run a named query with the params and return a generator which yields
+        the result set as lightweight :class:`Row` objects, fetching batch_size rows at a time.
+        The query is executed before this method returns. The cursor is closed when the
+        generator is exhausted or closed.
+
+        Intended to be used with a server side (unbuffered) cursor so that the full result
+        set is never held in memory.
+        """
+        full_query, params = self._construct_sql(params)
+        if DEBUG:
+            if len(DEBUG_QUERIES) == 0 or self.name() in DEBUG_QUERIES:
+                logger.debug(u'Query [%s] SQL (iter): %s', self.name(), full_query)
+        try:
+            cursor.execute(full_query, params)
+        except:
+            cursor.close()
+            raise
+        return self._iter_cursor(cursor, batch_size)
+
+    def _iter_cursor(self, cursor, batch_size):
+        try:
+            if not cursor.description:
+                return
+            row_class = _row_class([x[0] for x in cursor.description])
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row_class(row)
+        finally:
+            cursor.close()
+
     def _construct_sql(self, params):
         """ Returns a query string and a dictionary of parameters,
         suitable for directly passing to the execute() method."""
         self.refresh()
 
-        # build the query from the options available and the params
-        base_query = []
-        base_query.append(self._base_query)
-        #print >>sys.stderr, "base_query:",base_query
-        for opt, extra_where in self._options.items():
-            if type(extra_where) in (dict, list, tuple):
-                if opt in params:
-                    base_query.append(extra_where[params[opt]])
-            else:
-                if opt in params and params[opt]:
-                    base_query.append(extra_where)
-        if self._query_suffix:
-            base_query.append(self._query_suffix)
-        #print >>sys.stderr, "base_query:",base_query
-        full_query = '\n'.join(base_query)
+        # The query text and the work needed to bind parameters to it only depend on
+        # which dynamic_where options are selected, so that work is done once per
+        # combination of options and cached as a _QueryPlan.
+        plan_key = self._plan_key(params)
+        plan = self._plans.get(plan_key)
+        if plan is None:
+            plan = self._plans[plan_key] = self._compile_plan(params)
 
         # Go through the query and rewrite all of the ones with the
         # @:name syntax.
-        rewrite = _RewriteQueryForArray(params)
-        expr = re.compile("@%\(([a-zA-Z][a-zA-Z0-9_-]*)\)s")
-        full_query = expr.sub(rewrite.operate, full_query)
-        params.update(rewrite.new_params)
+        if plan.has_arrays:
+            rewrite = _RewriteQueryForArray(params)
+            full_query = plan.expand_arrays(rewrite)
+            params.update(rewrite.new_params)
+            bound_keys = plan.keys + rewrite.new_params.keys()
+        else:
+            full_query = plan.query
+            bound_keys = plan.keys
 
-        # build out the params for like. We only have to do this
-        # parameters which were detected to have ued the where syntax
-        # during load.
-        #
-        # * treat the incoming string as utf-8
-        # * strip wildcards
-        # * append or prepend % as appropriate
-        new_params = {}
-        for key in params:
+        # Only the parameters which are referenced by the query need to be encoded.
+        for key in bound_keys:
+            value = params.get(key)
             # Fix for DEV-44731. Text below courtesy of Zero
-            if isinstance(params[key], unicode):
+            if isinstance(value, unicode):
                 # Since many LL tables have UTF-8 data stored in columns in 
                 # marked Latin1 - and the connections are thus also Latin1, 
                 # we must be sure to never pass a unicode object to the 
@@ -507,24 +596,60 @@ class NamedQuery(object):
                 # 'early'. 
                 # BE WARNED: Other column encodings or connection encodings will
                 # not work with this code.
-                params[key] = params[key].encode('utf8')
-            if isinstance(params[key], uuid.UUID):
-                params[key] = params[key].bytes
-            if key in self._around:
+                params[key] = value.encode('utf8')
+            elif isinstance(value, uuid.UUID):
+                # Equivalent to value.bytes, which is computed a byte at a time.
+                params[key] = binascii.unhexlify(value.hex)
+
+        # build out the params for like. We only have to do this
+        # parameters which were detected to have ued the where syntax
+        # during load.
+        #
+        # * treat the incoming string as utf-8
+        # * strip wildcards
+        # * append or prepend % as appropriate
+        for key in plan.around:
+            if key in params:
                 new_value = ['%']
                 new_value.extend(self._strip_wildcards_to_list(params[key]))
                 new_value.append('%')
-                new_params[self._build_around_key(key)] = ''.join(new_value)
-            if key in self._append:
+                params[self._build_around_key(key)] = ''.join(new_value)
+        for key in plan.append:
+            if key in params:
                 new_value = self._strip_wildcards_to_list(params[key])
                 new_value.append('%')
-                new_params[self._build_append_key(key)] = ''.join(new_value)
-            if key in self._integer:
-                new_params[self._build_integer_key(key)] = int(params[key])
-        params.update(new_params)
+                params[self._build_append_key(key)] = ''.join(new_value)
+        for key in plan.integer:
+            if key in params:
+                params[self._build_integer_key(key)] = int(params[key])
 
         return full_query, params
 
+    def _plan_key(self, params):
+        """ Returns a hashable key describing which dynamic_where options the params select. """
+        key = []
+        for opt, extra_where in self._option_items:
+            if type(extra_where) in (dict, list, tuple):
+                key.append(params[opt] if opt in params else None)
+            else:
+                key.append(bool(opt in params and params[opt]))
+        return tuple(key)
+
+    def _compile_plan(self, params):
+        # build the query from the options available and the params
+        base_query = []
+        base_query.append(self._base_query)
+        for opt, extra_where in self._option_items:
+            if type(extra_where) in (dict, list, tuple):
+                if opt in params:
+                    base_query.append(extra_where[params[opt]])
+            else:
+                if opt in params and params[opt]:
+                    base_query.append(extra_where)
+        if self._query_suffix:
+            base_query.append(self._query_suffix)
+        return _QueryPlan('\n'.join(base_query), self._around, self._append, self._integer)
+
     def sql(self, connection, params, _debugging=False):
         """
         Generates an SQL statement from the named query document
@@ -556,6 +681,8 @@ class NamedQuery(object):
         refresh will call self.delete to make the in-memory
         representation unusable.
         """
+        if _never_refresh(self._stat_interval_seconds):
+            return
         now = time.time()
         if(now - self._last_check_time > self._stat_interval_seconds):
             self._last_check_time = now
@@ -600,13 +727,16 @@ class NamedQueryManager(object):
         objects returned by this method are shared across all users of
         the manager object. :meth:`lldb.named_query.NamedQuery.refresh()`
         is used to bring the :class:`lldb.named_query.NamedQuery` objects
-        in sync with the actual files on disk.
+        in sync with the actual files on disk, unless the manager was created
+        with a stat_interval_seconds of NEVER_REFRESH.
         """
         nq = self._cached_queries.get(name)
         if nq is None:
             nq = NamedQuery(name, os.path.join(self._dir, name + NAMED_QUERY_SUFFIX))
             nq._stat_interval_seconds = self._stat_interval_seconds
             self._cached_queries[name] = nq
+        elif _never_refresh(self._stat_interval_seconds):
+            pass
         else:
             try:
                 nq.refresh()
@@ -617,6 +747,82 @@ class NamedQueryManager(object):
 
         return nq
 
+class Row(tuple):
+    """
+    A lightweight, read only result row returned by :meth:`NamedQuery.run_iter`.
+    Column values are accessed by name like a dict, e.g. row['user_id'], and the row
+    can be expanded as keyword arguments. Unlike a dict, iterating a row yields its values.
+    Subclasses holding the column index for a given result set are created by _row_class.
+    """
+    __slots__ = ()
+    _columns = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        if index is None:
+            return default
+        return tuple.__getitem__(self, index)
+
+    def keys(self):
+        return list(self._columns)
+
+    def has_key(self, key):
+        return key in self._index
+
+    def as_dict(self):
+        return dict(zip(self._columns, self))
+
+    def __repr__(self):
+        return "Row(%r)" % self.as_dict()
+
+# Maps a tuple of column names to the Row subclass for that result set shape.
+_g_row_classes = {}
+def _row_class(columns):
+    columns = tuple(columns)
+    row_class = _g_row_classes.get(columns)
+    if row_class is None:
+        index = dict((name, i) for i, name in enumerate(columns))
+        row_class = type('Row', (Row,), {'__slots__': (), '_columns': columns, '_index': index})
+        _g_row_classes[columns] = row_class
+    return row_class
+
+def _never_refresh(stat_interval_seconds):
+    return stat_interval_seconds is not None and stat_interval_seconds < 0
+
+class _QueryPlan(object):
+    """
+    The compiled form of a named query for one combination of dynamic_where options.
+    Holds the full pyformat query text, the names of the parameters it references and
+    the query split around any @:name array slots, so that binding parameters at execution
+    time requires no parsing or regular expressions.
+    """
+    def __init__(self, query, around, append, integer):
+        self.query = query
+        # Split into alternating literal text and array slot names: [text, name, text, ...]
+        self.segments = _ARRAY_EXPR.split(query)
+        self.has_arrays = len(self.segments) > 1
+        array_keys = set(self.segments[1::2])
+        # The parameters which are bound directly by name. Array slots are bound through the
+        # new parameters created when they are expanded.
+        self.keys = [k for k in set(_PLACEHOLDER_EXPR.findall(query)) if k not in array_keys]
+        # Array slots holding a single value are bound directly.
+        self.keys.extend(array_keys)
+        self.around = tuple(around)
+        self.append = tuple(append)
+        self.integer = tuple(integer)
+
+    def expand_arrays(self, rewrite):
+        segments = list(self.segments)
+        for i in xrange(1, len(segments), 2):
+            segments[i] = rewrite.expand(segments[i])
+        return ''.join(segments)
+
 class _RewriteQueryForArray(object):
     "Helper class for rewriting queries with the @:name syntax"
     def __init__(self, params):
@@ -625,7 +831,10 @@ class _RewriteQueryForArray(object):
 
     def operate(self, match):
         "Given a match, return the string that should be in use"
-        key = match.group(1)
+        return self.expand(match.group(1))
+
+    def expand(self, key):
+        "Given the name of an @:name parameter, return the string that should be in use"
         value = self.params[key]
         if type(value) in (list,tuple):
             if len(value) == 0:
@@ -690,4 +899,4 @@ class _RewriteQueryForArray(object):
             #
             # where foo in (@:foobar) -- foobar is a string, so we get
             # where foo in (:foobar)
-            return match.group(0)[1:]
+            return "%%(%s)s" % key
@@ -52,6 +52,18 @@ CREATE TABLE capabilities (
   PRIMARY KEY (user_id,capability_key)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
+--
+-- Table structure for table `chip_watermarks`
+--
+DROP TABLE IF EXISTS chip_watermarks;
+CREATE TABLE chip_watermarks (
+  user_id binary(16) NOT NULL,
+  visible_time bigint(20) unsigned NOT NULL,
+  next_future_time bigint(20) unsigned DEFAULT NULL,
+  version int(10) unsigned NOT NULL DEFAULT '0',
+  PRIMARY KEY (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 --
 -- Table structure for table `chips`
 --
@@ -62,9 +74,11 @@ CREATE TABLE chips (
   content blob NOT NULL,
   seq bigint(20) NOT NULL AUTO_INCREMENT,
   `time` bigint(20) unsigned NOT NULL,
-  PRIMARY KEY (seq),
+  PRIMARY KEY (seq,`time`),
   KEY user_id_time (user_id,`time`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+) ENGINE=InnoDB DEFAULT CHARSET=utf8
+/*!50100 PARTITION BY RANGE (`time`)
+(PARTITION p_future VALUES LESS THAN MAXVALUE ENGINE = InnoDB) */;
 
 --
 -- Table structure for table `deferred`
@@ -78,8 +92,13 @@ CREATE TABLE deferred (
   run_at datetime NOT NULL,
   created timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   payload varchar(1024) DEFAULT NULL,
+  locked_by char(64) DEFAULT NULL,
+  locked_at datetime DEFAULT NULL,
+  dedup_key char(65) DEFAULT NULL,
   PRIMARY KEY (deferred_id),
-  KEY user_id_deferred_type (user_id,deferred_type,subtype)
+  UNIQUE KEY user_id_dedup_key (user_id,dedup_key),
+  KEY user_id_deferred_type (user_id,deferred_type,subtype),
+  KEY run_at (run_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
 --
@@ -557,7 +576,7 @@ CREATE TABLE vouchers (
 
 LOCK TABLES _yoyo_migration WRITE;
 /*!40000 ALTER TABLE _yoyo_migration DISABLE KEYS */;
-INSERT INTO _yoyo_migration VALUES ('2013-09-27-01-baseline',NOW()),('2013-10-07-01-modify_target_tables_add_user_id',NOW()),('2013-10-15-01-modify_targets_add_user_created',NOW()),('2013-10-15-02-modify_targets_add_neutered',NOW()),('2013-10-23-01-fix_user_map_tiles_expiry_time',NOW()),('2013-10-29-01-modify_gifts_invitations_add_campaign_name',NOW()),('2013-10-31-01-modify_rovers_add_rover_key_and_activated_at',NOW()),('2013-11-19-01-add_progress_key_enable_nw_region',NOW()),('2013-11-20-01-deferred_target_arrived_to_target_id_subtype',NOW()),('2013-11-21-01-modify_targets_add_render_at',NOW()),('2013-12-13-01-modify_playback_mission',NOW()),('2014-01-06-01-add_invitations',NOW()),('2014-01-15-01-modify_users_notification_add_lure',NOW()),('2014-01-15-02-modify_users_notification_rename_frequencies',NOW()),('2014-01-28-01-add_progress_key_tagged_one_obelisk',NOW()),('2014-02-14-01-add_email_queue',NOW()),('2014-06-04-01-add_users_facebook',NOW()),('2014-06-11-01-modify_users_allow_null_email',NOW()),('2014-06-19-01-add_users_edmodo',NOW()),('2014-06-25-01-modify_users_edmodo_add_user_type',NOW()),('2014-08-06-01-modify_users_edmodo_add_access_token_and_sandbox',NOW()),('2014-08-08-01-add_edmodo_groups',NOW());
+INSERT INTO _yoyo_migration VALUES ('2013-09-27-01-baseline',NOW()),('2013-10-07-01-modify_target_tables_add_user_id',NOW()),('2013-10-15-01-modify_targets_add_user_created',NOW()),('2013-10-15-02-modify_targets_add_neutered',NOW()),('2013-10-23-01-fix_user_map_tiles_expiry_time',NOW()),('2013-10-29-01-modify_gifts_invitations_add_campaign_name',NOW()),('2013-10-31-01-modify_rovers_add_rover_key_and_activated_at',NOW()),('2013-11-19-01-add_progress_key_enable_nw_region',NOW()),('2013-11-20-01-deferred_target_arrived_to_target_id_subtype',NOW()),('2013-11-21-01-modify_targets_add_render_at',NOW()),('2013-12-13-01-modify_playback_mission',NOW()),('2014-01-06-01-add_invitations',NOW()),('2014-01-15-01-modify_users_notification_add_lure',NOW()),('2014-01-15-02-modify_users_notification_rename_frequencies',NOW()),('2014-01-28-01-add_progress_key_tagged_one_obelisk',NOW()),('2014-02-14-01-add_email_queue',NOW()),('2014-06-04-01-add_users_facebook',NOW()),('2014-06-11-01-modify_users_allow_null_email',NOW()),('2014-06-19-01-add_users_edmodo',NOW()),('2014-06-25-01-modify_users_edmodo_add_user_type',NOW()),('2014-08-06-01-modify_users_edmodo_add_access_token_and_sandbox',NOW()),('2014-08-08-01-add_edmodo_groups',NOW()),('2014-08-20-01-add_chip_watermarks',NOW()),('2014-08-21-01-partition_chips',NOW()),('2014-08-22-01-modify_deferred_add_locked_by',NOW()),('2014-08-22-02-modify_deferred_add_dedup_key',NOW());
 /*!40000 ALTER TABLE _yoyo_migration ENABLE KEYS */;
 UNLOCK TABLES;
 
@@ -1,6 +1,12 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
-from front.callbacks import run_callback, run_all_callbacks, MISSION_CB, TARGET_CB, SPECIES_CB, ACHIEVEMENT_CB
+from front.callbacks import run_callback, run_all_callbacks, interested_subtypes, MISSION_CB, TARGET_CB, SPECIES_CB, ACHIEVEMENT_CB
+from front.models import chips
+
+# If True, the callbacks of every mission and achievement which dispatch skips because its callback class has no
+# interest in the event are run as well, and an exception is raised if any of them returned a result, changed the
+# done or achieved state or sent a chip. This is meant to be enabled when running the unit tests.
+VERIFY = False
 
 # event_type definitions.  This is the mapping between event types and the
 # callback function names in the corresponding *_callbacks.py files.
@@ -31,15 +37,25 @@ def dispatch(ctx, user, event_type, subtype, *args, **kwargs):
     assert event_type in types.ALL, "Unknown event_type %s" % event_type
 
     if event_type in MISSION_EVENTS:
-        # Need to use keys() or values() as a mission trigger may add a new mission to user.missions which would
+        # Only the missions whose callbacks might react to this event are run, see callbacks.interested_subtypes.
+        missions = user.missions.not_done_with_definitions(interested_subtypes(MISSION_CB, event_type, subtype))
+        if VERIFY:
+            skipped = set(user.missions.not_done()).difference(missions)
+        # A list is used as a mission trigger may add a new mission to user.missions which would
         # mutate the dict which is not allowed in an iteration.
-        for m in user.missions.not_done():
+        for m in missions:
             # It is possible that a mission will be marked done by another mission during the iteration so check again.
             if not m.done:
                 result = run_callback(MISSION_CB, event_type, m.mission_definition, ctx, user, m, *args, **kwargs)
                 # These callbacks can just return (None) in order to handle mark_done themselves.
                 if result is True:
                     m.mark_done()
+        if VERIFY:
+            for m in skipped:
+                if not m.done:
+                    _verify_skipped(ctx, m, m.mission_definition, event_type, subtype,
+                        lambda: run_callback(MISSION_CB, event_type, m.mission_definition, ctx, user, m, *args, **kwargs),
+                        lambda: m.done)
 
     if event_type in TARGET_EVENTS:
         # All defined callbacks in target_callbacks are run for any target creation or arrival.
@@ -49,10 +65,29 @@ def dispatch(ctx, user, event_type, subtype, *args, **kwargs):
         run_callback(SPECIES_CB, event_type, subtype, ctx, user, *args, **kwargs)
 
     if event_type in ACHIEVEMENT_EVENTS:
-        for a in user.achievements.not_achieved():
+        # Only the achievements whose callbacks might react to this event are run.
+        achievements = user.achievements.not_achieved_with_keys(interested_subtypes(ACHIEVEMENT_CB, event_type, subtype))
+        if VERIFY:
+            skipped = set(user.achievements.not_achieved()).difference(achievements)
+        for a in achievements:
             # It is possible that an achievement will be marked achieved by another achievement callback during
             # the iteration so check again.
             if not a.was_achieved():
                 result = run_callback(ACHIEVEMENT_CB, event_type, a.achievement_key, ctx, user, a, *args, **kwargs)
                 if result:
                     a.mark_achieved()
+        if VERIFY:
+            for a in skipped:
+                if not a.was_achieved():
+                    _verify_skipped(ctx, a, a.achievement_key, event_type, subtype,
+                        lambda: run_callback(ACHIEVEMENT_CB, event_type, a.achievement_key, ctx, user, a, *args, **kwargs),
+                        a.was_achieved)
+
+def _verify_skipped(ctx, model, key, event_type, subtype, run, is_done):
+    """ Run the callback for a mission or achievement which dispatch skipped and raise an exception
+        if running it would have changed the outcome of the event. See VERIFY. """
+    sent_before = chips.sent_count(ctx)
+    result = run()
+    if result or is_done() or chips.sent_count(ctx) != sent_before:
+        raise Exception("Event callback was skipped but is interested in the event [%s][%s][%s] result=%s" % (
+            key, event_type, subtype, result))
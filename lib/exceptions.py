@@ -70,6 +70,8 @@ class NotifyExceptionMiddleware(object):
     """
     A WSGI middlware compatible object which wraps the WSGI application in a context manager
     which emails an exception report to an email address configured in this module if that address has been set.
+    A streamed response body (any iterable other than a list or tuple) is also wrapped, so that exceptions
+    raised while the body is being produced are reported as well.
     """
     def __init__(self, app, config=None):
         self.app = app
@@ -77,7 +79,23 @@ class NotifyExceptionMiddleware(object):
 
     def __call__(self, environ, start_response):
         with notify_on_exception(context=environ, parse_context=parse_environ):
-            return self.app(environ, start_response)
+            app_iter = self.app(environ, start_response)
+        if isinstance(app_iter, (list, tuple)):
+            return app_iter
+        return self._iter_notify_on_exception(app_iter, environ)
+
+    def _iter_notify_on_exception(self, app_iter, environ):
+        try:
+            with notify_on_exception(context=environ, parse_context=parse_environ):
+                for chunk in app_iter:
+                    try:
+                        yield chunk
+                    except GeneratorExit:
+                        # The WSGI server stopped writing the body, e.g. the client went away, which is not an error.
+                        break
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
 
 def parse_environ(e):
     parsed = {
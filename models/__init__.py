@@ -7,6 +7,9 @@ from front.lib import utils
 class UserChild(object):
     """ A mixin for children of the gamestate UserModel to provide access to the database
         context and user object in preditable ways. """
+    # Mixins of Models must not add a __dict__ to their instances, see chips.FieldedClass.
+    __slots__ = ()
+
     @property
     def user(self):
         """ Return the UserModel at the root of the gamestate. Child Models which are
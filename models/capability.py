@@ -24,18 +24,16 @@ class Capability(chips.Model, models.UserChild):
     # all the client will rely on/be able to see.
     server_only_fields = frozenset(['available_on_rovers', 'always_unlimited'])
 
-    def __init__(self, capability_key, user, uses):
+    # The values of unlimited and available are determined by the callbacks and, as they read the user's vouchers
+    # and rovers, refreshed and a chip sent if those change. See chips.DependentField.
+    unlimited = chips.DependentField("unlimited", lambda m: m._unlimited_current_value(),
+                                     changed=lambda m, old, new: m._value_changed('unlimited', old, new))
+    available = chips.DependentField("available", lambda m: m._available_current_value(),
+                                     changed=lambda m, old, new: m._value_changed('available', old, new))
+
+    def __init__(self, capability_key, uses):
         definition = get_capability_definition(capability_key)
-        # The initial values of unlimited and available are determined by the callbacks.
-        # Use None as sentinels to indicate that the values will be set after super is called.
-        super(Capability, self).__init__(capability_key=capability_key, uses=uses,
-                                         unlimited=None, available=None, **definition)
-
-        # Set the values of unlimited and available now that super has been called so that we can use
-        # the capability object in the callbacks themselves (albeit with bogus unlimited and available values
-        # which will be set by the callback return values).
-        self.set_silent(unlimited = self._unlimited_current_value(user))
-        self.set_silent(available = self._available_current_value(user))
+        super(Capability, self).__init__(capability_key=capability_key, uses=uses, **definition)
 
     @property
     def user(self):
@@ -87,36 +85,21 @@ class Capability(chips.Model, models.UserChild):
             self.uses = new_uses # Make our state mirror the database's
             self.send_chips(ctx, self.user)
 
-    def available_and_unlimited_refresh(self):
-        """
-        Compare the stored available and unlimited field values in this instance to the values returned
-        from the callbacks. If the values in the callbacks are different, update the instance values
-        and issue a chip. This method must be called whenever a gamestate change occurs which might
-        affect the available or unlimited values of a capability, e.g. number of rovers changed or new purchase.
-        """
-        current_unlimited = self._unlimited_current_value(self.user)
-        current_available = self._available_current_value(self.user)
-        if current_unlimited != self.unlimited or current_available != self.available:
-            if current_unlimited != self.unlimited:
-                run_callback(CAPABILITY_CB, "unlimited_value_changing", self.capability_key, capability=self, user=self.user)
-                old_value = self.unlimited
-                self.unlimited = current_unlimited
-                run_callback(CAPABILITY_CB, "unlimited_value_changed", self.capability_key,
-                             capability=self, user=self.user, old_value=old_value, new_value=current_unlimited)
-            if current_available != self.available:
-                run_callback(CAPABILITY_CB, "available_value_changing", self.capability_key, capability=self, user=self.user)
-                old_value = self.available
-                self.available = current_available
-                run_callback(CAPABILITY_CB, "available_value_changed", self.capability_key,
-                             capability=self, user=self.user, old_value=old_value, new_value=current_available)
-            with db.conn(self.ctx) as ctx:
-                self.send_chips(ctx, self.user)
-
-    def _unlimited_current_value(self, user):
-        return run_callback(CAPABILITY_CB, "unlimited_current_value", self.capability_key, capability=self, user=user)
-
-    def _available_current_value(self, user):
-        return run_callback(CAPABILITY_CB, "available_current_value", self.capability_key, capability=self, user=user)
+    def _value_changed(self, field, old_value, new_value):
+        """ Called when the unlimited or available field has been refreshed with a different value,
+            runs the callbacks for that field. """
+        # The callbacks for a value which is changing see the old value.
+        getattr(Capability, field)._set_silent(self, old_value)
+        run_callback(CAPABILITY_CB, field + "_value_changing", self.capability_key, capability=self, user=self.user)
+        setattr(self, field, new_value)
+        run_callback(CAPABILITY_CB, field + "_value_changed", self.capability_key,
+                     capability=self, user=self.user, old_value=old_value, new_value=new_value)
+
+    def _unlimited_current_value(self):
+        return run_callback(CAPABILITY_CB, "unlimited_current_value", self.capability_key, capability=self, user=self.user)
+
+    def _available_current_value(self):
+        return run_callback(CAPABILITY_CB, "available_current_value", self.capability_key, capability=self, user=self.user)
 
 def all_rover_features():
     """ Return the unique set of all rover feature metadata keys listed in the
@@ -8,7 +8,7 @@ server. They represent deltas to a well-defined tree of data.
  * user_id -- id of the user who should see this chip
  * transient -- IGNORE FOR NOW
  * time -- server time when the chip should become available to the user
- * content -- which is a JSON string
+ * content -- which is a JSON string, or the compact encoding of the same data (see _encode_chip_content)
  ** action: "m" = modify, "a" = add, "d" = delete
  ** path: a list that specifies a traversal through the tree of the user's data e.g. ["user", "missions", "TUT1a-0946a6b1eff950b3f8b83a68808d7917"] 
  ** value: the value of the thingy at that tree node, e.g. {'mission_id':12345, 'done':true, ....} 
@@ -38,12 +38,43 @@ server. They represent deltas to a well-defined tree of data.
  methods or properties, if I've done my job right.
  """
 
+import json, threading, time, types, zlib
+
 from front.lib import db, xjson, gametime, utils
 
 MOD = 'm'
 ADD = 'a'
 DELETE = 'd'
 
+# If True, chips sent during a request are collected in a per database context buffer and inserted
+# with a single multi-row INSERT when the transaction is committed. If False, every chip is inserted
+# as soon as it is sent.
+BUFFER_CHIPS = True
+# The maximum number of chips inserted by a single statement when the buffer is flushed.
+CHIP_FLUSH_BATCH_SIZE = 250
+
+# If True, chip content is stored in the compact encoding (see _encode_chip_content) instead of as a JSON
+# object. Both formats are always decoded, so this can be changed at any time.
+ENCODE_CHIPS = True
+# Encoded chip content longer than this is also zlib compressed, if that makes it any smaller.
+COMPRESS_CHIP_MIN_BYTES = 256
+
+# The longest a long polling fetch chips request may wait for new chips.
+LONG_POLL_MAX_WAIT_SECONDS = 30
+# While long polling, how often the database is checked for new chips, regardless of any in-process
+# notification. This catches chips sent by other processes and future chips which have become due.
+LONG_POLL_RECHECK_SECONDS = 2
+
+# When more than this many chips are waiting for a client they are compacted (see compact_chips) before
+# being sent. Smaller batches are sent as is so that client listeners see every individual change.
+COMPACT_CHIPS_THRESHOLD = 50
+# If more than this many chips are still waiting after compaction the client is told to reload the
+# gamestate instead of applying them.
+REFETCH_GAMESTATE_THRESHOLD = 2000
+
+# iter_json joins the JSON it encodes into chunks of at least this many bytes, except for the last chunk.
+JSON_CHUNK_BYTES = 16 * 1024
+
 class ChipsError(Exception):
     """ Generic base Exception for chips related errors. """
 
@@ -58,10 +89,205 @@ def update_response(ctx, user, response, last_seen_chip_time):
      (should be in the request)
     """
     unseen_chips = get_chips(ctx, user, last_seen_chip_time, gametime.now(), True)
+    if len(unseen_chips) > COMPACT_CHIPS_THRESHOLD:
+        newest = _newest_chip_time(unseen_chips)
+        unseen_chips = compact_chips(unseen_chips)
+        if len(unseen_chips) > REFETCH_GAMESTATE_THRESHOLD:
+            response['refetch_gamestate'] = True
+            return response
+        # If every chip cancelled out the client still has to advance its last_seen_chip_time past them.
+        if len(unseen_chips) == 0:
+            response['last_seen_chip_time'] = newest
     if unseen_chips:
         response['chips'] = unseen_chips
     return response
 
+def compact_chips(chips):
+    """
+    Returns a shorter list of chips which leaves a client in the same state as applying the given
+    chips in order. MODs are merged into the earlier ADD or MOD of the same path, and everything sent
+    to a path (and the paths below it) before a DELETE of that path is discarded, as is the DELETE itself
+    if the model was ADDed by these chips. The last chip carries the newest time of the original chips
+    so that the client's last_seen_chip_time advances the same. If everything cancels out an empty list is
+    returned, in which case the caller has to advance the client's last_seen_chip_time, see update_response.
+    NOTE: Client listeners see the compacted chips, e.g. a target ADD with processed already set rather than
+    an ADD followed by a MOD. The supplied chip dicts are not modified.
+
+    :param chips: list of chip dicts, as returned by get_chips, in the order they are to be applied.
+    """
+    if len(chips) == 0:
+        return chips
+    out = []
+    # Maps a path tuple to the index in out of the chip further changes to that path can be merged into.
+    open_chips = {}
+    # Maps a path tuple to the indexes in out of every chip at or below that path.
+    below = {}
+    # The paths which were ADDed by these chips, rather than already existing on the client.
+    added = set()
+    for chip in chips:
+        path = tuple(chip['path'])
+        action = chip['action']
+        if action == MOD and path in open_chips:
+            merged = _merge_chip_values(out[open_chips[path]], chip)
+            if merged is not None:
+                out[open_chips[path]] = merged
+                continue
+
+        elif action == DELETE:
+            # The model and everything below it is gone, so earlier changes to any of it do not matter.
+            for i in below.pop(path, []):
+                if out[i] is not None:
+                    open_chips.pop(tuple(out[i]['path']), None)
+                    out[i] = None
+            if path in added:
+                added.discard(path)
+                continue
+
+        elif action == ADD:
+            # The value of an ADD might replace the contents of the models below it, so do not move
+            # later changes to those models before it.
+            for i in below.get(path, []):
+                if out[i] is not None:
+                    open_chips.pop(tuple(out[i]['path']), None)
+            if path not in below:
+                added.add(path)
+
+        out.append(chip)
+        # A DELETE of a model which existed before these chips always has to be sent.
+        if action != DELETE:
+            index = len(out) - 1
+            open_chips[path] = index
+            for length in xrange(1, len(path) + 1):
+                below.setdefault(path[:length], []).append(index)
+
+    compacted = [chip for chip in out if chip is not None]
+    if len(compacted) == 0:
+        return compacted
+    newest = _newest_chip_time(chips)
+    if compacted[-1]['time'] != newest:
+        compacted[-1] = dict(compacted[-1], time=newest)
+    return compacted
+
+def _newest_chip_time(chips):
+    """ Returns the newest time of the given non-empty list of chip dicts. """
+    return max(chips, key=lambda chip: int(chip['time']))['time']
+
+def _merge_chip_values(first, second):
+    """ Returns first (an ADD or MOD) with the MOD second applied to it, or None if they cannot be merged. """
+    value = first['value'].copy()
+    for name, field in second['value'].iteritems():
+        # A nested struct might be a child model which the client merges into rather than replaces, so
+        # leave those chips as they are.
+        if isinstance(field, dict) and isinstance(value.get(name), dict):
+            return None
+        value[name] = field
+    return dict(first, value=value, time=second['time'], transient=second['transient'])
+
+
+def wait_for_chips(ctx, user_id, last_seen_chip_time, timeout):
+    """
+    Block until there are chips newer than last_seen_chip_time available to the given user, or until
+    timeout seconds have passed. Returns True if there are new chips, False if the wait timed out.
+    Chips sent by this process are noticed as soon as the transaction that sent them is committed.
+    Otherwise the database is checked every LONG_POLL_RECHECK_SECONDS.
+    NOTE: While waiting, the current transaction is committed and any open connections are released,
+    so this must not be called from inside a db.conn block or with uncommitted work in progress.
+
+    :param ctx: The database context.
+    :param user_id: The UUID of the user waiting for chips.
+    :param last_seen_chip_time: datetime object that specifies the time of the last chip the client has seen.
+    :param timeout: The maximum number of seconds to wait.
+    """
+    deadline = time.time() + min(timeout, LONG_POLL_MAX_WAIT_SECONDS)
+    # Start watching before the first check so that no notification can be missed between
+    # checking the database and waiting.
+    with _g_chip_notifier.watch(user_id) as watch:
+        while True:
+            if _has_chips_since(ctx, user_id, last_seen_chip_time, gametime.now()):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # End the transaction so that the next check is not reading from a stale snapshot and
+            # release the connection back to the pool while this request is idle.
+            db.commit(ctx)
+            db.close_all_connections(ctx)
+            watch.wait(min(remaining, LONG_POLL_RECHECK_SECONDS))
+
+def _has_chips_since(ctx, user_id, since, before):
+    if no_chips_since(ctx, user_id, since, before):
+        return False
+    with db.conn(ctx) as ctx:
+        row = db.row(ctx, "chips/select_max_chip_time", user_id=user_id, before=utils.usec_db_from_dt(before))
+    return row['time'] is not None and row['time'] > utils.usec_db_from_dt(since)
+
+class _ChipNotifier(object):
+    """
+    An in-process registry of users with a request waiting for chips (see wait_for_chips). The chips
+    buffer signals this registry after a transaction which sent chips for a user has been committed.
+    Only users being watched are tracked so the registry does not grow with the number of users.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        # Maps user_id to [watcher count, version], version being incremented on every notification.
+        self._watched = {}
+
+    def watch(self, user_id):
+        return _ChipWatch(self, user_id)
+
+    def notify(self, user_ids):
+        with self._cond:
+            notified = False
+            for user_id in user_ids:
+                watched = self._watched.get(user_id)
+                if watched is not None:
+                    watched[1] += 1
+                    notified = True
+            if notified:
+                self._cond.notify_all()
+
+    def _start(self, user_id):
+        with self._cond:
+            watched = self._watched.setdefault(user_id, [0, 0])
+            watched[0] += 1
+            return watched[1]
+
+    def _stop(self, user_id):
+        with self._cond:
+            watched = self._watched[user_id]
+            watched[0] -= 1
+            if watched[0] == 0:
+                del self._watched[user_id]
+
+    def _wait(self, user_id, version, timeout):
+        """ Wait for a notification newer than version. Returns the current version. """
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._watched[user_id][1] == version:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._watched[user_id][1]
+
+class _ChipWatch(object):
+    """ Context manager returned by _ChipNotifier.watch. """
+    def __init__(self, notifier, user_id):
+        self._notifier = notifier
+        self._user_id = user_id
+
+    def __enter__(self):
+        self._version = self._notifier._start(self._user_id)
+        return self
+
+    def __exit__(self, exception_type, value, tb):
+        self._notifier._stop(self._user_id)
+
+    def wait(self, timeout):
+        """ Wait for a notification since the last wait, or for timeout seconds. """
+        self._version = self._notifier._wait(self._user_id, self._version, timeout)
+
+_g_chip_notifier = _ChipNotifier()
 
 def send(ctx, user, action, path, value, time, transient=True):
     """
@@ -76,11 +302,63 @@ def send(ctx, user, action, path, value, time, transient=True):
       will be captured by a page reload.  Non-transient chips are sent to the client always, and are intended for
       notifications the user should receive no matter what.
     """
-    content = xjson.dumps(dict(action=action, path=path, value=value))
+    content = _encode_chip_content(action, path, value)
     time_micros = utils.usec_db_from_dt(time)
-    with db.conn(ctx) as ctx:
-        db.run(ctx, "chips/insert_chip", user_id=user.user_id,
-                    transient=transient, content=content, time=time_micros)
+    chip_buffer = db.write_buffer(ctx, _ChipBuffer.NAME, _ChipBuffer)
+    if BUFFER_CHIPS:
+        # The buffer is flushed in the order chips were sent, so the autoincrementing seq values
+        # preserve the (user_id, time, seq) ordering of unbuffered inserts.
+        chip_buffer.append(user.user_id, transient, content, time_micros)
+    else:
+        with db.conn(ctx) as ctx:
+            db.run(ctx, "chips/insert_chip", user_id=user.user_id,
+                        transient=transient, content=content, time=time_micros)
+            _update_watermarks(ctx, [(user.user_id, time_micros)])
+        chip_buffer.sent(user.user_id)
+
+def sent_count(ctx):
+    """ Returns the number of chips which have been sent with the given database context. Comparing this before and
+        after running some code tells whether that code sent any chips. """
+    return db.write_buffer(ctx, _ChipBuffer.NAME, _ChipBuffer).sent_count
+
+class _ChipBuffer(object):
+    """ A db write buffer holding the chips sent during the current transaction. """
+    NAME = 'chips'
+
+    def __init__(self):
+        self._rows = []
+        # The users who were sent chips in the current transaction.
+        self._user_ids = set()
+        # The number of chips sent with this database context, buffered or not, see sent_count.
+        self.sent_count = 0
+
+    def append(self, user_id, transient, content, time_micros):
+        self._rows.append((user_id, content, int(bool(transient)), time_micros))
+        self._user_ids.add(user_id)
+        self.sent_count += 1
+
+    def sent(self, user_id):
+        self._user_ids.add(user_id)
+        self.sent_count += 1
+
+    def has_pending(self):
+        return len(self._rows) > 0
+
+    def flush(self, ctx):
+        rows, self._rows = self._rows, []
+        for i in xrange(0, len(rows), CHIP_FLUSH_BATCH_SIZE):
+            db.run(ctx, "chips/insert_chips", chips=rows[i:i + CHIP_FLUSH_BATCH_SIZE])
+        _update_watermarks(ctx, [(row[0], row[3]) for row in rows])
+
+    def committed(self):
+        # Wake any request in this process which is waiting for these users' chips.
+        if self._user_ids:
+            user_ids, self._user_ids = self._user_ids, set()
+            _g_chip_notifier.notify(user_ids)
+
+    def discard(self):
+        self._rows = []
+        self._user_ids = set()
 
 
 def get_chips(ctx, user, since, before, transient):
@@ -96,20 +374,204 @@ def get_chips(ctx, user, since, before, transient):
     since_micros = utils.usec_db_from_dt(since)
     before_micros = utils.usec_db_from_dt(before)
     with db.conn(ctx) as ctx:
+        # Any chips sent earlier in this transaction must be inserted before they can be selected.
+        db.flush(ctx)
+        watermark = _chip_watermark(ctx, user.user_id)
+        if _watermark_excludes(watermark, since_micros, before_micros):
+            return []
         if transient:
             rows = db.rows(ctx, "chips/select_chips", user_id=user.user_id,
                             since=since_micros, before=before_micros)
         else:
             rows = db.rows(ctx, "chips/select_chips", user_id=user.user_id,
                             since=since_micros, before=before_micros, no_transient=True)
+        # Once a future chip has become due the watermark no longer excludes anything, so bring it up to date.
+        now_micros = utils.usec_db_from_dt(gametime.now())
+        if watermark is not None and _watermark_is_stale(watermark, now_micros):
+            _refresh_watermark(ctx, user.user_id, watermark, now_micros)
     chips = []
     for row in rows:
-        chip = xjson.loads(row['content'])
+        chip = _decode_chip_content(row['content'])
         chip['transient'] = row['transient']
         chip['time'] = utils.usec_js_from_db(row['time'])
         chips.append(chip)
     return chips
 
+## Chip content encoding
+# Encoded content starts with one of these marker bytes, which can never start the JSON object of a
+# legacy chip, followed by the JSON array [action, path, value] (zlib compressed for _CHIP_ZLIB).
+_CHIP_JSON = '\x01'
+_CHIP_ZLIB = '\x02'
+# The path elements which appear in almost every chip are encoded as their index in this tuple.
+# Chips already in the database refer to these indexes so new words must only ever be appended.
+CHIP_PATH_WORDS = ('user', 'rovers', 'targets', 'image_rects', 'sounds', 'missions', 'messages',
+                   'species', 'subspecies', 'regions', 'progress', 'achievements', 'capabilities',
+                   'vouchers', 'map_tiles', 'invitations', 'gifts_created', 'gifts_redeemed', 'shop',
+                   'available_products', 'purchased_products')
+_CHIP_PATH_INDEXES = dict((word, i) for i, word in enumerate(CHIP_PATH_WORDS))
+
+def _encode_chip_content(action, path, value):
+    """ Returns the database content for a chip, in the compact encoding if ENCODE_CHIPS is True. """
+    if not ENCODE_CHIPS:
+        return xjson.dumps(dict(action=action, path=path, value=value))
+    # Any path element which is not a string is wrapped in a list so it cannot be mistaken for a word index.
+    encoded_path = [_CHIP_PATH_INDEXES.get(p, p) if isinstance(p, basestring) else [p] for p in path]
+    content = xjson.dumps([action, encoded_path, value], separators=(',', ':'))
+    if len(content) > COMPRESS_CHIP_MIN_BYTES:
+        compressed = zlib.compress(content)
+        if len(compressed) < len(content):
+            return _CHIP_ZLIB + compressed
+    return _CHIP_JSON + content
+
+def _decode_chip_content(content):
+    """ Returns the chip dict with action, path and value keys for the given database content in any format. """
+    marker = content[:1]
+    if marker == _CHIP_ZLIB:
+        action, path, value = xjson.loads(zlib.decompress(content[1:]))
+    elif marker == _CHIP_JSON:
+        action, path, value = xjson.loads(content[1:])
+    else:
+        return xjson.loads(content)
+    path = [CHIP_PATH_WORDS[p] if isinstance(p, int) else p[0] if isinstance(p, list) else p for p in path]
+    return {'action': action, 'path': path, 'value': value}
+
+## Chip watermarks
+# Every user who has been sent chips has a row in chip_watermarks which bounds the times of their chips,
+# so that fetching chips when there are none to deliver does not need to touch the chips table.
+# visible_time is at least the time of every chip which was already deliverable when it was sent.
+# next_future_time is at most the time of every chip which was sent to be delivered in the future,
+# e.g. by add_in_future, or NULL if there are none. Both are maintained in the same transaction as the
+# chip inserts. Once gametime passes next_future_time the row is recomputed from the chips table.
+# version is incremented by every write so that a recompute never overwrites a concurrent send.
+def no_chips_since(ctx, user_id, since, before):
+    """
+    Returns True if the chip watermark for the given user proves there are no chips with a time after
+    since and up to and including before. A False return value means there might be chips.
+    This does not load the user or touch the chips table.
+
+    :param ctx: The database context.
+    :param user_id: The UUID of the user.
+    :param since: datetime object that specifies the time of the last chip the client has seen.
+    :param before: datetime object that specifies the latest chip to send, usually 'now'.
+    """
+    with db.conn(ctx) as ctx:
+        db.flush(ctx)
+        watermark = _chip_watermark(ctx, user_id)
+    return _watermark_excludes(watermark, utils.usec_db_from_dt(since), utils.usec_db_from_dt(before))
+
+def reset_watermark(ctx, user_id):
+    """
+    Force the chip watermark for the given user to be recomputed from the chips table. This must be
+    called by any code which modifies chip times directly in the database.
+    """
+    with db.conn(ctx) as ctx:
+        db.run(ctx, "chips/reset_chip_watermark", user_id=user_id)
+
+def chip_state(ctx, user_id, now):
+    """
+    Returns a dict describing the chips the given user can see at the given time, meant for versioning
+    data which is derived from the same state as those chips (e.g. a cached gamestate), or None if the
+    user has no chip watermark. The dict has the keys:
+     * version -- the watermark version, which changes whenever a chip is sent to the user
+     * time, seq -- the time in microseconds and seq of the newest chip visible at now, or None
+     * next_time -- the time in microseconds of the oldest chip which is not yet visible at now, or None
+
+    :param ctx: The database context.
+    :param user_id: The UUID of the user.
+    :param now: datetime object, usually gametime.now().
+    """
+    now_micros = utils.usec_db_from_dt(now)
+    with db.conn(ctx) as ctx:
+        db.flush(ctx)
+        watermark = _chip_watermark(ctx, user_id)
+        if watermark is None:
+            return None
+        rows = db.rows(ctx, "chips/select_latest_chip", user_id=user_id, before=now_micros)
+        next_time = db.row(ctx, "chips/select_min_future_chip_time", user_id=user_id, since=now_micros)['time']
+    latest = rows[0] if len(rows) > 0 else {'time': None, 'seq': None}
+    return {'version': watermark['version'], 'time': latest['time'], 'seq': latest['seq'], 'next_time': next_time}
+
+def _chip_watermark(ctx, user_id):
+    rows = db.rows(ctx, "chips/select_chip_watermark", user_id=user_id)
+    if len(rows) == 0:
+        return None
+    return rows[0]
+
+def _watermark_excludes(watermark, since_micros, before_micros):
+    # No watermark row means the user has never been sent a chip or has been deleted, in which case
+    # take the slow path and let the caller handle it.
+    if watermark is None:
+        return False
+    if since_micros < watermark['visible_time']:
+        return False
+    return watermark['next_future_time'] is None or watermark['next_future_time'] > before_micros
+
+def _watermark_is_stale(watermark, now_micros):
+    return watermark['next_future_time'] is not None and watermark['next_future_time'] <= now_micros
+
+def _refresh_watermark(ctx, user_id, watermark, now_micros):
+    # The watermark row and the chips are read from the same transaction snapshot, so if the version has
+    # not changed the recomputed values include every chip.
+    visible_time = db.row(ctx, "chips/select_max_chip_time", user_id=user_id, before=now_micros)['time']
+    next_future_time = db.row(ctx, "chips/select_min_future_chip_time", user_id=user_id, since=now_micros)['time']
+    db.run(ctx, "chips/update_chip_watermark", user_id=user_id, version=watermark['version'],
+           visible_time=visible_time or 0, next_future_time=next_future_time)
+
+def _update_watermarks(ctx, chip_times):
+    """ Raise the watermarks to include the given (user_id, time) chips which are about to be committed. """
+    now_micros = utils.usec_db_from_dt(gametime.now())
+    watermarks = {}
+    for user_id, time_micros in chip_times:
+        visible_time, next_future_time = watermarks.get(user_id, (0, None))
+        if time_micros <= now_micros:
+            visible_time = max(visible_time, time_micros)
+        elif next_future_time is None or time_micros < next_future_time:
+            next_future_time = time_micros
+        watermarks[user_id] = (visible_time, next_future_time)
+    db.run(ctx, "chips/upsert_chip_watermarks",
+           watermarks=[(user_id, v, f) for user_id, (v, f) in watermarks.iteritems()])
+
+## Streaming JSON encoding
+def iter_json(obj, fields=None, chunk_size=JSON_CHUNK_BYTES):
+    """
+    Yield the JSON encoding of obj.to_struct(fields=fields), where obj is a Model or Collection, as a
+    series of strings of about chunk_size bytes. The result is the same as xjson.dumps(obj.to_struct(fields)),
+    though possibly with the keys in a different order, but the structs for the tree of Models and Collections
+    are never built, so the JSON can be written out while it is being encoded without holding a second
+    copy of the data in memory.
+    """
+    chunk = []
+    size = 0
+    for piece in obj._json_pieces(fields):
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+_json_encoder = json.JSONEncoder(default=xjson.additional_default)
+
+def _json_object_pieces(items, fields):
+    """ Yields the JSON object for the given (key, value) items in pieces. Model and Collection values are
+        encoded with their _json_pieces method, passing on fields. """
+    yield '{'
+    separator = ''
+    for key, value in items:
+        # As with json.dumps, keys are always strings.
+        if not isinstance(key, basestring):
+            key = str(key)
+        yield separator + _json_encoder.encode(key) + ': '
+        separator = ', '
+        if isinstance(value, (Model, Collection)):
+            for piece in value._json_pieces(fields):
+                yield piece
+        else:
+            yield _json_encoder.encode(value)
+    yield '}'
+
 ## Future chip sending functions
 def add_in_future(ctx, user, collection, deliver_at, **model_params):
     # Create a new model instance using the supplied parameters.
@@ -118,7 +580,7 @@ def add_in_future(ctx, user, collection, deliver_at, **model_params):
     # not add the model to the collection.
     model._set_parent(collection)
     assert model.has_id() # Must have server issued id.
-    send(ctx, user, action=ADD, path=model._chip_path(), value=model.to_struct(), time=deliver_at)
+    send(ctx, user, action=ADD, path=model._cached_chip_path(), value=model.to_struct(), time=deliver_at)
     return model
 
 def modify_in_future(ctx, user, model, deliver_at, **new_params):
@@ -132,11 +594,11 @@ def modify_in_future(ctx, user, model, deliver_at, **new_params):
     if model.has_id() and not model.is_root():
         new_params[model.id_field] = getattr(model, model.id_field, None)
 
-    send(ctx, user, action=MOD, path=model._chip_path(), value=new_params, time=deliver_at)
+    send(ctx, user, action=MOD, path=model._cached_chip_path(), value=new_params, time=deliver_at)
 
 def delete_in_future(ctx, user, model, deliver_at):
     assert model.has_id() # Must have server issued id.
-    send(ctx, user, action=DELETE, path=model._chip_path(), value={}, time=deliver_at)
+    send(ctx, user, action=DELETE, path=model._cached_chip_path(), value={}, time=deliver_at)
 
 
 class LazyField(object):
@@ -185,6 +647,78 @@ class LazyField(object):
             for instance avoid a chip MOD."""
         setattr(model_instance, self._cached_name, value)
 
+# The sets of Collections read by each DependentField loader which is currently running in this thread,
+# innermost last, see _dependency_reads.
+_g_dependency_reads = threading.local()
+
+def _dependency_reads():
+    """ Returns the stack of read sets for the DependentField loaders running in the current thread. """
+    try:
+        return _g_dependency_reads.stack
+    except AttributeError:
+        _g_dependency_reads.stack = []
+        return _g_dependency_reads.stack
+
+class DependentField(LazyField):
+    """
+    A LazyField whose value is derived (e.g. by a callback) from the contents of Collections elsewhere in the
+    gamestate. Every Collection read while the loader runs, including those read by any other DependentField
+    it reads, is recorded on the Model instance and any of those which have track_dependents set remember this
+    field as one of their dependents. When such a Collection changes (a child is added or deleted or one of the
+    child fields in tracked_fields changes) the value of each loaded dependent is marked stale. The next time a
+    Model in that Collection sends its chips, the stale values are recomputed and for each dependent Model whose
+    value actually changed either the changed function is called with the Model, old value and new value, or by
+    default the field is marked changed, and then the Model sends its chips.
+
+    A dependent which has never been loaded has no value to compare to and which Collections it reads is not
+    known yet, so before a tracked Collection changes the load_dependents hook of the root Model is called, which
+    loads every dependent the client might hold a value for and which has not been loaded or is known to read
+    that Collection, see Model.load_dependent_fields. The descriptor itself holds no state, as it is shared by
+    every Model instance in every thread.
+    """
+    def __init__(self, attr_name, loader, changed=None):
+        super(DependentField, self).__init__(attr_name, loader)
+        self._changed = changed
+
+    def __get__(self, model_instance, model_class):
+        if model_instance is None:
+            return self
+        stack = _dependency_reads()
+        if hasattr(model_instance, self._cached_name):
+            # A DependentField read by another depends on the same Collections.
+            if stack:
+                stack[-1].update(self._recorded_reads(model_instance) or ())
+            return getattr(model_instance, self._cached_name)
+        reads = set()
+        stack.append(reads)
+        try:
+            value = super(DependentField, self).__get__(model_instance, model_class)
+        finally:
+            stack.pop()
+        if stack:
+            stack[-1].update(reads)
+        if getattr(model_instance, '_dependent_reads', None) is None:
+            model_instance._dependent_reads = {}
+        model_instance._dependent_reads[self._wrapped_name] = frozenset(reads)
+        for collection in reads:
+            if collection.track_dependents:
+                collection._add_dependent(model_instance, self)
+        return value
+
+    def might_read(self, model_instance, collection):
+        """ Returns True unless this field of the given Model has been loaded before and did not read the given
+            Collection. """
+        reads = self._recorded_reads(model_instance)
+        return reads is None or collection in reads
+
+    def _recorded_reads(self, model_instance):
+        """ Returns the Collections read when this field of the given Model was last loaded, or None if it
+            has never been loaded. """
+        reads = getattr(model_instance, '_dependent_reads', None)
+        if reads is None:
+            return None
+        return reads.get(self._wrapped_name)
+
 class ComputedField(object):
     """ A baseclass which provides a mechanism to modify field values or add new field accessors
         which wrap existing fields. """
@@ -200,8 +734,58 @@ class ComputedField(object):
             return getattr(self, wrapped_field)
         setattr(model_class, computed_field, property(getter))
 
+class RootId(object):
+    """ Special class to be used only in the id_field section of a Model class,
+    which forces the model to be the root object, and the name of the root
+    object will always be the *name* passed in to the constructor."""
+    def __init__(self, name):
+        self.name = name
+
 class FieldedClass(type):
-    """Meta-class for initializing Model classes fields."""
+    """
+    Meta-class for initializing Model classes fields.
+    Every Model class gets __slots__ for its fields, collections, id_field and LazyField cached values
+    (unless already provided by a base class or defined as a class attribute, e.g. a LazyField or property)
+    so instances carry no per instance __dict__. A Model subclass which needs any other instance attributes,
+    which must have a _ prefix, lists them in its own __slots__ and they are added to the generated ones.
+    """
+    def __new__(mcs, name, bases, dct):
+        def inherited(attr, default):
+            if attr in dct:
+                return dct[attr]
+            for base_class in bases:
+                if hasattr(base_class, attr):
+                    return getattr(base_class, attr)
+            return default
+
+        slots = dct.get('__slots__', ())
+        if isinstance(slots, basestring):
+            slots = (slots,)
+        slots = list(slots)
+
+        slot_names = set(inherited('fields', frozenset())).union(inherited('collections', frozenset()))
+        id_field = inherited('id_field', None)
+        if isinstance(id_field, basestring):
+            slot_names.add(id_field)
+        for prop, field in dct.iteritems():
+            if isinstance(field, LazyField):
+                if field._cached_name in dct:
+                    raise ChipsError("LazyField cached value name already defined in class %s [%s]" %
+                                     (field._cached_name, name))
+                slot_names.add(field._cached_name)
+                # The Collections each DependentField read when it was loaded, see DependentField.
+                if isinstance(field, DependentField):
+                    slot_names.add('_dependent_reads')
+        computed_fields = inherited('computed_fields', {})
+        for slot_name in sorted(slot_names):
+            if slot_name in dct or slot_name in computed_fields or slot_name in slots:
+                continue
+            if any(hasattr(base_class, slot_name) for base_class in bases):
+                continue
+            slots.append(slot_name)
+        dct['__slots__'] = tuple(slots)
+        return super(FieldedClass, mcs).__new__(mcs, name, bases, dct)
+
     def __init__(cls, name, bases, dct):
         super(FieldedClass, cls).__init__(name, bases, dct)
 
@@ -227,20 +811,28 @@ class FieldedClass(type):
 
         # Find all the LazyFields for future use. Use items() copy instead of iter as unmanaged_fields
         # might be changing (have to replace as it is a frozenset).
-        for prop, field in cls.__dict__.items():
+        for prop, field in dct.items():
             if isinstance(field, LazyField):
-                if field._cached_name in cls.__dict__:
-                    raise ChipsError("LazyField cached value name already defined in class %s [%s]" %
-                                     (field._cached_name, cls.__name__))
                 cls.lazy_fields[prop] = field
                 # If the lazy field is listed in unmanaged_fields then also mark its cached value name as unmanaged.
                 if prop in cls.unmanaged_fields:
                     cls.unmanaged_fields = cls.unmanaged_fields.union(set([field._cached_name]))
 
+        cls.dependent_fields = tuple(f for f in cls.lazy_fields.itervalues() if isinstance(f, DependentField))
+
         # Process the ComputedFields
         for computed_field, computer in cls.computed_fields.iteritems():
             computer.create_computed_field(cls, computed_field)
 
+        # Everything Model needs to validate field names and values which only depends on the class.
+        # See is_known_field.
+        id_field_name = cls.id_field.name if isinstance(cls.id_field, RootId) else cls.id_field
+        cls._known_fields = fields_and_collections.union([id_field_name, 'cid'])
+        # The fields which must be given a value by the constructor: those stored in a slot rather than
+        # provided by a LazyField or some other class attribute (e.g. a property).
+        cls._required_fields = tuple(sorted(f for f in cls.fields if f not in cls.lazy_fields and
+                                            (not hasattr(cls, f) or isinstance(getattr(cls, f), types.MemberDescriptorType))))
+
 class Model(object):
     """Base class for data that needs to have deltas tracked with chips.  
     Subclass it and override the *id_field* and *fields* class members.
@@ -300,24 +892,31 @@ class Model(object):
     # Tracks all LazyFields used by this Model. Initialized by the metaclass.
     lazy_fields = None
 
+    # The LazyFields used by this Model which are DependentFields. Initialized by the metaclass.
+    dependent_fields = ()
+
+    # The per instance state of every Model. The metaclass adds a slot for every field, see FieldedClass.
+    __slots__ = ('_changed_fields', '_new', '_deleted', '_parent', 'cid', '_chip_path_cache')
+
     def __init__(self, **properties):
         """Constructor, accepts keyword arguments that become propreties.
         Note that no effort is made to ensure that the properties are also
         part of the fields.  This is so that the server can maintain variables
         that are not synced with the client.
         """
-        self._changed_fields = set()
-        self._new = False
-        self._deleted = False
-        self._parent = None
+        # The set of changed fields is only created once a field is changed, see mark_field_changed.
+        object.__setattr__(self, '_changed_fields', None)
+        object.__setattr__(self, '_new', False)
+        object.__setattr__(self, '_deleted', False)
+        object.__setattr__(self, '_parent', None)
 
         # Set all the fields silently to avoid marking them as changed.
         self.set_silent(**properties)
 
-        # Verify every field has a value or is a LazyField. Do not check values as these
-        # may trigger lazy loaders.
-        for name in self.fields:
-            if not (name in self.lazy_fields or hasattr(self, name)):
+        # Verify every field which is not a LazyField has a value. Which fields those are is
+        # determined when the class is created, see FieldedClass.
+        for name in self._required_fields:
+            if not hasattr(self, name):
                 raise ChipsError("Required field in model not defined %s [%s]", self.__class__.__name__, name)
         # Verify this instance has an 'id' set.
         if self.get_id() == None:
@@ -373,11 +972,11 @@ class Model(object):
         """ Returns True if the given field name is known (tracked) by this Model instance.
             A known field is either in the 'fields' list, 'collections' list, the id field,
             or is 'cid'. """
-        return (name in self.fields) or (name in self.collections) or (name == self.id_field_name) or (name == 'cid')
+        return name in self._known_fields
 
     def assert_known_field(self, name):
         """ Raises a ChipsError if the given field name is not known (tracked) by this Model."""
-        if not (name == self.id_field_name or self.is_known_field(name)):
+        if name not in self._known_fields:
             raise ChipsError("Unknown field in model %s [%s]", self.__class__.__name__, name)
 
     def mark_field_changed(self, name):
@@ -387,6 +986,8 @@ class Model(object):
         field has been changed."""
         self.assert_known_field(name)
         assert not self._deleted  # Once a model is deleted, we don't expect attributes to change.
+        if self._changed_fields is None:
+            self._changed_fields = set()
         self._changed_fields.add(name)
 
     def set_silent(self, **kw):
@@ -405,6 +1006,11 @@ class Model(object):
         self._set_attr(silent=False, **{name: value})
 
     def _set_attr(self, silent, **kw):
+        # If a field any DependentField might depend on is changing, inform the parent Collection.
+        tracking = (not silent and isinstance(self._parent, Collection) and self._parent.track_dependents and
+                    self._parent._tracks_any(kw))
+        if tracking:
+            self._parent._dependencies_changing()
         old_id = None
         for name, value in kw.iteritems():
             self.assert_valid_attribute(name)
@@ -431,12 +1037,18 @@ class Model(object):
         # Inform any parent if our 'id' changed so this model can be reindexed in any collection.
         if old_id is not None and self._parent is not None:
             self._parent._child_reindex(old_id, self)
+        if self.id_field in kw:
+            self._invalidate_chip_paths()
+        if tracking:
+            self._parent._dependencies_changed()
 
     def _pending_chips(self):
         """
         Returns an array of unsent chips.
         """
         assert not (self._deleted and self._new)
+        if self._deleted or self._new or self._changed_fields:
+            path = self._cached_chip_path()
         # NOTE: This is ce4 specific code and could be factored out.
         deliver_at = gametime.now()
 
@@ -445,7 +1057,7 @@ class Model(object):
         if self._deleted:
             chips.append({
                 'action':DELETE,
-                'path':self._chip_path(),
+                'path':path,
                 'value':{},
                 'time':deliver_at
             })
@@ -453,15 +1065,15 @@ class Model(object):
         elif self._new:
             chips.append({
                 'action':ADD,
-                'path':self._chip_path(),
+                'path':path,
                 'value':self.to_struct(),
                 'time':deliver_at
             })
         # If this is a MOD, add only the changed fields and id_field.
-        elif len(self._changed_fields) > 0:
+        elif self._changed_fields:
             chips.append({
                 'action':MOD,
-                'path':self._chip_path(),
+                'path':path,
                 'value':self.to_struct(fields=self._changed_fields),
                 'time':deliver_at})
         return chips
@@ -481,27 +1093,73 @@ class Model(object):
                  path=chip['path'], value=chip['value'], time=chip['time'])
 
         # clear out any state that marks this as "unsaved"
-        self._changed_fields.clear()
+        self._changed_fields = None
         self._new = False
         self._deleted = False
         if self.has_cid():
             del self.cid
+            # The path of anything below this model included the cid.
+            self._invalidate_chip_paths()
+
+        # Now that the change to this model has been sent, send any changes to the values depending on it.
+        if isinstance(self._parent, Collection) and self._parent._stale_dependents:
+            self._parent._send_dependent_chips(ctx, user)
+
+    def load_dependents(self, collection):
+        """
+        Called on the root Model before a Collection with track_dependents set changes. Override this to load every
+        DependentField in the tree which the client might hold a value for, so that if it reads the Collection its
+        value before the change is known. See DependentField and load_dependent_fields.
+        """
+        pass
+
+    def load_dependent_fields(self, collection):
+        """ Load every DependentField of this Model which has not been loaded yet, unless it is known not to read
+            the given Collection. """
+        for field in self.dependent_fields:
+            if not hasattr(self, field._cached_name) and field.might_read(self, collection):
+                field.__get__(self, self.__class__)
 
     def _chip_path(self):
-        """Returns the path used in generated chips.  Uses the parent's path
-        if present as a starting point."""
-        if self.is_root():
-            base_path = []
-        else:
-            assert self._parent != None # no chip path is valid without a parent
-            base_path = self._parent._chip_path()
+        """Returns the path used in generated chips as a new list, see _cached_chip_path."""
+        return list(self._cached_chip_path())
 
+    def _cached_chip_path(self):
+        """Returns the path used in generated chips.  Uses the parent's path
+        if present as a starting point. The path is cached as it only changes if the id (or cid)
+        of this model or one above it changes, see _invalidate_chip_paths. The returned list is
+        shared by every chip sent for this model and must not be modified."""
+        path = getattr(self, '_chip_path_cache', None)
+        if path is None:
+            if self.is_root():
+                path = []
+            else:
+                assert self._parent != None # no chip path is valid without a parent
+                path = self._parent._chip_path()
+            path.append(self._chip_path_id())
+            object.__setattr__(self, '_chip_path_cache', path)
+        return path
+
+    def _chip_path_id(self):
+        """ Returns the last element of the chip path for this model, its cid if it has one. """
         if self.has_cid():
-            base_path.append(self.cid)
+            return self.cid
         elif self.has_id():
-            base_path.append(self.get_id())
+            return self.get_id()
 
-        return base_path
+    def _invalidate_chip_paths(self):
+        """ Called when the chip path of this model changes, forgets the cached path of this model and of
+            every Model and Collection below it. See _cached_chip_path and Collection._chip_path. """
+        # Nothing below a model without a cached path can have cached its path.
+        if getattr(self, '_chip_path_cache', None) is None:
+            return
+        object.__setattr__(self, '_chip_path_cache', None)
+        for name in self.collections.union(self.lazy_fields):
+            field = self.lazy_fields.get(name)
+            # Never trigger a lazy load, an unloaded child has no cached paths.
+            value = getattr(self, name if field is None else field._cached_name, None)
+            if isinstance(value, (Model, Collection)) and value._parent is self:
+                value._invalidate_chip_paths()
 
     def is_root(self):
         """Returns true only if this is a root object.  Special!"""
@@ -535,6 +1193,8 @@ class Model(object):
         :param is_full_struct: True if all fields in this model are being struct-ified.
         Should be True when to_struct is called to create the full model/collection
         tree or during a chip ADD.
+        NOTE: When the struct is being encoded by iter_json, any child Model or Collection values
+        are still the objects themselves, so they may be replaced or removed but not modified.
         """
         return struct
 
@@ -546,6 +1206,20 @@ class Model(object):
         sense when checking the fields for this particular model and will not be passed to child models
         or collections.
         """
+        struct = self._unmodified_struct(fields)
+        # If a field value is a Model or Collection, ask the value to struct-ify itself.
+        for name, value in struct.items():
+            if isinstance(value, (Model, Collection)):
+                struct[name] = value.to_struct()
+
+        # Give subclasses a chance to modify the struct.
+        self.modify_struct(struct, is_full_struct=(fields == None))
+
+        return struct
+
+    def _unmodified_struct(self, fields):
+        """ Returns the struct for to_struct before modify_struct is called and with any Model or
+            Collection field values left as is. """
         struct = {}
         # If no fields list is provided, struct-ify all fields and collections.
         if fields is None:
@@ -559,22 +1233,20 @@ class Model(object):
         # Add all of the requested fields to the struct.
         for name in struct_fields:
             self.assert_known_field(name)
-            value = getattr(self, name, None)
-            # If the field value is a Model or Collection, ask the value
-            # to struct-ify itself.
-            if isinstance(value, (Model, Collection)):
-                value = value.to_struct()
-            struct[name] = value
+            struct[name] = getattr(self, name, None)
 
         # Always add the id_field if this instance has one (not cid or root.)
         if self.has_id() and not self.is_root():
             struct[self.id_field] = getattr(self, self.id_field, None)
 
-        # Give subclasses a chance to modify the struct.
-        self.modify_struct(struct, is_full_struct=(fields == None))
-
         return struct
 
+    def _json_pieces(self, fields=None):
+        """ Yields the JSON encoding of to_struct(fields) in pieces, see iter_json. """
+        struct = self._unmodified_struct(fields)
+        self.modify_struct(struct, is_full_struct=(fields == None))
+        return _json_object_pieces(struct.iteritems(), None)
+
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__, self.get_id())
 
@@ -584,13 +1256,6 @@ class Model(object):
     def __hash__(self):
         return hash(self.get_id())
 
-class RootId(object):
-    """ Special class to be used only in the id_field section of a Model class,
-    which forces the model to be the root object, and the name of the root
-    object will always be the *name* passed in to the constructor."""
-    def __init__(self, name):
-        self.name = name
-
 
 class Collection(object):
     """Manages a collection of Model instances.  It behaves like a dict, where
@@ -625,6 +1290,17 @@ class Collection(object):
     for the collection while not hitting the database if not actually necessary.
     """
     model_class = None
+    # If True, DependentFields which read this Collection are kept up to date as it changes, see DependentField.
+    track_dependents = False
+    # The child Model fields which DependentFields reading this Collection might depend on, None for every field.
+    tracked_fields = None
+    # When track_dependents is set, maps (id(model), field name) to a (model, DependentField) tuple for every
+    # loaded dependent, and holds a list of (model, DependentField, old value) tuples for those which are stale.
+    _dependents = None
+    _stale_dependents = None
+    # The chip path of this Collection as a tuple, built the first time it is needed, see _chip_path.
+    _chip_path_prefix = None
+
     def __init__(self, name, *model_args):
         """Constructor, accepts a variable quantity of model structs that are 
         used to populate the collection initially."""
@@ -660,8 +1336,14 @@ class Collection(object):
         # lazy load has happened, which might load the newly created child from the DB again.
         if self._loaded:
             assert m_id not in self._models # collision
+        # Models being loaded are not changes, see load.
+        tracking = self.track_dependents and self._loaded
+        if tracking:
+            self._dependencies_changing()
         model._set_parent(self)
         self._models[m_id] = model
+        if tracking:
+            self._dependencies_changed()
         return model
 
     def delete_child(self, model):
@@ -671,12 +1353,20 @@ class Collection(object):
         m_id = str(model.get_id())
         assert m_id != None # needs a real id or cid
         assert m_id in self._models
+        if self.track_dependents:
+            self._dependencies_changing()
         model._mark_deleted()
         del self._models[m_id]
+        if self.track_dependents:
+            self._dependencies_changed()
 
     def create_child(self, **kw):
         """Creates a child (using the create method of *model_class*, 
         and adds it to the collection. Returns the created model."""
+        # The values of the DependentFields reading this collection from before the change are compared to those
+        # after it, so it is loaded first. Therefore the child must be created before it is inserted into the DB.
+        if self.track_dependents:
+            self.load()
         m = self.model_class.create(**kw)
         self.add(m)
         return m
@@ -684,6 +1374,10 @@ class Collection(object):
     def get_models(self):
         """ Return the dict of child Models. This will lazy load the models if a loader was defined. """
         self.load()
+        # Record this read if a DependentField is being loaded.
+        stack = _dependency_reads()
+        if stack:
+            stack[-1].add(self)
         return self._models
 
     @property
@@ -696,13 +1390,29 @@ class Collection(object):
         self._parent = parent
 
     def _chip_path(self):
-        """Returns the path used in generated chips.  Uses the parent's path
-        if present as a starting point."""
-        assert self._parent != None # no chip path is valid without a parent
-        base_path = self._parent._chip_path()
+        """Returns the path used in generated chips as a new list, see _cached_chip_path."""
+        return list(self._cached_chip_path())
+
+    def _cached_chip_path(self):
+        """Returns the path used in generated chips as a tuple.  Uses the parent's path
+        if present as a starting point. The path is cached as it only changes if the id (or cid)
+        of a model above this collection changes, see Model._invalidate_chip_paths."""
+        prefix = self._chip_path_prefix
+        if prefix is None:
+            assert self._parent != None # no chip path is valid without a parent
+            prefix = tuple(self._parent._cached_chip_path()) + (self.name,)
+            self._chip_path_prefix = prefix
+        return prefix
+
+    def _invalidate_chip_paths(self):
+        """ Forget the cached chip path of this Collection and every Collection below it. """
+        # Nothing below a collection without a cached path can have cached its path.
+        if self._chip_path_prefix is None:
+            return
+        self._chip_path_prefix = None
+        for model in self._models.itervalues():
+            model._invalidate_chip_paths()
 
-        base_path.append(self.name)
-        return base_path
     
     def load(self, *args, **kw):
         """Call this function to explicitly load the collection from the 
@@ -728,9 +1438,65 @@ class Collection(object):
         return dict([(k, v.to_struct(fields=fields))
                for k,v in self.get_models().iteritems()])
 
+    def _json_pieces(self, fields=None):
+        """ Yields the JSON encoding of to_struct(fields) in pieces, see iter_json. """
+        return _json_object_pieces(self.get_models().iteritems(), fields)
+
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__, ",".join(self.get_models()))
 
+    def _add_dependent(self, model, field):
+        """ Called by a DependentField of the given model which has been loaded and read this Collection. """
+        if self._dependents is None:
+            self._dependents = {}
+        self._dependents[(id(model), field._wrapped_name)] = (model, field)
+
+    def _tracks_any(self, names):
+        """ Returns True if changing any of the given child fields might change a DependentField. """
+        return self.tracked_fields is None or not self.tracked_fields.isdisjoint(names)
+
+    def _root(self):
+        """ Returns the Model at the root of the tree this Collection is in, or None if it has no parent. """
+        node = self._parent
+        while node is not None and node._parent is not None:
+            node = node._parent
+        return node
+
+    def _dependencies_changing(self):
+        """ Called before this Collection changes, see DependentField. """
+        root = self._root()
+        if root is not None:
+            root.load_dependents(self)
+
+    def _dependencies_changed(self):
+        """ Called after this Collection changes. Marks every loaded dependent stale, remembering its
+            value so that a chip is only sent if it changes. Each dependent registers again when reloaded. """
+        if not self._dependents:
+            return
+        if self._stale_dependents is None:
+            self._stale_dependents = []
+        for model, field in self._dependents.itervalues():
+            # A dependent which is already stale still holds its original value.
+            if model._deleted or not hasattr(model, field._cached_name):
+                continue
+            self._stale_dependents.append((model, field, getattr(model, field._cached_name)))
+            delattr(model, field._cached_name)
+        self._dependents = None
+
+    def _send_dependent_chips(self, ctx, user):
+        """ Reload every stale dependent and send a MOD chip for each one whose value changed. """
+        stale, self._stale_dependents = self._stale_dependents, None
+        for model, field, old_value in stale:
+            if model._deleted:
+                continue
+            new_value = getattr(model, field._wrapped_name)
+            if new_value != old_value:
+                if field._changed is None:
+                    model.mark_field_changed(field._wrapped_name)
+                else:
+                    field._changed(model, old_value, new_value)
+                model.send_chips(ctx, user)
+
     def _child_reindex(self, old_id, model):
         """Called by one of the models in the collection to indicate that its
         id has changed, and thus the collection needs to reorder itself."""
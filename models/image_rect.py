@@ -58,6 +58,7 @@ class SpeciesRect(object):
         checkes against None/NO_SUBSPECIES when examining these values.
         It is expected that any class that mixes this class in will have a species_id and a 
         subspecies_id property, either of which can be None. (currently). """
+    __slots__ = ()
 
     def detected_species(self):
         """ Returns a set of any species identified for this rectangle. """
@@ -93,6 +94,12 @@ class ImageRect(chips.Model, models.UserChild, SpeciesRect):
         # self.parent is target.image_rects, the parent of that is the target itself
         return self.parent.parent
 
+    def _set_attr(self, silent, **kw):
+        super(ImageRect, self)._set_attr(silent, **kw)
+        # If this image_rect is in a target's image_rects collection, inform it that the species changed.
+        if self._parent is not None and ('species_id' in kw or 'subspecies_id' in kw):
+            self._parent._child_species_changed(self)
+
     @property
     def user(self):
         return self.target.user
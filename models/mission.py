@@ -169,6 +169,12 @@ class Mission(chips.Model, models.UserChild):
         # self.parent is user.missions, the parent of that is the User itself
         return self.parent.parent
 
+    def _set_attr(self, silent, **kw):
+        super(Mission, self)._set_attr(silent, **kw)
+        # If this mission is in the user's missions collection, inform it that the done state changed.
+        if self._parent is not None and 'done' in kw:
+            self._parent._child_done_changed(self)
+
     def is_root_mission(self):
         """ Returns True if this mission is a 'root' mission, either a childless single mission or the parent
             mission for one or more children.
@@ -302,9 +308,8 @@ class Mission(chips.Model, models.UserChild):
         with db.conn(self.ctx) as ctx:
             # Only allow one deferred action at a time to mark a given mission done, even if
             # the run_at time is different.
-            if deferred.is_queued_to_run_later_for_user(ctx, deferred.types.MISSION_DONE_AFTER, self.mission_definition, self.user):
-                return
-            deferred.run_later(ctx, deferred.types.MISSION_DONE_AFTER, self.mission_definition, self.user, after_seconds)
+            deferred.run_later(ctx, deferred.types.MISSION_DONE_AFTER, self.mission_definition, self.user, after_seconds,
+                               dedup=deferred.dedup.IF_NOT_QUEUED)
 
     def mark_viewed(self):
         """ Mark this mission as 'viewed' (set a value of 'now' for viewed_at).
@@ -33,19 +33,21 @@ class AvailableProduct(BaseProduct):
     # All of these fields come from the product definitions JSON file.
     fields = frozenset(['name', 'description', 'price', 'currency', 'price_display', 'initial_price', 'initial_price_display',
                         'icon', 'sort', 'repurchaseable', 'cannot_purchase_after'])
-    price_display = chips.LazyField("price_display", lambda m: m._load_price_display())
-
-    def __init__(self, product_key, user):
+    # The price and whether the product is still available are determined by the callbacks and, as they read the
+    # user's purchased products and vouchers, refreshed and a chip sent if those change. See chips.DependentField.
+    price = chips.DependentField("price", lambda m: m._load_price())
+    price_display = chips.DependentField("price_display", lambda m: m._load_price_display())
+    # A server only value, an AvailableProduct is only created for a product which is available.
+    available = chips.DependentField("available", lambda m: m._load_available(),
+                                     changed=lambda m, old, new: m._available_changed(new))
+
+    def __init__(self, product_key):
         definition = get_product_definition(product_key)
         params = {}
         for field in self.fields:
-            if field in ['price_display', 'initial_price_display']:
+            if field in ['price', 'price_display', 'initial_price_display']:
                 continue
-            if field == 'price':
-                value = _available_product_current_price(product_key, user, definition['initial_price'], definition['currency'])
-            else:
-                value = definition[field]
-            params[field] = value
+            params[field] = definition[field]
 
         super(AvailableProduct, self).__init__(product_key=product_key, **params)
 
@@ -62,12 +64,10 @@ class AvailableProduct(BaseProduct):
     def record_purchased_by_invoice(self, invoice, product_specifics):
         """ Record that this AvailableProduct has been purchased, by creating and persisting a
             PurchasedProduct. """
-        purchased = PurchasedProduct.create_from_available_product(self, invoice, product_specifics, self.user)
         # Now that this product has been purchased, it is possible its availablity or price has changed,
-        # for instance if it is a product that can only be purchased once, so check to see if those
-        # need to be refresh and chips sent.
-        self.available_and_price_refresh()
-        return purchased
+        # for instance if it is a product that can only be purchased once, in which case chips are sent
+        # along with the purchased product's.
+        return PurchasedProduct.create_from_available_product(self, invoice, product_specifics, self.user)
 
     def can_purchase_with(self, product_keys):
         """ Returns True if this product can be purchased with the given list of product_keys, False otherwise.
@@ -81,35 +81,22 @@ class AvailableProduct(BaseProduct):
         return run_callback(PRODUCT_CB, "validate_product_specifics", self.product_key, ctx=self.ctx, user=self.user,
                             product=self, product_specifics=product_specifics)
 
-    def available_and_price_refresh(self):
-        """
-        If this product is no longer available or its price has changed (as determined by callbacks) then
-        update the instance values and issue a chip. This method must be called whenever a gamestate change occurs
-        which might affect the availability or price values of a product, e.g. a product was purchased.
-        """
-        # If the product is currently in the available products but no longer available, then issue the DELETE chip.
-        is_available = self in self.user.shop.available_products
-        current_available = is_product_available(self.product_key, self.user)
-        if is_available and not current_available:
+    def _available_changed(self, available):
+        """ Called when the available value has been refreshed with a different value. If the product is no longer
+            available it is deleted from the available products, issuing a DELETE chip. """
+        if not available:
             self.delete()
-            with db.conn(self.ctx) as ctx:
-                self.send_chips(ctx, self.user)
-        # There's no point checking to see if the price changed as this product is not available.
-        if not current_available:
-            return
-        # If the price has changed, then issue a MOD chip.
-        current_price = _available_product_current_price(self.product_key, self.user, self.initial_price, self.currency)
-        if current_price != self.price:
-            self.price = current_price
-            # Update the price_display value as well as it will have changed.
-            self.price_display = self._load_price_display()
-        with db.conn(self.ctx) as ctx:
-            self.send_chips(ctx, self.user)
 
     ## Lazy load attribute methods.
+    def _load_price(self):
+        return _available_product_current_price(self.product_key, self.user, self.initial_price, self.currency)
+
     def _load_price_display(self):
         return money.format_money(self.money)
 
+    def _load_available(self):
+        return is_product_available(self.product_key, self.user)
+
 class PurchasedProduct(BaseProduct):
     """
     Holds the parameters for a single purchased product.
@@ -151,9 +138,11 @@ class PurchasedProduct(BaseProduct):
         params['invoice_id']   = invoice.invoice_id
 
         with db.conn(user.ctx) as ctx:
+            # The purchased product is added to user.shop.purchased_products before it is inserted so that the
+            # available product values which depend on it can be refreshed, see AvailableProduct.
+            purchased = user.shop.purchased_products.create_child(**params)
             created = gametime.now()
             db.run(ctx, "shop/insert_purchased_product", user_id=user.user_id, created=created, **params)
-            purchased = user.shop.purchased_products.create_child(**params)
             purchased.send_chips(ctx, user)
             # Inform the callbacks that this product was purchased.
             run_callback(PRODUCT_CB, "product_was_purchased", purchased.product_key, ctx=ctx, user=user,
@@ -11,6 +11,7 @@ class RegionGeography(object):
     It is expected classes mixing in this class will provide the following properties at least:
     'shape', 'verts', 'center' and 'radius'
     """
+    __slots__ = ()
 
     def point_inside(self, lat, lng):
         """
@@ -1,7 +1,7 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
 """This class represents the state of a single rover."""
-import uuid
+import uuid, bisect
 
 from front import models, rover_chassis
 from front.lib import db, get_uuid, urls, geometry, gametime
@@ -28,10 +28,6 @@ def create_new_rover(ctx, user, lander, rover_key, activated_at, active=1):
     :param active: 0 or 1 to indicate if the new rover should be active.
     """
     assert rover_key.startswith("RVR_"), "Rover keys must start with a RVR_ prefix."
-    # Be sure all capabilities are loaded so their available and unlimited values can be
-    # compared pre and post rover creation, as they might change and require a chip.
-    user.capabilities.available_and_unlimited_prepare_refresh()
-
     with db.conn(ctx) as ctx:
         params = {}
         params['rover_id']     = uuid.uuid1()
@@ -41,17 +37,15 @@ def create_new_rover(ctx, user, lander, rover_key, activated_at, active=1):
         params['rover_key']    = rover_key
         params['activated_at'] = activated_at
         params['active']       = active
-        # Create the rover.
+        # Create the rover. It is added to user.rovers before it is inserted, as a new rover means that a
+        # capability which is using the rover count to determine availablity might now be available, and the
+        # chip for that is sent along with the rover's.
+        rover = user.rovers.create_child(**params)
         # user_id is only used when creating and selecting the Rover in the database, it is not loaded
         # by chips as the user.rovers collection takes care of assigning a User to a Rover.
         db.run(ctx, "insert_rover", user_id=user.user_id, created=gametime.now(), **params)
-        rover = user.rovers.create_child(**params)
         rover.send_chips(ctx, user)
 
-        # A new rover means that a capability which is using the rover count to determine
-        # availablity might now be available.
-        user.capabilities.available_and_unlimited_refresh()
-
         return rover
 
 class Rover(chips.Model, models.UserChild):
@@ -67,10 +61,12 @@ class Rover(chips.Model, models.UserChild):
     # They are lazy loaded as some of those callbacks expect the rover to be fully created and in the user
     # hierarchy when deriving the current field value and so we delay populating the values for these fields
     # until after the Rover has had its other fields initialized and it has been added to the rovers collection.
-    max_unarrived_targets = chips.LazyField("max_unarrived_targets", lambda m: m._callback_field_current_value('max_unarrived_targets'))
-    min_target_seconds    = chips.LazyField("min_target_seconds", lambda m: m._callback_field_current_value('min_target_seconds'))
-    max_target_seconds    = chips.LazyField("max_target_seconds", lambda m: m._callback_field_current_value('max_target_seconds'))
-    max_travel_distance   = chips.LazyField("max_travel_distance", lambda m: m._callback_field_current_value('max_travel_distance'))
+    # Some of the callbacks depend on the user's capabilities and so these are DependentFields which are
+    # refreshed, and a chip sent, if a capability they read changes. See UserModel.load_dependents.
+    max_unarrived_targets = chips.DependentField("max_unarrived_targets", lambda m: m._callback_field_current_value('max_unarrived_targets'))
+    min_target_seconds    = chips.DependentField("min_target_seconds", lambda m: m._callback_field_current_value('min_target_seconds'))
+    max_target_seconds    = chips.DependentField("max_target_seconds", lambda m: m._callback_field_current_value('max_target_seconds'))
+    max_travel_distance   = chips.DependentField("max_travel_distance", lambda m: m._callback_field_current_value('max_travel_distance'))
 
     # user_id, created and updated are database only fields.
     def __init__(self, rover_id, lander_id, lander_lat, lander_lng, rover_key, activated_at, active,
@@ -115,40 +111,22 @@ class Rover(chips.Model, models.UserChild):
         first target's position.
         at_time is in terms of seconds since user.epoch
         """
-        sorted_targets = self.targets.by_arrival_time()
-        # Search the list to find the two targets with start_times prior to at_time.
-        index = 0
-        for index, target in enumerate(sorted_targets):
-            if (target.start_time > at_time):
-                break
-        # If the currently indexed target still has an earlier start_time than at_time, increment once more.
-        if sorted_targets[index].start_time <= at_time:
-            index += 1
-           
-        current_target = sorted_targets[max(0, index-1)] 
-        prev_target    = sorted_targets[max(0, index-2)]       
-
-        return geometry.interpolate_between_targets(current_target, prev_target, at_time)
+        return self.targets.location_at_time(at_time)
 
     def distance_traveled(self):
         """ Returns the total distance, in meters, this rover has traveled in the game so far.
             This method only considers targets which have been arrived at as of the current gametime. """
-        sorted_targets = self.targets.arrived_at()
-        distance = 0
-        for t in sorted_targets:
-            if t.next() is not None and t.next().has_been_arrived_at():
-                distance += t.straight_distance_between_targets(t.next())
-        return distance
+        arrived_count = len(self.targets.arrived_at())
+        if arrived_count == 0:
+            return 0
+        return self.targets.distance_to_index(arrived_count - 1)
 
     def distance_will_have_traveled(self):
         """ Returns the total distance, in meters, this rover will have traveled in the game so far.
             This method INCLUDES targets which have been created but not yet been arrived at. """
-        sorted_targets = self.targets.by_arrival_time()
-        distance = 0
-        for t in sorted_targets:
-            if t.next() is not None:
-                distance += t.straight_distance_between_targets(t.next())
-        return distance
+        if len(self.targets) == 0:
+            return 0
+        return self.targets.distance_to_index(len(self.targets) - 1)
 
     def mark_inactive(self):
         with db.conn(self.ctx) as ctx:
@@ -256,35 +234,6 @@ class Rover(chips.Model, models.UserChild):
         assert len(capabilities) == 1
         capabilities[0].decrement_uses()
 
-    def capabilities_changing(self):
-        """
-        This is called just before any capability available or unlimited fields are changed.
-        """
-        # Since at least some of the callback derived rover fields depend on capabilities to determine their
-        # values and those fields are lazy, trigger the lazy loaders for all those fields so that we have values
-        # to compare to in capabilities_changed().
-        for field in self.CALLBACK_FIELDS:
-            getattr(self, field)
-
-    def capabilities_changed(self):
-        """
-        This is called whenever any capability available or unlimited fields change.
-        """
-        # Since at least some of the callback derived rover fields depend on capabilities to determine their
-        # values, iterate through every callback field and compare its currently stored value vs. the value
-        # currently being returned by the callback. If the values are different, then call setattr to update
-        # the stored value and then issue a MOD chip if anything changed.
-        values_changed = False
-        for field in self.CALLBACK_FIELDS:
-            current_value = getattr(self, field)
-            callback_value = self._callback_field_current_value(field)
-            if current_value != callback_value:
-                setattr(self, field, callback_value)
-                values_changed = True
-        if values_changed:
-            with db.conn(self.ctx) as ctx:
-                self.send_chips(ctx, self.user)
-
     def _callback_field_current_value(self, field):
         assert field in self.CALLBACK_FIELDS
         return run_callback(ROVER_CB, field, user=self.user, rover=self)
@@ -304,34 +253,82 @@ class Rover(chips.Model, models.UserChild):
     ## Lazy load collection methods.
     def _load_targets(self):
         with db.conn(self.ctx) as ctx:
-            rows = ctx.row_cache.get_rows_from_query("gamestate/select_targets_by_user_id", self.rover_id)
+            rows = ctx.row_cache.get_rows_from_query(self.user.row_cache_name("gamestate/select_targets_by_user_id"), self.rover_id)
             if rows is not None:
                 return rows
             else:
                 return db.rows(ctx, "select_targets_by_rover_id", rover_id=self.rover_id)
 
 class TargetCollection(chips.Collection):
+    """
+    The targets for a rover. The targets sorted by arrival_time are held in an _ArrivalTimeIndex which is
+    built the first time it is needed and then kept up to date as targets are added, deleted or have their
+    arrival_time, start_time or location changed, so that the sorted list, arrived at targets, neighboring targets, the rover's location
+    and distance traveled can be found without sorting or scanning every target.
+    """
     model_class = target.Target
+    _arrival_index = None
+
+    def add(self, model):
+        model = super(TargetCollection, self).add(model)
+        index = self._arrival_index
+        # Nearly every new target arrives after every existing target, in which case the index can
+        # be extended, otherwise it is rebuilt the next time it is needed.
+        if index is not None and not index.append(model):
+            self._arrival_index = None
+        return model
+
+    def delete_child(self, model):
+        super(TargetCollection, self).delete_child(model)
+        # Any image_rects in the deleted target no longer count towards the species detected by the user.
+        tally = self.parent.user.species_tally_if_built()
+        if tally is not None:
+            tally.remove_target(model.target_id)
+        index = self._arrival_index
+        # Targets are aborted newest first, in which case the index can be shortened, otherwise it is
+        # rebuilt the next time it is needed.
+        if index is not None and not index.pop(model):
+            self._arrival_index = None
+
+    def _child_reindex(self, old_id, model):
+        super(TargetCollection, self)._child_reindex(old_id, model)
+        self._arrival_index = None
+
+    def _child_route_changed(self, model):
+        """ Called by one of the targets in the collection to indicate that one of its Target.ROUTE_FIELDS
+            has changed, and thus the index needs to be rebuilt. """
+        self._arrival_index = None
+
+    def _index(self):
+        """ Return the _ArrivalTimeIndex for this collection, building it if needed. """
+        # get_models may lazy load the targets, which is done before the index is built as each
+        # loaded target is passed through add.
+        models = self.get_models()
+        if self._arrival_index is None:
+            self._arrival_index = _ArrivalTimeIndex(models.itervalues())
+        return self._arrival_index
 
     def first(self):
         """ Return the first to be arrived at target. """
-        return self.by_arrival_time()[0]
+        return self._index().targets[0]
 
     def last(self):
         """ Return the last to be arrived at target. """
-        return self.by_arrival_time()[-1]
+        return self._index().targets[-1]
 
     def by_arrival_time(self, newest_first=False):
         """ Return the list of targets for this rover sorted by arrival_time. """
-        return sorted(self.values(), key=lambda t: t.arrival_time, reverse=newest_first)
+        return _ordered(self._index().targets, newest_first)
 
     def arrived_at(self, newest_first=False):
         """ Return the list of arrived at targets for this rover sorted by arrival_time. """
-        return [t for t in self.by_arrival_time(newest_first=newest_first) if t.has_been_arrived_at()]
+        index = self._index()
+        return _ordered(index.targets[:index.arrived_count(self.parent.user.epoch_now)], newest_first)
 
     def unarrived_at(self, newest_first=False):
         """ Return the list of unarrived at targets for this rover sorted by arrival_time. """
-        return [t for t in self.by_arrival_time(newest_first=newest_first) if not t.has_been_arrived_at()]
+        index = self._index()
+        return _ordered(index.targets[index.arrived_count(self.parent.user.epoch_now):], newest_first)
 
     def pictures(self, newest_first=False):
         """ Returns the sorted list of ALL targets which are pictures, regardless of process or
@@ -342,6 +339,22 @@ class TargetCollection(chips.Collection):
         """ Returns the sorted list of all targets which have processed pictures and have been arrived at. """
         return [t for t in self.arrived_at(newest_first=newest_first) if t.is_picture() and t.is_processed()]
 
+    def previous_target(self, target):
+        """ Return the target arrived at before the given target or None if it is the first target. """
+        index = self._index()
+        position = index.position(target)
+        if position == 0:
+            return None
+        return index.targets[position - 1]
+
+    def next_target(self, target):
+        """ Return the target arrived at after the given target or None if it is the last target. """
+        index = self._index()
+        position = index.position(target) + 1
+        if position == len(index.targets):
+            return None
+        return index.targets[position]
+
     def split_on_target(self, target):
         """
         Split the list of sorted targets for this rover using the given target as the pivot.
@@ -350,15 +363,100 @@ class TargetCollection(chips.Collection):
         newer than the given target.
         """
         assert target in self
-        # Count newest targets starting at the end of the list until we find the target
-        # we are working on.
-        sorted_targets = self.by_arrival_time()
-        count = 0
-        for count, current_target in enumerate(reversed(sorted_targets)):
-            if current_target.target_id == target.target_id:
-                break
-        # Slice off any newer targets if there are any.
-        if count > 0:
-            return (sorted_targets[:len(sorted_targets) - count], sorted_targets[-count:])
-        else:
-            return (sorted_targets, [])
+        index = self._index()
+        position = index.position(target) + 1
+        return (index.targets[:position], index.targets[position:])
+
+    def location_at_time(self, at_time):
+        """
+        Returns a tuple with (lat, lng, yaw) for the interpolated position of the rover
+        at the given time. See Rover.location_at_time.
+        """
+        index = self._index()
+        # Find the number of targets, in arrival_time order, before the first target with a start_time
+        # later than at_time.
+        count = index.started_count(at_time)
+        current_target = index.targets[max(0, count-1)]
+        prev_target    = index.targets[max(0, count-2)]
+        return geometry.interpolate_between_targets(current_target, prev_target, at_time)
+
+    def distance_to_index(self, position):
+        """ Returns the distance, in meters, traveled from the first target to the target at the given
+            position in the list of targets sorted by arrival_time. """
+        return self._index().distance_to(position)
+
+def _ordered(targets, newest_first):
+    """ Return a new list of the given sorted targets, reversed if newest_first is True. """
+    if newest_first:
+        return targets[::-1]
+    return list(targets)
+
+class _ArrivalTimeIndex(object):
+    """
+    The targets of a TargetCollection sorted by arrival_time, along with their arrival_time and start_time
+    values so they can be searched with bisect and the running total of the distance between them.
+    Targets with the same arrival_time are kept in the order they were added.
+    """
+    def __init__(self, targets):
+        self.targets = sorted(targets, key=lambda t: t.arrival_time)
+        self.arrival_times = [t.arrival_time for t in self.targets]
+        self.start_times = [t.start_time for t in self.targets]
+        self.positions = dict((t.target_id, i) for i, t in enumerate(self.targets))
+        # A target starts moving once the previous target has been arrived at, so start_times are
+        # expected to be sorted as well, but fall back to a scan if that is not the case.
+        self.start_times_sorted = all(a <= b for a, b in zip(self.start_times, self.start_times[1:]))
+        # distances[i] is the distance traveled from the first target to targets[i], extended as needed.
+        self.distances = []
+
+    def append(self, target):
+        """ Add the given target to the end of the index. Returns False, without changing the index,
+            if the target does not belong at the end. """
+        if self.targets and target.arrival_time < self.arrival_times[-1]:
+            return False
+        if self.start_times and target.start_time < self.start_times[-1]:
+            self.start_times_sorted = False
+        self.positions[target.target_id] = len(self.targets)
+        self.targets.append(target)
+        self.arrival_times.append(target.arrival_time)
+        self.start_times.append(target.start_time)
+        return True
+
+    def pop(self, target):
+        """ Remove the given target from the end of the index. Returns False, without changing the index,
+            if it is not the last target. """
+        if not self.targets or self.targets[-1] is not target:
+            return False
+        del self.positions[target.target_id]
+        self.targets.pop()
+        self.arrival_times.pop()
+        self.start_times.pop()
+        del self.distances[len(self.targets):]
+        return True
+
+    def position(self, target):
+        """ Return the position of the given target in the sorted list of targets. """
+        return self.positions[target.target_id]
+
+    def arrived_count(self, epoch_now):
+        """ Return the number of targets which have been arrived at as of epoch_now. """
+        return bisect.bisect_right(self.arrival_times, epoch_now)
+
+    def started_count(self, at_time):
+        """ Return the number of targets before the first target with a start_time later than at_time. """
+        if self.start_times_sorted:
+            return bisect.bisect_right(self.start_times, at_time)
+        for count, start_time in enumerate(self.start_times):
+            if start_time > at_time:
+                return count
+        return len(self.start_times)
+
+    def distance_to(self, position):
+        """ Return the distance traveled from the first target to the target at the given position. """
+        distances = self.distances
+        while len(distances) <= position:
+            i = len(distances)
+            if i == 0:
+                distances.append(0)
+            else:
+                distances.append(distances[-1] + self.targets[i-1].straight_distance_between_targets(self.targets[i]))
+        return distances[position]
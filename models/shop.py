@@ -64,10 +64,6 @@ class Shop(chips.Model, models.UserChild):
         """ Purchase the given list of product_keys using the provided charge object.
             All of the provided product keys must be present in the available_products collection.
             Returns the Invoice object that encapsulates all purchased products and transactions. """
-        # Be sure all available products are loaded so their availability and price values can be
-        # compared pre and post product purchasing, as they might change and require a chip.
-        self.available_products.available_and_price_prepare_refresh()
-
         # Create the pending invoice and then pay it with the charge, sending any chips.
         with db.conn(self.ctx) as ctx:
             invoice, error = invoice_module.start_pending_invoice_for_products(self.user, product_keys, product_specifics_list)
@@ -77,10 +73,6 @@ class Shop(chips.Model, models.UserChild):
                 return None, error
             invoice.pay_with_charge(ctx, charge)
 
-        # New purchased products means that an available product which is using purchased products to determine
-        # availability state or price might now have new values.
-        self.available_products.available_and_price_refresh()
-
         # Inform the callbacks that this invoice was paid.
         run_callback(SHOP_CB, "invoice_was_paid", ctx=self.ctx, user=self.user, invoice=invoice)
 
@@ -143,7 +135,7 @@ class Shop(chips.Model, models.UserChild):
         products = []
         for product_key in product_module.all_product_definitions():
             if product_module.is_product_available(product_key, self.user):
-                products.append(product_module.AvailableProduct(product_key=product_key, user=self.user))
+                products.append(product_module.AvailableProduct(product_key=product_key))
         return products
 
     def _load_purchased_products(self):
@@ -154,29 +146,11 @@ class Shop(chips.Model, models.UserChild):
 class AvailableProductCollection(chips.Collection):
     model_class = product_module.AvailableProduct
 
-    def available_and_price_prepare_refresh(self):
-        """
-        Call this before making any gamestate changes which might show up when available_and_price_refresh
-        is called. e.g. a purchase which would change the available or the price values of an available product.
-        This forces all of the available products to be lazy loaded and get their 'current' available
-        and price values so any changes can be tracked and chips sent.
-        """
-        len(self)
-
-    def available_and_price_refresh(self):
-        """
-        Call this after making any gamestate changes which might change the availability or price
-        value of an available product. e.g. a purchase was made.
-        NOTE: Be sure to call available_and_price_prepare_refresh before making any of the
-        relevant gamestate changes so that all available products have been lazy loaded and any changes
-        can be tracked and chips sent.
-        """
-        # Copy the values as elements might be deleted/made not available during the iteration.
-        for p in self.values():
-            p.available_and_price_refresh()
-
 class PurchasedProductCollection(chips.Collection):
     model_class = product_module.PurchasedProduct
+    # Which products are available, and their prices, depend on the purchased products.
+    track_dependents = True
+    tracked_fields = frozenset()
 
     def by_product_key(self, product_key):
         """
@@ -0,0 +1,155 @@
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+A per-user tally of the species and subspecies identified in the image_rects of the user's picture targets.
+
+The tally is built by walking every rover, target and image_rect once (see UserModel.species_tally) and is
+then kept up to date by the ImageRectCollection and TargetCollection of each target and rover as image_rects
+are added, reclassified or deleted. This allows the aggregate species counts, and the target_ids and
+subspecies_ids needed by the Species model, and the image_rects which identified a given species to be found without walking the entire gamestate again.
+"""
+from collections import Counter
+
+from front.models.image_rect import NO_SUBSPECIES
+
+# If True, every time the tally is used it is compared to a tally built by walking the full gamestate and an
+# exception is raised if they differ. This is meant to be enabled when running the unit tests.
+VERIFY = False
+
+class SpeciesTally(object):
+    """ The counts of species and subspecies detected in a user's image_rects. """
+    def __init__(self):
+        # Maps (target_id, seq) for every image_rect in a picture target to a (rover_id, species_id, subspecies_id)
+        # tuple, so that adding an image_rect which is already in the tally replaces it.
+        self._rects = {}
+        # Maps target_id to the set of seq values for that target's image_rects.
+        self._seqs_by_target = {}
+        # species_id -> count of image_rects identifying that species.
+        self._species = Counter()
+        # subspecies_id -> Counter of species_id -> count of image_rects identifying that species and subspecies.
+        self._species_by_subspecies = {}
+        # species_id -> Counter of subspecies_id -> count of image_rects identifying that species and subspecies.
+        self._subspecies_by_species = {}
+        # species_id -> Counter of (rover_id, target_id) -> count of image_rects in that target identifying that species.
+        self._targets_by_species = {}
+        # species_id -> set of (rover_id, target_id, seq) for every image_rect identifying that species.
+        self._rects_by_species = {}
+        # The number of image_rects which identified at least one species.
+        self._rects_with_species = 0
+
+    @classmethod
+    def from_user(cls, user):
+        """ Build a new tally by walking every image_rect in every picture target for the given user. """
+        tally = cls()
+        for rover in user.rovers.itervalues():
+            for target in rover.targets.itervalues():
+                if not target.picture:
+                    continue
+                for image_rect in target.image_rects.itervalues():
+                    tally.add_rect(rover.rover_id, target.target_id, image_rect)
+        return tally
+
+    def __eq__(self, other):
+        return isinstance(other, SpeciesTally) and self._state() == other._state()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _state(self):
+        return (self._rects, self._seqs_by_target, self._species, self._species_by_subspecies,
+                self._subspecies_by_species, self._targets_by_species, self._rects_by_species,
+                self._rects_with_species)
+
+    def add_rect(self, rover_id, target_id, image_rect):
+        """ Add the given image_rect to the tally, replacing it if it has already been added. """
+        self.remove_rect(target_id, image_rect.seq)
+        species_id, subspecies_id = image_rect.species_id, image_rect.subspecies_id
+        self._rects[(target_id, image_rect.seq)] = (rover_id, species_id, subspecies_id)
+        self._seqs_by_target.setdefault(target_id, set()).add(image_rect.seq)
+        if species_id is not None:
+            self._rects_with_species += 1
+            self._species[species_id] += 1
+            self._species_by_subspecies.setdefault(subspecies_id, Counter())[species_id] += 1
+            self._subspecies_by_species.setdefault(species_id, Counter())[subspecies_id] += 1
+            self._targets_by_species.setdefault(species_id, Counter())[(rover_id, target_id)] += 1
+            self._rects_by_species.setdefault(species_id, set()).add((rover_id, target_id, image_rect.seq))
+
+    def remove_rect(self, target_id, seq):
+        """ Remove the image_rect with the given seq in the given target from the tally, if it was added. """
+        entry = self._rects.pop((target_id, seq), None)
+        if entry is None:
+            return
+        seqs = self._seqs_by_target[target_id]
+        seqs.discard(seq)
+        if not seqs:
+            del self._seqs_by_target[target_id]
+        rover_id, species_id, subspecies_id = entry
+        if species_id is not None:
+            self._rects_with_species -= 1
+            _decrement(self._species, species_id)
+            _decrement_nested(self._species_by_subspecies, subspecies_id, species_id)
+            _decrement_nested(self._subspecies_by_species, species_id, subspecies_id)
+            _decrement_nested(self._targets_by_species, species_id, (rover_id, target_id))
+            keys = self._rects_by_species[species_id]
+            keys.discard((rover_id, target_id, seq))
+            if not keys:
+                del self._rects_by_species[species_id]
+
+    def remove_target(self, target_id):
+        """ Remove every image_rect in the given target from the tally. """
+        for seq in list(self._seqs_by_target.get(target_id, ())):
+            self.remove_rect(target_id, seq)
+
+    def species_count(self, only_subspecies_id=None):
+        """ Returns a new Counter of the number of image_rects each species_id was detected in.
+            See UserModel.species_count. """
+        if only_subspecies_id is None:
+            return Counter(self._species)
+        return Counter(self._species_by_subspecies.get(only_subspecies_id, {}))
+
+    def subspecies_count_for_species(self, species_id):
+        """ Returns a new Counter of the number of image_rects each subspecies_id was detected in for the
+            given species_id. See UserModel.subspecies_count_for_species. """
+        return Counter(self._subspecies_by_species.get(species_id, {}))
+
+    def subspecies_ids(self, species_id):
+        """ Returns the set of subspecies_ids detected for the given species_id, not including NO_SUBSPECIES. """
+        return set(s for s in self._subspecies_by_species.get(species_id, {}) if s is not None and s != NO_SUBSPECIES)
+
+    def target_ids(self, species_id):
+        """ Returns the set of (rover_id, target_id) tuples for the targets the given species_id was detected in. """
+        return set(self._targets_by_species.get(species_id, {}))
+
+    def image_rect_keys(self, species_id=None):
+        """ Returns a list of (rover_id, target_id, seq) tuples for every image_rect which identified the given
+            species_id, or for every image_rect in all picture targets if species_id is None. """
+        if species_id is None:
+            return [(rover_id, target_id, seq) for (target_id, seq), (rover_id, s_id, ss_id) in self._rects.iteritems()]
+        return list(self._rects_by_species.get(species_id, ()))
+
+    def rect_count(self):
+        """ Returns the number of image_rects in all picture targets. """
+        return len(self._rects)
+
+    def rect_with_species_count(self):
+        """ Returns the number of image_rects in all picture targets which identified at least one species. """
+        return self._rects_with_species
+
+    def verify(self, user):
+        """ Raise an exception if this tally differs from one built by walking the full gamestate. """
+        expected = SpeciesTally.from_user(user)
+        if self != expected:
+            missing = set(expected._rects.items()).difference(self._rects.items())
+            stale = set(self._rects.items()).difference(expected._rects.items())
+            raise Exception("Species tally is out of date [%s] missing %s stale %s" % (user.user_id, missing, stale))
+
+def _decrement(counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+def _decrement_nested(counters, outer_key, key):
+    counter = counters[outer_key]
+    _decrement(counter, key)
+    if not counter:
+        del counters[outer_key]
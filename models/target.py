@@ -152,8 +152,8 @@ def create_new_target(ctx, rover, user_created=0, scene=None, _target_id=None, *
             # The subtype for the deferred event is a string representation of the target_id UUID.
             target_id_subtype = str(t.target_id).replace('-', '')
             # Only allow one target_arrived deferred per target_id
-            if not deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TARGET_ARRIVED, target_id_subtype, rover.user):
-                deferred.run_later(ctx, deferred.types.TARGET_ARRIVED, target_id_subtype, rover.user, delay)
+            deferred.run_later(ctx, deferred.types.TARGET_ARRIVED, target_id_subtype, rover.user, delay,
+                               dedup=deferred.dedup.IF_NOT_QUEUED)
         # NOTE: If this is a non user created target (like initial rover targets and photos created by the system)
         # that was arrived at in the PAST then NO arrived_at_target event will be fire.
     return t
@@ -163,6 +163,8 @@ class TargetRow(object):
         having access to the 'basic' target database data: all the targets table fields as well as the images and
         metadata dictionaries. It does not depend on being in the rover targets collection, therefore it cannot
         depend on a 'parent' property nor can it depend on having a 'sounds' or 'image_rects' collection. """
+    __slots__ = ()
+
     @property
     def url_image_thumbnail(self):
         return self._image_url(target_image_types.THUMB)
@@ -238,6 +240,8 @@ class Target(chips.Model, TargetRow, models.UserChild):
     server_only_fields = frozenset(['user_id', 'rover_id', 'user_created', 'neutered', 'seq', 'locked_at', 'render_at'])
     # A target metadata key prefix that should only be visible on the server. (renderer bookkeeping data)
     server_only_metadata_key_prefix = 'TGT_RDR_'
+    # The fields held in the rover's TargetCollection index, see rover._ArrivalTimeIndex.
+    ROUTE_FIELDS = frozenset(['start_time', 'arrival_time', 'lat', 'lng'])
 
     images = chips.LazyField("images",  lambda m: m._load_images())
     metadata = chips.LazyField("metadata", lambda m: m._load_target_metadata())
@@ -267,22 +271,18 @@ class Target(chips.Model, TargetRow, models.UserChild):
     def previous(self):
         """ Return the previous/earlier target or None if this is the first target.
             NOTE: This currently only traverses the targets for this target's rover, not all rover's targets. """
-        targets = self.rover.targets.by_arrival_time()
-        index_prev = targets.index(self) - 1
-        if index_prev < 0:
-            return None
-        else:
-            return targets[index_prev]
+        return self.rover.targets.previous_target(self)
 
     def next(self):
         """ Return the next/later target to this one or None if this is the last target.
             NOTE: This currently only traverses the targets for this target's rover, not all rover's targets. """
-        targets = self.rover.targets.by_arrival_time()
-        index_next = targets.index(self) + 1
-        if index_next > (len(targets) - 1):
-            return None
-        else:
-            return targets[index_next]
+        return self.rover.targets.next_target(self)
+
+    def _set_attr(self, silent, **kw):
+        super(Target, self)._set_attr(silent, **kw)
+        # If this target is in a rover's targets collection, inform it that the target has moved.
+        if self._parent is not None and not self.ROUTE_FIELDS.isdisjoint(kw):
+            self._parent._child_route_changed(self)
 
     def traverses_region(self, region):
         """ Returns True if this target traverses the given RegionGeometry object. """
@@ -433,10 +433,7 @@ class Target(chips.Model, TargetRow, models.UserChild):
         detected in all targets for this user.
         :param only_subspecies_id: int, if included, limit counts to this subspecies type.
         '''
-        count = Counter()
-        for image_rect in self.image_rects.itervalues():
-            count += image_rect.species_count(only_subspecies_id=only_subspecies_id)
-        return count
+        return self.image_rects.species_count(only_subspecies_id=only_subspecies_id)
 
     def subspecies_count_for_species(self, species_id):
         '''
@@ -444,10 +441,7 @@ class Target(chips.Model, TargetRow, models.UserChild):
         observed for the indicated species.
         :param species_id: int, the id of the species that we're interested in.
         '''
-        count = Counter()
-        for image_rect in self.image_rects.itervalues():
-            count += image_rect.subspecies_count_for_species(species_id=species_id)
-        return count
+        return self.image_rects.subspecies_count_for_species(species_id)
 
     def detected_species_in_rects(self, detected_species, detected_subspecies, rect_scores):
         """ Called when species have been detected in this target. Any chips required to update the
@@ -594,7 +588,7 @@ class Target(chips.Model, TargetRow, models.UserChild):
 
     def _load_target_sounds(self):
         with db.conn(self.ctx) as ctx:
-            rows = ctx.row_cache.get_rows_from_query("gamestate/select_target_sounds_by_user_id", self.target_id)
+            rows = ctx.row_cache.get_rows_from_query(self.user.row_cache_name("gamestate/select_target_sounds_by_user_id"), self.target_id)
             if rows is not None:
                 return rows
             else:
@@ -602,7 +596,7 @@ class Target(chips.Model, TargetRow, models.UserChild):
 
     def _load_image_rects(self):
         with db.conn(self.ctx) as ctx:
-            rows = ctx.row_cache.get_rows_from_query("gamestate/select_target_image_rects_by_user_id", self.target_id)
+            rows = ctx.row_cache.get_rows_from_query(self.user.row_cache_name("gamestate/select_target_image_rects_by_user_id"), self.target_id)
             if rows is not None:
                 return rows
             else:
@@ -614,14 +608,14 @@ class Target(chips.Model, TargetRow, models.UserChild):
         single dict of the form:  {'PHOTO':'http:////', 'SPECIES'...}
         """
         with db.conn(self.ctx) as ctx:
-            rows = ctx.row_cache.get_rows_from_query("gamestate/select_target_images_by_user_id", self.target_id)
+            rows = ctx.row_cache.get_rows_from_query(self.user.row_cache_name("gamestate/select_target_images_by_user_id"), self.target_id)
             if rows is None:
                 rows = db.rows(ctx, "select_target_images", target_id=self.target_id)
         return dict(((r['type'], r['url']) for r in rows))
 
     def _load_target_metadata(self):
         with db.conn(self.ctx) as ctx:
-            rows = ctx.row_cache.get_rows_from_query("gamestate/select_target_metadata_by_user_id", self.target_id)
+            rows = ctx.row_cache.get_rows_from_query(self.user.row_cache_name("gamestate/select_target_metadata_by_user_id"), self.target_id)
             if rows is None:
                 rows = db.rows(ctx, "select_target_metadata", target_id=self.target_id)
         return dict(((r['key'], r['value']) for r in rows))
@@ -630,12 +624,91 @@ class TargetSoundCollection(chips.Collection):
     model_class = target_sound.TargetSound
 
 class ImageRectCollection(chips.Collection):
+    """ The image_rects for a target. The collection keeps the next seq to assign and an index of its
+        image_rects by species_id as they are added, reclassified or deleted. Any changes to the image_rects
+        are also passed on to the user's SpeciesTally if it has been built. """
     model_class = image_rect.ImageRect
 
+    def __init__(self, name, *model_args):
+        # seq -> species_id for every image_rect in the collection.
+        self._species_by_seq = {}
+        # species_id -> dict of seq -> image_rect for every image_rect which identified that species.
+        self._rects_by_species = {}
+        # One more than the largest seq in the collection.
+        self._next_seq = 0
+        super(ImageRectCollection, self).__init__(name, *model_args)
+
+    def add(self, model):
+        model = super(ImageRectCollection, self).add(model)
+        self._next_seq = max(self._next_seq, model.seq + 1)
+        self._child_species_changed(model)
+        return model
+
+    def delete_child(self, model):
+        super(ImageRectCollection, self).delete_child(model)
+        self._unindex(model.seq)
+        if model.seq == self._next_seq - 1:
+            self._next_seq = max(self._species_by_seq.keys() or [-1]) + 1
+        tally = self._species_tally()
+        if tally is not None:
+            tally.remove_rect(self.parent.target_id, model.seq)
+
+    def _child_species_changed(self, model):
+        """ Called when an image_rect is added to this collection or one of its species fields has changed. """
+        self._unindex(model.seq)
+        self._species_by_seq[model.seq] = model.species_id
+        if model.species_id is not None:
+            self._rects_by_species.setdefault(model.species_id, {})[model.seq] = model
+        tally = self._species_tally()
+        if tally is not None and self.parent.picture:
+            target = self.parent
+            tally.add_rect(target.rover.rover_id, target.target_id, model)
+
+    def _unindex(self, seq):
+        """ Remove the image_rect with the given seq from the species index, if it was indexed. """
+        if seq not in self._species_by_seq:
+            return
+        species_id = self._species_by_seq.pop(seq)
+        if species_id is not None:
+            rects = self._rects_by_species[species_id]
+            del rects[seq]
+            if not rects:
+                del self._rects_by_species[species_id]
+
+    def _species_tally(self):
+        target = self.parent
+        # A target which is not yet in a rover's targets collection has no user.
+        if target is None or target.parent is None:
+            return None
+        return target.user.species_tally_if_built()
+
+    def rects_for_species(self, species_id):
+        """ Returns a list of the image_rects in this collection which identified the given species_id. """
+        self.load()
+        return self._rects_by_species.get(species_id, {}).values()
+
+    def species_count(self, only_subspecies_id=None):
+        """ Returns a Counter of the number of image_rects in this collection each species_id was detected in.
+            See Target.species_count. """
+        self.load()
+        count = Counter()
+        for species_id, rects in self._rects_by_species.iteritems():
+            if only_subspecies_id is None:
+                count[species_id] = len(rects)
+            else:
+                matching = sum(1 for r in rects.itervalues() if r.subspecies_id == only_subspecies_id)
+                if matching > 0:
+                    count[species_id] = matching
+        return count
+
+    def subspecies_count_for_species(self, species_id):
+        """ Returns a Counter of the number of image_rects in this collection each subspecies_id was observed
+            in for the given species_id. See Target.subspecies_count_for_species. """
+        return Counter(r.subspecies_id for r in self.rects_for_species(species_id))
+
     def next_seq(self):
         """ Returns the next seq value to assign to a new image rect in this collection. """
-        for i in range(0, len(self)):
-            # Assert that each seq is assigned in order and there are no gaps.
-            assert i in self
-        # Return the next valid seq, which we now know is the next 0-based index value.
-        return (len(self) - 1) + 1
+        self.load()
+        # Assert that each seq is assigned in order and there are no gaps.
+        assert self._next_seq == len(self._species_by_seq)
+        return self._next_seq
@@ -9,7 +9,7 @@ from collections import Counter
 from front import Constants, activity_alert_types, species_types, models
 from front.lib import db, get_uuid, gametime, utils, secure_tokens, urls
 from front.models import chips, rover, mission, message, species, progress
-from front.models import achievement, capability, voucher, maptile, invite, gift, shop
+from front.models import achievement, capability, voucher, maptile, invite, gift, shop, species_tally
 from front.models import region as region_module
 from front.callbacks import run_callback, USER_CB
 
@@ -22,6 +22,55 @@ RESET_NAMESPACE          = "extrasolar.tokens.password_reset"
 UNSUBSCRIBE_NAMESPACE    = "extrasolar.tokens.unsubscribe"
 RESET_EXPIRE       = utils.in_seconds(days=3)
 
+# The queries which load the UserModel lazy fields and collections, grouped into the parts which can be passed
+# to UserModel.load_row_cache. Each query is a (query_name, key_func, args_func) tuple. args_func is passed the
+# UserModel and returns the named query parameters. key_func is passed each row and returns the key parts used to
+# look the rows up in the row cache (see db._RowCache), the empty list meaning all rows are looked up together.
+_ALL_ROWS = lambda r: []
+_BY_USER_ID = lambda u: {'user_id': u.user_id}
+BULK_LOAD_PARTS = {
+    'attributes':    [("get_user_row", _ALL_ROWS, _BY_USER_ID)],
+    'metadata':      [("select_user_metadata", _ALL_ROWS, _BY_USER_ID)],
+    'notifications': [("notifications/get_users_notification_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'shop':          [("shop/get_user_shop", _ALL_ROWS, _BY_USER_ID)],
+    'rovers':        [("select_rovers_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    # Every target for every rover, and the target collections and lazy fields, see Rover and Target.
+    'targets':       [("gamestate/select_targets_by_user_id", lambda r: [get_uuid(r['rover_id'])], _BY_USER_ID),
+                      ("gamestate/select_target_sounds_by_user_id", lambda r: [get_uuid(r['target_id'])], _BY_USER_ID),
+                      ("gamestate/select_target_image_rects_by_user_id", lambda r: [get_uuid(r['target_id'])], _BY_USER_ID),
+                      ("gamestate/select_target_images_by_user_id", lambda r: [get_uuid(r['target_id'])], _BY_USER_ID),
+                      ("gamestate/select_target_metadata_by_user_id", lambda r: [get_uuid(r['target_id'])], _BY_USER_ID)],
+    'messages':      [("select_messages_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'missions':      [("select_missions_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'species':       [("select_species_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'progress':      [("select_progress_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'achievements':  [("select_achievements_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'capabilities':  [("select_capabilities_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'vouchers':      [("select_vouchers_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    # The current map_tiles are filtered from all of the map tiles, see _load_map_tiles.
+    'map_tiles':     [("select_all_user_map_tiles_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'all_map_tiles': [("select_all_user_map_tiles_by_user_id", _ALL_ROWS, _BY_USER_ID)],
+    'invitations':   [("select_invites_by_user_id", _ALL_ROWS, lambda u: {'sender_id': u.user_id})],
+    'gifts':         [("select_gifts_by_creator_id", _ALL_ROWS, lambda u: {'creator_id': u.user_id}),
+                      ("select_gifts_by_redeemer_id", _ALL_ROWS, lambda u: {'redeemer_id': u.user_id})],
+    # The deferred_type and subtype of every queued deferred action, see pending_deferreds.
+    'deferreds':     [("deferred/select_pending_deferred_by_user_id", _ALL_ROWS, _BY_USER_ID)]
+}
+# Named sets of BULK_LOAD_PARTS, one for each kind of request which reads most of a user's data.
+BULK_LOAD_PRESETS = {
+    # Everything in UserModel.to_struct.
+    'gamestate':      ['attributes', 'notifications', 'shop', 'rovers', 'targets', 'messages', 'missions', 'species',
+                       'progress', 'achievements', 'capabilities', 'vouchers', 'map_tiles', 'invitations'],
+    # Everything in renderer.process_target_struct.
+    'renderer':       ['attributes', 'rovers', 'targets'],
+    # Everything in the activity and lure alert digests, see backend.activity.
+    'notifications':  ['attributes', 'notifications', 'rovers', 'targets', 'messages', 'missions', 'species',
+                       'achievements'],
+    # The collections most callbacks read when running deferred actions, see backend.deferred.
+    'callbacks-only': ['attributes', 'metadata', 'messages', 'missions', 'progress', 'achievements', 'capabilities',
+                       'vouchers', 'deferreds']
+}
+
 def user_from_request(request):
     """
     Factory function to load a UserModel instance from a Request object. The session will
@@ -203,6 +252,8 @@ class UserModel(chips.Model):
                              'capabilities', 'vouchers', 'map_tiles', 'invitations', 'gifts_created', 'gifts_redeemed'])
     # The gifts_created and gifts_redeemed collections are server only for now.
     server_only_fields = frozenset(['user_id', 'last_accessed', 'gifts_created', 'gifts_redeemed'])
+    # Instance attributes other than fields, see chips.FieldedClass.
+    __slots__ = ('_ctx', '_user_attributes', '_species_tally')
 
     email            = chips.LazyField("email",             lambda m: m._load_user_attributes()['email'])
     first_name       = chips.LazyField("first_name",        lambda m: m._load_user_attributes()['first_name'])
@@ -226,12 +277,16 @@ class UserModel(chips.Model):
     all_map_tiles    = chips.LazyField("all_map_tiles",     lambda m: m._load_all_map_tiles())
     # Not a chips.Collection, just a lazy loaded server side only dict.
     metadata         = chips.LazyField("metadata",          lambda m: m._load_user_metadata())
+    # Not a chips.Collection, a lazy loaded server side only Counter of (deferred_type, subtype) for every
+    # deferred action queued for this user, kept up to date by backend.deferred.
+    pending_deferreds = chips.LazyField("pending_deferreds", lambda m: m._load_pending_deferreds())
     # Never send the password_hash to the client or put in the gamestate.
     password_hash    = chips.LazyField("password_hash",     lambda m: m._load_password_hash())
     # This loads from the users_notification table.
     activity_alert_frequency = chips.LazyField("activity_alert_frequency", lambda m: m._load_activity_alert_frequency())
     # Set the current_voucher_level (a voucher_key) based on current state of user's vouchers collection.
-    current_voucher_level = chips.LazyField("current_voucher_level", lambda m: m._load_current_voucher_level())
+    # This is refreshed, and a chip sent, whenever the vouchers collection changes.
+    current_voucher_level = chips.DependentField("current_voucher_level", lambda m: m._load_current_voucher_level())
     # Load the singleton Store model object.
     shop             = chips.LazyField("shop", lambda m: m._load_shop())
 
@@ -255,6 +310,8 @@ class UserModel(chips.Model):
         self._ctx = ctx
         # Used to cache lazy loaded user attributes from a database row.
         self._user_attributes = None
+        # Built the first time it is needed, see species_tally.
+        self._species_tally = None
 
     @property
     def ctx(self):
@@ -414,6 +471,25 @@ class UserModel(chips.Model):
         with db.conn(self.ctx) as ctx:
             db.run(ctx, 'delete_users_metadata', user_id=self.user_id, key=key)
     
+    def pending_deferred_added(self, deferred_type, subtype, dedup=False):
+        """ Called by backend.deferred when a deferred action is queued for this user. If dedup is True the
+            action was only queued if none with the same deferred_type and subtype was, see deferred.run_later. """
+        # If the pending deferreds have not been loaded yet they will include this action when they are.
+        if not hasattr(self, '_pending_deferreds'):
+            return
+        key = (deferred_type, subtype)
+        if dedup and self.pending_deferreds[key] > 0:
+            return
+        self.pending_deferreds[key] += 1
+
+    def pending_deferred_removed(self, deferred_type, subtype):
+        """ Called by backend.deferred when a deferred action queued for this user is deleted. """
+        if not hasattr(self, '_pending_deferreds'):
+            return
+        key = (deferred_type, subtype)
+        if self.pending_deferreds[key] > 0:
+            self.pending_deferreds[key] -= 1
+
     def has_target_with_metadata_key(self, key):
         with db.conn(self.ctx) as ctx:
             r = db.row(ctx, 'count_targets_with_metadata_key', metadata_key=key, user_id=self.user_id)
@@ -470,24 +546,18 @@ class UserModel(chips.Model):
         self.invites_left = new_invites_left # Make our state mirror the database's
         self.send_chips(self.ctx, self)
 
-    def current_voucher_level_prepare_refresh(self):
+    def load_dependents(self, collection):
         """
-        Call this method anytime current_voucher_level's value might have changed, for instanceif a new
-        voucher was delivered. See current_voucher_level_refresh.
-        """
-        self.current_voucher_level
-
-    def current_voucher_level_refresh(self):
+        Load the DependentFields in the gamestate before the given collection changes, so that a chip can be
+        sent if their values change. See chips.DependentField.
         """
-        Update the lazy current_voucher_level field if it has changed and send a MOD chip.
-        Call this method anytime this field's value might have changed, for instance if a new voucher was delivered.
-        Call current_voucher_level_prepare_refresh before calling this method.
-        """
-        callback_value = run_callback(USER_CB, "user_current_voucher_level", ctx=self.ctx, user=self)
-        if callback_value != self.current_voucher_level:
-            self.current_voucher_level = callback_value
-            with db.conn(self.ctx) as ctx:
-                self.send_chips(ctx, self)
+        self.load_dependent_fields(collection)
+        for r in self.rovers.itervalues():
+            r.load_dependent_fields(collection)
+        for c in self.capabilities.itervalues():
+            c.load_dependent_fields(collection)
+        for p in self.shop.available_products.itervalues():
+            p.load_dependent_fields(collection)
 
     def modify_struct(self, struct, is_full_struct):
         if is_full_struct:
@@ -497,26 +567,51 @@ class UserModel(chips.Model):
             }
         return struct
 
-    def load_gamestate_row_cache(self):
+    def load_row_cache(self, *parts):
         """
-        Ask the user object to load and cache all of the gamestate data so that only a few
-        queries are executed instead of a large number of queries for every collection lazy loader.
+        Load the data for the given BULK_LOAD_PRESETS and/or BULK_LOAD_PARTS names in a single round trip to the
+        database, so that the lazy loaders for those fields and collections do not each execute their own queries.
         For example, targets have 4 collection like fields, each of which executes a query, so as the number
         of targets in the gamestate grows, the number of queries multiply by 4 (at least).
-        The results are cached in u.ctx.row_cache and used in the lazy loader functions.
+        The results are cached in u.ctx.row_cache (see row_cache_name) and used in the lazy loader functions.
+        The row cache is cleared by any database write or commit, so this should be called before this user's
+        data is modified, after which the lazy loaders go back to executing their own queries.
         """
+        names = []
+        for part in parts:
+            for name in BULK_LOAD_PRESETS.get(part, [part]):
+                if name not in names:
+                    names.append(name)
+        loads = []
+        for name in names:
+            for query_name, key_func, args_func in BULK_LOAD_PARTS[name]:
+                cache_name = self.row_cache_name(query_name)
+                if cache_name not in (l[0] for l in loads):
+                    loads.append((cache_name, key_func, query_name, args_func(self)))
         # Be sure the ctx is wrapped so there is a row_cache.
         with db.conn(self.ctx) as ctx:
-            ctx.row_cache.set_rows_from_query(ctx, lambda r: [get_uuid(r['rover_id'])],
-                                              "gamestate/select_targets_by_user_id", user_id=self.user_id)
-            ctx.row_cache.set_rows_from_query(ctx, lambda r: [get_uuid(r['target_id'])],
-                                              "gamestate/select_target_sounds_by_user_id", user_id=self.user_id)
-            ctx.row_cache.set_rows_from_query(ctx, lambda r: [get_uuid(r['target_id'])],
-                                              "gamestate/select_target_image_rects_by_user_id", user_id=self.user_id)
-            ctx.row_cache.set_rows_from_query(ctx, lambda r: [get_uuid(r['target_id'])],
-                                              "gamestate/select_target_images_by_user_id", user_id=self.user_id)
-            ctx.row_cache.set_rows_from_query(ctx, lambda r: [get_uuid(r['target_id'])],
-                                              "gamestate/select_target_metadata_by_user_id", user_id=self.user_id)
+            ctx.row_cache.set_rows_from_queries(ctx, loads)
+
+    def row_cache_name(self, query_name):
+        """ The name the rows loaded for this user by the given BULK_LOAD_PARTS query are cached under. The name
+            is specific to this user as rows are often cached for more than one user in the same context. """
+        return "%s:%s" % (query_name, self.user_id)
+
+    @property
+    def species_tally(self):
+        """ The SpeciesTally of all the species detected in this user's image_rects. This is built by walking
+            every rover, target and image_rect the first time it is needed, loading them if required, and then
+            kept up to date as image_rects are added or change. """
+        if self._species_tally is None:
+            self._species_tally = species_tally.SpeciesTally.from_user(self)
+        elif species_tally.VERIFY:
+            self._species_tally.verify(self)
+        return self._species_tally
+
+    def species_tally_if_built(self):
+        """ Return the SpeciesTally for this user if it has been built, otherwise None. Used by the collections
+            which keep the tally up to date, as there is nothing to update before it is built. """
+        return self._species_tally
 
     def species_count(self, only_subspecies_id=None):
         '''
@@ -524,13 +619,7 @@ class UserModel(chips.Model):
         detected in all targets for this user.
         :param only_subspecies_id: int, if included, limit counts to this subspecies type.
         '''
-        count = Counter()
-        for rover in self.rovers.itervalues():
-            for target in rover.targets.itervalues():
-                if not target.picture:
-                    continue
-                count += target.species_count(only_subspecies_id=only_subspecies_id)
-        return count
+        return self.species_tally.species_count(only_subspecies_id=only_subspecies_id)
 
     def subspecies_count_for_species(self, species_id):
         '''
@@ -538,13 +627,7 @@ class UserModel(chips.Model):
         observed for the indicated species.
         :param species_id: int, the id of the species that we're interested in.
         '''
-        count = Counter()
-        for rover in self.rovers.itervalues():
-            for target in rover.targets.itervalues():
-                if not target.picture:
-                    continue
-                count += target.subspecies_count_for_species(species_id=species_id)
-        return count
+        return self.species_tally.subspecies_count_for_species(species_id)
 
     def all_picture_targets(self, user_created_only=False):
         """ Returns a list of all targets with pictures for this user, processed or not, arrived at or not,
@@ -567,15 +650,23 @@ class UserModel(chips.Model):
         return sorted(pictures, key=lambda t: t.arrival_time, reverse=True)
 
     def all_image_rects(self):
-        """ Returns a list of all image_rects captured by this user. """
+        """ Returns a list of all image_rects captured by this user, in no particular order. """
+        return self._image_rects_from_keys(self.species_tally.image_rect_keys())
+
+    def all_image_rects_with_species(self):
+        """ Returns a list of all image_rects that identified at least one species, in no particular order. """
         rects = []
-        for t in self.all_picture_targets():
-            rects += t.image_rects.values()
+        for species_id in self.species_tally.species_count():
+            rects += self.image_rects_for_species(species_id)
         return rects
 
-    def all_image_rects_with_species(self):
-        """ Returns a list of all image_rects that identified at least one species. """
-        return [r for r in self.all_image_rects() if r.has_species()]
+    def image_rects_for_species(self, species_id):
+        """ Returns a list of all image_rects that identified the given species_id, in no particular order. """
+        return self._image_rects_from_keys(self.species_tally.image_rect_keys(species_id))
+
+    def _image_rects_from_keys(self, keys):
+        """ Returns the image_rects for the given (rover_id, target_id, seq) tuples from the SpeciesTally. """
+        return [self.rovers[rover_id].targets[target_id].image_rects[seq] for rover_id, target_id, seq in keys]
 
     def get_edmodo_teacher_credentials(self):
         """ In order for a user to be authorized to access classroom data, they must be
@@ -678,18 +769,39 @@ class UserModel(chips.Model):
         return round(self.total_distance_traveled(), 1)
     ## End Public Profile Methods.
 
+    ## Lazy load helper methods.
+    def _cached_rows(self, query_name, **args):
+        """ Return the rows for one of the BULK_LOAD_PARTS queries, from the row cache if load_row_cache
+            loaded them, otherwise by running the query. """
+        with db.conn(self.ctx) as ctx:
+            rows = ctx.row_cache.get_rows_from_query(self.row_cache_name(query_name))
+            if rows is None:
+                rows = db.rows(ctx, query_name, **args)
+        return rows
+
+    def _cached_row(self, query_name, **args):
+        """ The same as _cached_rows but for queries which return exactly one row, as db.row. """
+        with db.conn(self.ctx) as ctx:
+            rows = ctx.row_cache.get_rows_from_query(self.row_cache_name(query_name))
+            if rows is not None and len(rows) == 1:
+                return rows[0]
+            # Let db.row raise the same exception as it would without the cache.
+            return db.row(ctx, query_name, **args)
+
     ## Lazy load attribute methods.
     def _load_user_attributes(self):
         if self._user_attributes is None:
-            with db.conn(self.ctx) as ctx:
-                self._user_attributes = db.row(ctx, "get_user_row", user_id=self.user_id)
+            self._user_attributes = self._cached_row("get_user_row", user_id=self.user_id)
         return self._user_attributes
 
     def _load_user_metadata(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, "select_user_metadata", user_id=self.user_id)
+        rows = self._cached_rows("select_user_metadata", user_id=self.user_id)
         return dict(((r['key'], r['value']) for r in rows))
 
+    def _load_pending_deferreds(self):
+        rows = self._cached_rows("deferred/select_pending_deferred_by_user_id", user_id=self.user_id)
+        return Counter((r['deferred_type'], r['subtype']) for r in rows)
+
     def _load_password_hash(self):
         if self.auth == "PASS":
             with db.conn(self.ctx) as ctx:
@@ -699,9 +811,8 @@ class UserModel(chips.Model):
             return None
 
     def _load_activity_alert_frequency(self):
-        with db.conn(self.ctx) as ctx:
-            r = db.row(ctx, 'notifications/get_users_notification_by_user_id', user_id=self.user_id)
-            return r['activity_alert_frequency']
+        r = self._cached_row('notifications/get_users_notification_by_user_id', user_id=self.user_id)
+        return r['activity_alert_frequency']
 
     def _load_inviter_attributes(self):
         if self.inviter_id is None:
@@ -719,29 +830,26 @@ class UserModel(chips.Model):
         return run_callback(USER_CB, "user_current_voucher_level", ctx=self.ctx, user=self)
 
     def _load_shop(self):
-        with db.conn(self.ctx) as ctx:
-            row = db.row(ctx, "shop/get_user_shop", user_id=self.user_id)
-            return shop.Shop(**row)
+        row = self._cached_row("shop/get_user_shop", user_id=self.user_id)
+        return shop.Shop(**row)
 
     ## Lazy load collection methods.
     def _load_rovers(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_rovers_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_rovers_by_user_id', user_id=self.user_id)
         return rows
 
     def _load_messages(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_messages_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_messages_by_user_id', user_id=self.user_id)
         return rows
 
     def _load_missions(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_missions_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_missions_by_user_id', user_id=self.user_id)
         missions = [mission.Mission(user=self, **row) for row in rows]
         missions_dict = dict([(m.get_id(), m) for m in missions])
 
-        # Wire up the mission hierarchy.
-        for m in missions_dict.itervalues():
+        # Wire up the mission hierarchy. The parts of each parent are gathered first so they are only sorted once.
+        parts_by_parent = {}
+        for m in missions:
             if m.parent_id is not None:
                 mission_parent = missions_dict.get(m.parent_id)
                 if not mission_parent:
@@ -751,40 +859,26 @@ class UserModel(chips.Model):
                 if mission_parent == m:
                     logger.error("Data fail, mission %s is its own parent.", m.mission_id)
                 m.set_silent(mission_parent = mission_parent)
-                mission_parent.parts.append(m)
-                # Keep the children parts list in sorted order (where higher number means earlier
-                # part of the mission)
-                mission_parent.parts = sorted(mission_parent.parts, key=lambda m: m.sort, reverse=True)
+                parts_by_parent.setdefault(m.parent_id, (mission_parent, []))[1].append(m)
+
+        for mission_parent, parts in parts_by_parent.itervalues():
+            # Keep the children parts list in sorted order (where higher number means earlier
+            # part of the mission)
+            mission_parent.parts = sorted(parts, key=lambda m: m.sort, reverse=True)
 
         return missions
 
     def _load_species(self):
-        all_subspecies_ids = {}
-        all_target_ids = {}
-        for rover in self.rovers.itervalues():
-            for target in rover.targets.itervalues():
-                if not target.picture:
-                    continue
-                for image_rect in target.image_rects.itervalues():
-                    for species_id in image_rect.detected_species():
-                        # If this image_rect has any detected subspecies add them to a mapping
-                        # from species_id to the set of all detected_subspecies.
-                        subspecies_ids = image_rect.detected_subspecies()
-                        if species_id in subspecies_ids:
-                            all_subspecies_ids.setdefault(species_id, set()).update(subspecies_ids[species_id])
-                        # Save the (rover_id, target_id) tuple which will be provided to the Species
-                        # model. This is used on the client to conveniently find which targets a
-                        # species has been detected in.
-                        all_target_ids.setdefault(species_id, set()).add((rover.rover_id, target.target_id))
-
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_species_by_user_id', user_id=self.user_id)
+        tally = self.species_tally
+        rows = self._cached_rows('select_species_by_user_id', user_id=self.user_id)
         user_species = []
         for row in rows:
-            # Both of these default to the empty set if there is a species that was identified
-            # but no longer has image_rects containing it (if image_rect deletion is supported again).
-            subspecies_ids = all_subspecies_ids.get(row['species_id'], set())
-            target_ids = all_target_ids.get(row['species_id'], set())
+            # The (rover_id, target_id) tuples provided to the Species model are used on the client to
+            # conveniently find which targets a species has been detected in.
+            # Both of these are the empty set if there is a species that was identified but no longer
+            # has image_rects containing it (if image_rect deletion is supported again).
+            subspecies_ids = tally.subspecies_ids(row['species_id'])
+            target_ids = tally.target_ids(row['species_id'])
             user_species.append(species.Species(subspecies_ids=subspecies_ids, target_ids=target_ids, user=self, **row))
         return user_species
 
@@ -802,14 +896,12 @@ class UserModel(chips.Model):
         return regions
 
     def _load_progress(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_progress_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_progress_by_user_id', user_id=self.user_id)
         return rows
 
     def _load_achievements(self):
         # Then load the persisted data, namely if and when an achievement has been achieved.
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_achievements_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_achievements_by_user_id', user_id=self.user_id)
         # Convert the rows into a map from achievement_key to data for achievements that
         # have been achieved.
         achieved = {}
@@ -826,8 +918,7 @@ class UserModel(chips.Model):
 
     def _load_capabilities(self):
         # Then load the persisted data, namely if a capability has been used.
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_capabilities_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_capabilities_by_user_id', user_id=self.user_id)
         # Convert the rows into a map from capability_key to the rest of the persisted capability data.
         used = {}
         for r in rows:
@@ -837,12 +928,11 @@ class UserModel(chips.Model):
         for capability_key in capability.all_capability_definitions():
             # Use default value of 0 if this achievement has not been used yet.
             params = used.get(capability_key, {'uses': 0})
-            capabilities.append(capability.Capability(capability_key=capability_key, user=self, **params))
+            capabilities.append(capability.Capability(capability_key=capability_key, **params))
         return capabilities
 
     def _load_vouchers(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_vouchers_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_vouchers_by_user_id', user_id=self.user_id)
         return rows
 
     def _load_map_tiles(self):
@@ -856,6 +946,11 @@ class UserModel(chips.Model):
         arrived_before = self.epoch_now + Constants.TARGET_DATA_LEEWAY_SECONDS
         expired_after = gametime.now() - timedelta(seconds=Constants.TARGET_DATA_LEEWAY_SECONDS)
         with db.conn(self.ctx) as ctx:
+            # If load_row_cache loaded all of the map tiles, apply the same filter as the select in Python.
+            rows = ctx.row_cache.get_rows_from_query(self.row_cache_name('select_all_user_map_tiles_by_user_id'))
+            if rows is not None:
+                return [r for r in rows if r['arrival_time'] <= arrived_before
+                        and (r['expiry_time'] is None or r['expiry_time'] > expired_after)]
             rows = db.rows(ctx, 'select_user_map_tiles_by_user_id', user_id=self.user_id,
                                 arrived_before=arrived_before, expired_after=expired_after)
         return rows
@@ -866,26 +961,22 @@ class UserModel(chips.Model):
         # Returns a dict mapping (x,y,zoom) to all the rows for that tile key.
         tiles = collections.defaultdict(list)
         # These are sorted by arrival_time in the query.
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_all_user_map_tiles_by_user_id', user_id=self.user_id)
+        rows = self._cached_rows('select_all_user_map_tiles_by_user_id', user_id=self.user_id)
         for r in rows:
             tile = maptile.MapTileRow(**r)
             tiles[tile.tile_key].append(tile)
         return tiles
 
     def _load_invitations(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_invites_by_user_id', sender_id=self.user_id)
+        rows = self._cached_rows('select_invites_by_user_id', sender_id=self.user_id)
         return rows
 
     def _load_gifts_created(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_gifts_by_creator_id', creator_id=self.user_id)
+        rows = self._cached_rows('select_gifts_by_creator_id', creator_id=self.user_id)
         return rows
 
     def _load_gifts_redeemed(self):
-        with db.conn(self.ctx) as ctx:
-            rows = db.rows(ctx, 'select_gifts_by_redeemer_id', redeemer_id=self.user_id)
+        rows = self._cached_rows('select_gifts_by_redeemer_id', redeemer_id=self.user_id)
         return rows
 
     def __repr__(self):
@@ -896,6 +987,9 @@ class UserModel(chips.Model):
 ## User Collection classes.
 class RoverCollection(chips.Collection):
     model_class = rover.Rover
+    # Which capabilities are available depends on the rovers the user has.
+    track_dependents = True
+    tracked_fields = frozenset()
 
     def find_target_by_id(self, target_id):
         """ Search all rovers for the given target_id. Return None if not found. """
@@ -942,30 +1036,53 @@ class RoverCollection(chips.Collection):
         """
         return [r for r in self.by_activated_at(newest_first=False) if not r.active]
 
-    def callback_values_prepare_refresh(self):
-        """
-        Call this before making any gamestate changes which might show up when
-        capability_features_refresh is called. e.g. capability unlimited or available values are changing.
-        This forces all of the rovers to be lazy loaded and any of their lazy fields to be loaded
-        so that any callback derived values can be tracked and chips sent.
-        """
-        for r in self.itervalues():
-            r.capabilities_changing()
-
-    def callback_values_refresh(self):
-        """
-        Call this after making any gamestate changes which might change any of the callback derived rover fields
-        e.g. min_target_seconds.
-        NOTE: Be sure to call capability_features_prepare_refresh before making any of the
-        relevant gamestate changes so that all rovers and fields have been lazy loaded and any changes
-        can be tracked and chips sent.
-        """
-        for r in self.itervalues():
-            r.capabilities_changed()
-
 class MissionCollection(chips.Collection):
+    """ The user's missions. The collection indexes its missions by mission_definition and by done state
+        as they are added, deleted or marked done, so the lookups used by event dispatch and the mission
+        callbacks do not walk every mission. """
     model_class = mission.Mission
 
+    def __init__(self, name, *model_args):
+        # mission_definition -> list of missions with that definition, expected to have at most one member.
+        self._by_definition = {}
+        # mission_id -> mission for every mission which is done and which is not done.
+        self._done = {}
+        self._not_done = {}
+        super(MissionCollection, self).__init__(name, *model_args)
+
+    def add(self, model):
+        model = super(MissionCollection, self).add(model)
+        self._unindex(model)
+        self._by_definition.setdefault(model.mission_definition, []).append(model)
+        self._child_done_changed(model)
+        return model
+
+    def delete_child(self, model):
+        super(MissionCollection, self).delete_child(model)
+        self._unindex(model)
+
+    def _child_done_changed(self, model):
+        """ Called when a mission is added to this collection or its done field has changed. """
+        mission_id = model.get_id()
+        if model.is_done():
+            self._not_done.pop(mission_id, None)
+            self._done[mission_id] = model
+        else:
+            self._done.pop(mission_id, None)
+            self._not_done[mission_id] = model
+
+    def _unindex(self, model):
+        """ Remove the given mission, or a mission with the same id which it replaces, from the indexes. """
+        mission_id = model.get_id()
+        replaced = self._done.pop(mission_id, None)
+        if replaced is None:
+            replaced = self._not_done.pop(mission_id, None)
+        if replaced is not None:
+            found = self._by_definition[replaced.mission_definition]
+            found.remove(replaced)
+            if not found:
+                del self._by_definition[replaced.mission_definition]
+
     def all_by_started_at(self):
         """ Return all missions, sorted by started_at. """
         return sorted([m for m in self.itervalues()], key=lambda m: m.started_at)
@@ -977,32 +1094,46 @@ class MissionCollection(chips.Collection):
         Returns None if no mission matches.
         param mission_definition: The mission definition string. See mission.py. e,g MIS_TUT01a
         """
-        found = [m for m in self.itervalues() if m.mission_definition == mission_definition]
+        self.load()
+        found = self._by_definition.get(mission_definition, [])
         assert(len(found) < 2)
         if len(found) == 1:
             return found[0]
         else:
             return None
 
+    def not_done_with_definitions(self, mission_definitions):
+        """ Return the missions which have not been marked done and have one of the given mission definitions. """
+        self.load()
+        # Look up whichever of the definitions or the not done missions there are fewer of.
+        if len(mission_definitions) > len(self._not_done):
+            return [m for m in self._not_done.itervalues() if m.mission_definition in mission_definitions]
+        missions = []
+        for mission_definition in mission_definitions:
+            missions += [m for m in self._by_definition.get(mission_definition, []) if not m.is_done()]
+        return missions
+
     def done(self, root_only=False):
         """
         Return all missions that have been marked done.
         :param root_only: Optionally only return 'root' missions.
         """
+        self.load()
         if root_only:
-            return [m for m in self.itervalues() if m.is_done() and m.is_root_mission()]
+            return [m for m in self._done.itervalues() if m.is_root_mission()]
         else:
-            return [m for m in self.itervalues() if m.is_done()]
+            return self._done.values()
 
     def not_done(self, root_only=False):
         """
         Return all missions that have not been been marked done.
         :param root_only: Optionally only return 'root' missions.
         """
+        self.load()
         if root_only:
-            return [m for m in self.itervalues() if not m.is_done() and m.is_root_mission()]
+            return [m for m in self._not_done.itervalues() if m.is_root_mission()]
         else:
-            return [m for m in self.itervalues() if not m.is_done()]
+            return self._not_done.values()
 
 class MessageCollection(chips.Collection):
     model_class = message.Message
@@ -1125,6 +1256,11 @@ class AchievementCollection(chips.Collection):
         """ Return all achievements that have not yet been achieved. """
         return [a for a in self.itervalues() if not a.was_achieved()]
 
+    def not_achieved_with_keys(self, achievement_keys):
+        """ Return the achievements with any of the given achievement_keys that have not yet been achieved. """
+        models = self.get_models()
+        return [models[k] for k in achievement_keys if k in models and not models[k].was_achieved()]
+
     def unviewed_and_achieved(self):
         """ Return any achievements which are unviewed and achieved. """
         return [a for a in self.achieved() if not a.was_viewed()]
@@ -1140,29 +1276,10 @@ class CapabilityCollection(chips.Collection):
         """ Returns the list of capabilites that provide the given rover feature and have uses left. """
         return [c for c in self.provides_rover_feature(metadata_key) if c.has_uses()]
 
-    def available_and_unlimited_prepare_refresh(self):
-        """
-        Call this before making any gamestate changes which might show up when
-        available_and_unlimited_refresh is called. e.g. rover counts or purchases which would
-        change the available or unlimited values of a capability.
-        This forces all of the capabilites to be lazy loaded and get their 'current' available
-        and unlimited values so any changes can be tracked and chips sent.
-        """
-        len(self)
-
-    def available_and_unlimited_refresh(self):
-        """
-        Call this after making any gamestate changes which might change the available or unlimited
-        values of a capabilitiy. e.g. rover counts or purchases.
-        NOTE: Be sure to call available_and_unlimited_prepare_refresh before making any of the
-        relevant gamestate changes so that all capabilities have been lazy loaded and any changes
-        can be tracked and chips sent.
-        """
-        for c in self.itervalues():
-            c.available_and_unlimited_refresh()
-
 class VoucherCollection(chips.Collection):
     model_class = voucher.Voucher
+    # current_voucher_level, which capabilities are unlimited and which products are available depend on the vouchers.
+    track_dependents = True
 
     def by_delivered_at(self):
         """ Return the list of Vouchers sorted by delivered_at, newest first. """
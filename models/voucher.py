@@ -21,35 +21,21 @@ def deliver_new_voucher(ctx, user, voucher_key, suppress_callbacks=False):
     :param user: User object, this comes from the session usually
     :param voucher_key: str The voucher key identifying the voucher to deliver to this user. e.g. VCH_*
     """
-    # Be sure all capabilities are loaded so their available and unlimited values can be
-    # compared pre and post voucher creation, as they might change and require a chip.
-    user.capabilities.available_and_unlimited_prepare_refresh()
-    # Be sure all available products are loaded so their available and price values can be
-    # compared pre and post voucher creation, as they might change and require a chip.
-    user.shop.available_products.available_and_price_prepare_refresh()
-    # Be sure that current_voucher_level is loaded as its value might be changing.
-    user.current_voucher_level_prepare_refresh()
-
     params = {}
     params['voucher_key'] = voucher_key
     params['delivered_at'] = user.epoch_now
 
     with db.conn(ctx) as ctx:
+        # A new voucher means that a capability which is using the voucher to determine unlimited state might
+        # now be unlimited, or that a product which delivers that voucher might no longer be available (for instance
+        # if this voucher was delivered by a gift). The voucher is added to user.vouchers before it is inserted so
+        # that the chips for those are sent along with the voucher's.
+        v = user.vouchers.create_child(**params)
         # user_id is only used when creating the Voucher in the database, it is not loaded
         # by chips as the user.vouchers collection takes care of assigning Voucher to a User.
         db.run(ctx, "insert_voucher", user_id=user.user_id, **params)
-        v = user.vouchers.create_child(**params)
         v.send_chips(ctx, user)
 
-    # A new voucher means that a capability which is using the voucher to determine
-    # unlimited state might now be unlimited.
-    user.capabilities.available_and_unlimited_refresh()
-    # A new voucher means that a product which delivers that voucher might no longer be available
-    # (for instance) if this voucher was delivered by a gift.
-    user.shop.available_products.available_and_price_refresh()
-    # A new voucher most likely means a new current_voucher_level for this user.
-    user.current_voucher_level_refresh()
-
     if not suppress_callbacks:
         # Inform the callbacks that this voucher was delivered.
         run_callback(VOUCHER_CB, "voucher_was_delivered", voucher_key, ctx=ctx, user=user, voucher=v)
@@ -82,8 +68,8 @@ class Voucher(chips.Model, models.UserChild):
     def does_specify_capability_as_unlimited(self, capability):
         """ Returns True if the given capability is specified as being unlimited by this
             voucher (using unlimited_capabilities).
-            NOTE: The supplied capability object might be in the process of being initialized via callbacks
-            therefore it is not safe to rely on its unlimited and available values. """
+            NOTE: The unlimited and available values of the supplied capability object might be being loaded
+            via callbacks therefore it is not safe to rely on them. """
         for unlimited in self.unlimited_capabilities:
             if unlimited == capability.capability_key:
                 return True
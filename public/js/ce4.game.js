@@ -46,6 +46,11 @@ ce4.game.init = function(gamestate) {
         ce4.gamestate.config.chip_fetch_interval*1000,
         ce4.util.is_chip_time_newer);
     ce4.chips.fetch_url = ce4.util.url_api(ce4.gamestate.urls.fetch_chips);
+    ce4.chips.long_poll_wait = ce4.gamestate.config.chip_long_poll_wait;
+    // Too much has changed since the gamestate was loaded, so start over with a fresh one.
+    ce4.chips.refetch_gamestate = function() {
+        window.location.reload();
+    };
 
     // Register a chip listener on the root user object to dispatch any chip to the correct
     // Collection or Model to handle.
@@ -920,6 +920,12 @@ lazy8.chips.Manager = function(last_seen_chip_time, fetch_interval, is_chip_time
     this.fetch_interval = fetch_interval;
     this.is_chip_time_newer = is_chip_time_newer;
     this.timeout = null;
+    // If set to a number of seconds, the server holds each sync request open for up to that long
+    // waiting for new chips and the next sync is issued as soon as the previous one returns.
+    this.long_poll_wait = 0;
+    // Called when the server says there are too many chips pending to apply and the entire
+    // gamestate should be loaded again instead.
+    this.refetch_gamestate = function() {};
     this.listeners = [];
     this.bundle_listeners = [];
 };
@@ -939,9 +945,17 @@ lazy8.chips.Manager.prototype.last_seen_chip_time_query_param = function last_se
 // This extracts any possible chips from any JSON payload (not just a sync request).
 lazy8.chips.Manager.prototype.process_chips = function process_chips(struct) {
     // When an ajax function returns, merge any chips with the gamestate data.
+    if (struct.refetch_gamestate) {
+        this.refetch_gamestate();
+        return;
+    }
     if (struct.chips && struct.chips.length) {
         this._dispatch_all(struct.chips);
     }
+    // Sent instead of chips when the unseen chips all cancelled each other out.
+    if (struct.last_seen_chip_time && this.is_chip_time_newer(struct.last_seen_chip_time, this.last_seen_chip_time)) {
+        this.last_seen_chip_time = struct.last_seen_chip_time;
+    }
 };
 
 /*
@@ -987,12 +1001,17 @@ lazy8.chips.Manager.prototype.remove_bundle_listener = function remove_bundle_li
  */
 lazy8.chips.Manager.prototype.sync = function sync(opt_synchronous) {
     var manager = this;
+    var json_data = {'last_seen_chip_time': manager.last_seen_chip_time};
+    var long_poll = manager.long_poll_wait > 0 && opt_synchronous !== true;
+    if (long_poll) {
+        json_data.wait = manager.long_poll_wait;
+    }
     manager._sync_impl(
-        {'last_seen_chip_time': manager.last_seen_chip_time},
+        json_data,
         // Success. Process the chips.
         function (data) {
             manager.process_chips(data);
-            manager._schedule_sync();
+            manager._schedule_sync(long_poll ? 0 : undefined);
         },
         // Failure. Log the error.
         function (jqXHR, textStatus, errorThrown) {
@@ -1047,17 +1066,22 @@ lazy8.chips.Manager.prototype._sync_impl = function _sync_impl(json_data, succes
     if (opt_synchronous === true) {
         options.async = false;
     }
+    // Allow a long polling request some time beyond its wait before giving up on it.
+    if (json_data.wait) {
+        options.timeout = (json_data.wait + 15) * 1000;
+    }
     jQuery.ajax(options);
 };
 
 // Handles the setting up a timer to poll for chip updates from the server.
-lazy8.chips.Manager.prototype._schedule_sync = function _schedule_sync() {
+// opt_delay optionally overrides the fetch_interval, in milliseconds.
+lazy8.chips.Manager.prototype._schedule_sync = function _schedule_sync(opt_delay) {
     // Use a timeout instead of an interval so that the rate at which fetching happens is
     // more predictable. This also makes it safer if sync() is called more than once by the
     // consumer.
     clearTimeout(this.timeout);
     if (this.fetch_interval) {
-        this.timeout = setTimeout(this._sync_cb(), this.fetch_interval);
+        this.timeout = setTimeout(this._sync_cb(), opt_delay !== undefined ? opt_delay : this.fetch_interval);
     }
 };
 
@@ -1,10 +1,11 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
+import zlib
 from functools import wraps
 from restish import http
 
 from front.models import chips, user
-from front.lib import get_uuid, xjson, utils
+from front.lib import get_uuid, xjson, utils, gametime
 from front.data import validate_dict
 
 import logging
@@ -63,6 +64,15 @@ def json_success(response=None):
     if response is None: response = {}
     return http.ok([xjson.content_type], xjson.dumps(response))
 
+def json_success_streamed(chunks):
+    """
+    See json_success. The response body is the given iterable of JSON encoded strings, which are
+    written out one after another without being joined. The request's database transaction is committed
+    before the body is written, see db.DatabaseMiddleware, so producing the strings must not use the database.
+    No chips will be added to the response.
+    """
+    return http.ok([xjson.content_type], chunks)
+
 def json_success_with_chips(request, response=None, json_body=None):
     """
     See json_success. Chips will be added to the response.
@@ -94,6 +104,34 @@ def json_bad_request_with_chips(request, error_msg, response=None):
     if error is not None: return error
     return json_bad_request(error_msg, response)
 
+# Response bodies smaller than this are not worth compressing.
+GZIP_MIN_BYTES = 1024
+# Favor speed over size, these responses are compressed on every request.
+GZIP_LEVEL = 1
+
+def gzip_if_accepted(request, response):
+    """
+    Compress the body of the given response with gzip if the client sent an Accept-Encoding header
+    which allows it and the body is at least GZIP_MIN_BYTES long. Returns the response.
+    This is meant for the frequent, potentially large responses like fetch_chips. When the gzip middleware
+    is enabled (use_gzip_compression) it leaves responses which already have a Content-Encoding alone.
+    """
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(response.body) < GZIP_MIN_BYTES or not _accepts_gzip(request):
+        return response
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    response.body = compressor.compress(response.body) + compressor.flush()
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def _accepts_gzip(request):
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        params = [p.strip().lower() for p in coding.split(';')]
+        if params[0] in ('gzip', 'x-gzip'):
+            # A quality of zero means the client refuses the coding.
+            return not any(p in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000') for p in params[1:])
+    return False
+
 def update_response_with_chips_from_request(response, request, json_body=None):
     """
     This sticks any pending chips for the user onto a response object from a request object.
@@ -106,10 +144,6 @@ def update_response_with_chips_from_request(response, request, json_body=None):
     Returns the response, None if all required data was in the request, otherwise it returns
         None, error where error is a fully populated HTTP response string.
     """
-    u = user.user_from_request(request)
-    if u is None:
-        raise Exception("Unable to load user_id from request when getting chips for response.")
-
     if request.method == "GET":
         if 'last_seen_chip_time' not in request.params:
             return None, json_bad_request(utils.tr("Missing required parameter last_seen_chip_time."))
@@ -120,6 +154,15 @@ def update_response_with_chips_from_request(response, request, json_body=None):
         if 'chips' not in json_body or 'last_seen_chip_time' not in json_body['chips']:
             return None, json_bad_request(utils.tr("Missing required parameter chips.last_seen_chip_time."))
         last_seen_chip_time = utils.usec_dt_from_js(json_body['chips']['last_seen_chip_time'])
+
+    # Most requests have no new chips to deliver, in which case there is no need to load the user.
+    user_id = user.user_id_from_request(request)
+    if user_id is not None and chips.no_chips_since(request, user_id, last_seen_chip_time, gametime.now()):
+        return response, None
+
+    u = user.user_from_request(request)
+    if u is None:
+        raise Exception("Unable to load user_id from request when getting chips for response.")
     return chips.update_response(request, u, response, last_seen_chip_time), None
 
 ## JSON response helpers meant to be used in 'API' situations, meaning publicly accessible.
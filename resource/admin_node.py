@@ -170,7 +170,7 @@ class AdminUserNode(resource.Resource):
             return {'error': utils.tr("This user does not exist.")}
         # Ask the user object to load and cache all of the gamestate data most of which is going to be
         # used on the admin user page.
-        user.load_gamestate_row_cache()
+        user.load_row_cache('gamestate')
         # Load all the invitations using the faster recent invite queries rather than iterating through
         # all of user.invitations and lazy loading everything.
         invite_limit = 300
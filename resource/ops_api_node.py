@@ -8,12 +8,12 @@ structure here.
 """
 from restish import resource
 
-from front.lib import get_uuid, xjson
-from front.models import user
+from front.lib import get_uuid, xjson, utils
+from front.models import user, chips
 from front.backend import gamestate
 from front.resource import user_node, rover_node, message_node, progress_node, mission_node, species_node
 from front.resource import achievement_node, invite_node, shop_node
-from front.resource import json_success, json_success_with_chips
+from front.resource import json_success, json_success_with_chips, json_success_streamed, json_bad_request, gzip_if_accepted
 
 class OpsAPINode(resource.Resource):
     @resource.child()
@@ -62,17 +62,34 @@ class OpsAPINode(resource.Resource):
 
 class Gamestate(resource.Resource):
     """The url handler that simply returns the json serialization of the 
-    gamestate.  This is intended to be hit by AJAX."""
+    gamestate.  This is intended to be hit by AJAX.
+    The JSON is encoded from the models in one serialization pass, see gamestate.gamestate_json_chunks."""
     @resource.GET(accept=xjson.mime_type)
     def get(self, request):
         u = user.user_from_request(request)
         # Update the users last_accessed field.
         u.update_last_accessed()
-        return json_success(gamestate.gamestate_for_user(u, request))
+        return json_success_streamed(gamestate.gamestate_json_chunks(u, request))
 
 class FetchChips(resource.Resource):
     """Handle the /fetch_chips request from the client by grabbing everything from
-    the chips table that is more recent than last_seen_chip_time."""
+    the chips table that is more recent than last_seen_chip_time.
+    If the optional wait parameter is supplied, the request is held open for up to that many seconds
+    (capped at chips.LONG_POLL_MAX_WAIT_SECONDS) until there are new chips to return. The response is
+    the same either way, with an empty chips list if the wait timed out.
+    Large responses are gzip compressed if the client accepts it, see resource.gzip_if_accepted."""
     @resource.GET(accept=xjson.mime_type)
     def get(self, request):
-        return json_success_with_chips(request)
+        if 'wait' in request.params and 'last_seen_chip_time' in request.params:
+            try:
+                wait = int(request.params['wait'])
+            except ValueError:
+                return json_bad_request(utils.tr("Invalid wait parameter."))
+            if wait > 0:
+                # Only the user_id is needed to wait, so the user is not loaded.
+                user_id = user.user_id_from_request(request)
+                if user_id is None:
+                    return json_bad_request(utils.tr("Unauthorized request."))
+                last_seen_chip_time = utils.usec_dt_from_js(request.params['last_seen_chip_time'])
+                chips.wait_for_chips(request, user_id, last_seen_chip_time, wait)
+        return gzip_if_accepted(request, json_success_with_chips(request))
@@ -62,6 +62,8 @@ class NextTarget(resource.Resource):
             target = user.rovers[rover_id].targets[target_id]
             # Lock the target during processing so only one renderer instance is processing it at a time.
             target.lock_for_processing()
+            # Load the rest of the users rovers and targets in a single round trip.
+            user.load_row_cache('renderer')
 
             struct = renderer.process_target_struct(user, target)
             return json_success(struct)
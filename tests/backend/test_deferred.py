@@ -1,7 +1,9 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
+from datetime import timedelta
+
 from front.backend import deferred
-from front.lib import db, utils
+from front.lib import db, utils, gametime
 from front.callbacks import timer_callbacks
 
 from front.tests import base
@@ -77,3 +79,171 @@ class TestDeferred(base.TestCase):
                 processed = self.advance_game_for_user(user, seconds=0)
                 self.assertEqual(len(processed), 1)
                 self.assertTrue(TMR_TEST01_Callbacks.TIMER_FIRED)
+
+    def test_deferred_run_claimed(self):
+        class TMR_TEST03_Callbacks(timer_callbacks.BaseCallbacks):
+            FIRED = []
+            @classmethod
+            def timer_arrived_at(cls, ctx, user, order):
+                cls.FIRED.append(order)
+        self.inject_callback(timer_callbacks, TMR_TEST03_Callbacks)
+
+        self.create_user('testuser@example.com', 'pw')
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                for order, minutes in enumerate([20, 10, 30]):
+                    deferred.run_on_timer(ctx, 'TMR_TEST03', user, delay=utils.in_seconds(minutes=minutes), order=order)
+                db.commit(ctx)
+                gametime.set_now(gametime.now() + timedelta(minutes=30))
+                since = gametime.now()
+
+                # While another worker holds a claim on the user's due rows they are not run.
+                lock_timeout = gametime.now() - timedelta(minutes=deferred.LOCK_TIMEOUT)
+                self.assertTrue(deferred._claim_user(ctx, user.user_id, since, 'other_worker', lock_timeout))
+                deferred.run_deferred_claimed(ctx, since, 'this_worker')
+                self.assertEqual(TMR_TEST03_Callbacks.FIRED, [])
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST03', user))
+
+                # Once the claim has timed out the rows are claimed again and run in run_at order.
+                gametime.set_now(gametime.now() + timedelta(minutes=deferred.LOCK_TIMEOUT + 1))
+                deferred.run_deferred_claimed(ctx, since, 'this_worker')
+                self.assertEqual(TMR_TEST03_Callbacks.FIRED, [1, 0, 2])
+                # The rows were deleted through another load of the user, which this user's pending_deferreds
+                # does not see, so ask the database.
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST03', user))
+                self.assertFalse(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST03', user, live=True))
+
+    def test_deferred_run_claimed_lost_claim(self):
+        class TMR_TEST07_Callbacks(timer_callbacks.BaseCallbacks):
+            FIRED = 0
+            @classmethod
+            def timer_arrived_at(cls, ctx, user):
+                cls.FIRED += 1
+        self.inject_callback(timer_callbacks, TMR_TEST07_Callbacks)
+        self.expect_log('front.backend.deferred', 'Lost the claim on deferred actions')
+
+        from front.models import user as user_module
+        self.create_user('testuser@example.com', 'pw')
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                deferred.run_on_timer(ctx, 'TMR_TEST07', user, delay=utils.in_seconds(minutes=10))
+                db.commit(ctx)
+                gametime.set_now(gametime.now() + timedelta(minutes=10))
+                since = gametime.now()
+
+                lock_timeout = gametime.now() - timedelta(minutes=deferred.LOCK_TIMEOUT)
+                self.assertTrue(deferred._claim_user(ctx, user.user_id, since, 'worker_a', lock_timeout))
+                rows = db.rows(ctx, 'deferred/select_claimed_deferred_for_user', user_id=user.user_id, locked_by='worker_a')
+                # worker_a takes longer than LOCK_TIMEOUT to run the rows and worker_b takes over the claim.
+                gametime.set_now(gametime.now() + timedelta(minutes=deferred.LOCK_TIMEOUT + 1))
+                lock_timeout = gametime.now() - timedelta(minutes=deferred.LOCK_TIMEOUT)
+                self.assertTrue(deferred._claim_user(ctx, user.user_id, since, 'worker_b', lock_timeout))
+
+                # worker_a rolls back its batch rather than deleting the rows worker_b is running.
+                self.assertEqual(deferred._run_user_batch(ctx, user_module, user.user_id, rows, worker='worker_a'), 0)
+                self.assertEqual(deferred._run_claimed_for_user(ctx, user_module, user.user_id, 'worker_b'), len(rows))
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                self.assertFalse(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST07', user))
+
+    def test_deferred_run_since_user_batches(self):
+        class TMR_TEST04_Callbacks(timer_callbacks.BaseCallbacks):
+            FIRED = []
+            @classmethod
+            def timer_arrived_at(cls, ctx, user, order):
+                cls.FIRED.append((user.email, order, user))
+                if order == 'fail':
+                    raise Exception("Failing timer.")
+        self.inject_callback(timer_callbacks, TMR_TEST04_Callbacks)
+        self.expect_log('front.backend.deferred', 'Processing timer deferred failed')
+
+        self.create_user('testuser1@example.com', 'pw')
+        self.create_user('testuser2@example.com', 'pw')
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user1 = self.get_user_by_email('testuser1@example.com', ctx=ctx)
+                user2 = self.get_user_by_email('testuser2@example.com', ctx=ctx)
+                for order, minutes in enumerate([20, 10, 30]):
+                    deferred.run_on_timer(ctx, 'TMR_TEST04', user1, delay=utils.in_seconds(minutes=minutes), order=order)
+                deferred.run_on_timer(ctx, 'TMR_TEST04', user2, delay=utils.in_seconds(minutes=10), order=0)
+                deferred.run_on_timer(ctx, 'TMR_TEST04', user2, delay=utils.in_seconds(minutes=20), order='fail')
+
+        gametime.set_now(gametime.now() + timedelta(minutes=30))
+        self.run_deferred_actions()
+
+        # Each user's rows are run in run_at order against a single load of the user.
+        fired1 = [f for f in TMR_TEST04_Callbacks.FIRED if f[0] == 'testuser1@example.com']
+        self.assertEqual([f[1] for f in fired1], [1, 0, 2])
+        self.assertTrue(fired1[0][2] is fired1[1][2] is fired1[2][2])
+        fired2 = [f for f in TMR_TEST04_Callbacks.FIRED if f[0] == 'testuser2@example.com']
+        self.assertEqual([f[1] for f in fired2], [0, 'fail'])
+
+        # The failure rolled back all of the second user's batch but none of the first user's.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user1 = self.get_user_by_email('testuser1@example.com', ctx=ctx)
+                user2 = self.get_user_by_email('testuser2@example.com', ctx=ctx)
+                self.assertFalse(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST04', user1))
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST04', user2))
+
+    def test_deferred_run_later_dedup(self):
+        self.create_user('testuser@example.com', 'pw')
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                def queued_run_at():
+                    rows = db.rows(ctx, 'debug/select_deferred_since_by_user_id', user_id=user.user_id,
+                                   since=gametime.now() + timedelta(days=1))
+                    return [r['run_at'] for r in rows if r['subtype'] == 'TMR_TEST05']
+                # The run_at column does not store microseconds.
+                start = gametime.now().replace(microsecond=0)
+                gametime.set_now(start)
+
+                # Queueing again with a dedup mode keeps the one queued action, adjusting its run_at by the mode.
+                deferred.run_on_timer(ctx, 'TMR_TEST05', user, utils.in_seconds(minutes=20), _dedup=deferred.dedup.IF_NOT_QUEUED)
+                deferred.run_on_timer(ctx, 'TMR_TEST05', user, utils.in_seconds(minutes=10), _dedup=deferred.dedup.IF_NOT_QUEUED)
+                self.assertEqual(queued_run_at(), [start + timedelta(minutes=20)])
+                deferred.run_on_timer(ctx, 'TMR_TEST05', user, utils.in_seconds(minutes=30), _dedup=deferred.dedup.EARLIER)
+                self.assertEqual(queued_run_at(), [start + timedelta(minutes=20)])
+                deferred.run_on_timer(ctx, 'TMR_TEST05', user, utils.in_seconds(minutes=10), _dedup=deferred.dedup.EARLIER)
+                self.assertEqual(queued_run_at(), [start + timedelta(minutes=10)])
+                deferred.run_on_timer(ctx, 'TMR_TEST05', user, utils.in_seconds(minutes=40), _dedup=deferred.dedup.LATER)
+                self.assertEqual(queued_run_at(), [start + timedelta(minutes=40)])
+
+                # Once the user's pending deferreds are loaded, checking for queued actions does not query the database.
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST05', user))
+                count = db.query_count(ctx)
+                self.assertFalse(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST06', user))
+                deferred.run_on_timer(ctx, 'TMR_TEST06', user, utils.in_seconds(minutes=10))
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST06', user))
+                self.assertEqual(db.query_count(ctx), count + 1)
+
+    def test_deferred_requeue_self_with_dedup(self):
+        class TMR_TEST08_Callbacks(timer_callbacks.BaseCallbacks):
+            FIRED = 0
+            @classmethod
+            def timer_arrived_at(cls, ctx, user):
+                cls.FIRED += 1
+                # The action being run is no longer queued, so queueing it again with a dedup mode is not a no-op.
+                if cls.FIRED == 1:
+                    deferred.run_on_timer(ctx, 'TMR_TEST08', user, utils.in_seconds(minutes=10), _dedup=deferred.dedup.IF_NOT_QUEUED)
+        self.inject_callback(timer_callbacks, TMR_TEST08_Callbacks)
+
+        self.create_user('testuser@example.com', 'pw')
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                deferred.run_on_timer(ctx, 'TMR_TEST08', user, utils.in_seconds(minutes=10), _dedup=deferred.dedup.IF_NOT_QUEUED)
+
+        gametime.set_now(gametime.now() + timedelta(minutes=10))
+        self.run_deferred_actions()
+        self.assertEqual(TMR_TEST08_Callbacks.FIRED, 1)
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_user_by_email('testuser@example.com', ctx=ctx)
+                self.assertTrue(deferred.is_queued_to_run_later_for_user(ctx, deferred.types.TIMER, 'TMR_TEST08', user))
+
+        gametime.set_now(gametime.now() + timedelta(minutes=10))
+        self.run_deferred_actions()
+        self.assertEqual(TMR_TEST08_Callbacks.FIRED, 2)
@@ -0,0 +1,68 @@
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+import os, shutil, tempfile, unittest
+
+from front.backend import gamestate_cache
+
+class TestGamestateCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_lru_cache(self):
+        self._test_cache(gamestate_cache.LRUSnapshotCache(max_entries=2))
+
+    def test_sqlite_cache(self):
+        path = os.path.join(self.tempdir, 'gamestate_cache.sqlite')
+        self._test_cache(gamestate_cache.SqliteSnapshotCache(path, max_entries=2))
+        # The snapshots are visible to another store using the same file.
+        other = gamestate_cache.SqliteSnapshotCache(path)
+        other.put('user1', 'key1', 100, 200, '{"a":1}')
+        self.assertEqual(gamestate_cache.SqliteSnapshotCache(path).get('user1', 'key1', 150), '{"a":1}')
+
+    def test_lru_eviction(self):
+        cache = gamestate_cache.LRUSnapshotCache(max_entries=2)
+        cache.put('user1', 'key1', 100, 200, '1')
+        cache.put('user2', 'key2', 100, 200, '2')
+        # Using user1 makes user2 the least recently used.
+        self.assertEqual(cache.get('user1', 'key1', 150), '1')
+        cache.put('user3', 'key3', 100, 200, '3')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('user2', 'key2', 150), None)
+        self.assertEqual(cache.get('user1', 'key1', 150), '1')
+        self.assertEqual(cache.get('user3', 'key3', 150), '3')
+
+    def test_cache_for_config(self):
+        self.assertEqual(gamestate_cache.cache_for_config({}), None)
+        cache = gamestate_cache.cache_for_config({'gamestate_cache': 'lru'})
+        self.assertTrue(isinstance(cache, gamestate_cache.LRUSnapshotCache))
+        self.assertTrue(gamestate_cache.cache_for_config({'gamestate_cache': 'lru'}) is cache)
+        self.assertRaises(Exception, gamestate_cache.cache_for_config, {'gamestate_cache': 'unknown'})
+
+        override = gamestate_cache.LRUSnapshotCache()
+        gamestate_cache.set_cache(override)
+        try:
+            self.assertTrue(gamestate_cache.cache_for_config({}) is override)
+        finally:
+            gamestate_cache.set_cache(None)
+
+    def _test_cache(self, cache):
+        self.assertEqual(cache.get('user1', 'key1', 150), None)
+        cache.put('user1', 'key1', 100, 200, '{"a":1}')
+        self.assertEqual(cache.get('user1', 'key1', 100), '{"a":1}')
+        self.assertEqual(cache.get('user1', 'key1', 199), '{"a":1}')
+        # A snapshot is only usable with the same key and within its time range.
+        self.assertEqual(cache.get('user1', 'key2', 150), None)
+        self.assertEqual(cache.get('user1', 'key1', 99), None)
+        self.assertEqual(cache.get('user1', 'key1', 200), None)
+        self.assertEqual(cache.get('user2', 'key1', 150), None)
+
+        # A newer snapshot replaces the old one.
+        cache.put('user1', 'key2', 150, 300, '{"a":2}')
+        self.assertEqual(cache.get('user1', 'key1', 160), None)
+        self.assertEqual(cache.get('user1', 'key2', 160), '{"a":2}')
+
+        cache.invalidate('user1')
+        self.assertEqual(cache.get('user1', 'key2', 160), None)
@@ -7,12 +7,14 @@ import logging
 import facebook
 
 from front import read_config, debug, InitialMessages, Constants
-from front.lib import db, xjson, utils, urls, gametime, email_module, email_ses
+from front.lib import db, xjson, utils, urls, gametime, email_module, email_ses, event
 from front.data import validate_struct, schemas, scene
 from front.models import maptile, message
 from front.models import user as user_module
 from front.models import progress as progress_module
 from front.models import capability as capability_module
+from front.models import species_tally
+from front import callbacks
 from front.backend import deferred
 
 # Used by shop_stripe_purchase_products method.
@@ -119,6 +121,10 @@ class TestCase(unittest.TestCase):
         self.fb_test_user_id = self.conf['fb.test_user_id']
         # Freeze time to now.
         gametime.set_now(gametime.now())
+        # Check every user's incrementally maintained species tally against the full gamestate whenever it is used.
+        species_tally.VERIFY = True
+        # Run the mission and achievement callbacks skipped by event dispatch and check none of them react.
+        event.VERIFY = True
 
         # Initialize the last_seen_chip_time for fetch_chips emulation.
         self._last_seen_chip_time = utils.usec_js_from_dt(gametime.now())
@@ -184,6 +190,8 @@ class TestCase(unittest.TestCase):
         # Remove any injected testing only callbacks.
         for callback_module, class_name in self._injected_test_callbacks:
             del callback_module.__dict__[class_name]
+        if self._injected_test_callbacks:
+            callbacks.reset_dispatch_tables()
 
         # Remove any injected testing only msg_types.
         for msg_type in self._injected_test_msg_types:
@@ -903,6 +911,7 @@ class TestCase(unittest.TestCase):
     def inject_callback(self, callback_module, callback_cls):
         callback_module.__dict__[callback_cls.__name__] = callback_cls
         self._injected_test_callbacks.append((callback_module, callback_cls.__name__))
+        callbacks.reset_dispatch_tables()
 
     def enable_capabilities_on_active_rover(self, capability_keys=[], gamestate=None):
         if gamestate is None:
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta
 from front.models import chips
 
 # Needed for 'time' parsing
-from front.lib import utils
+from front.lib import utils, xjson
 
 # Needed for rollback and database clearing.
 from front.lib import db
@@ -239,6 +239,40 @@ class TestChipsModel(unittest.TestCase):
         self.assertTrue(m.tc0._loaded)
         self.assertEqual(m.tc0['id1'].f1, 'derp')
 
+    def test_iter_json(self):
+        class TestStreamedModel(chips.Model):
+            id_field = 'test_id'
+            fields = frozenset(['f1', 'f2', 'f3'])
+            collections = frozenset(['tc0'])
+            server_only_fields = frozenset(['f3'])
+            def __init__(self, **params):
+                super(TestStreamedModel, self).__init__(tc0=TestCollection('tc0'), **params)
+            def modify_struct(self, struct, is_full_struct):
+                if is_full_struct:
+                    struct['urls'] = {'self': '/%s' % self.test_id}
+                # Replacing a collection must work whether or not it has been struct-ified.
+                if self.f1 == 'hidden':
+                    struct['tc0'] = {}
+                return struct
+
+        class TestStreamedCollection(chips.Collection):
+            model_class = TestStreamedModel
+
+        c = TestStreamedCollection('streamed')
+        for i in range(50):
+            m = c.create_child(test_id='t%d' % i, f1='hidden' if i % 2 else u'v\u2603',
+                               f2=[datetime(2011, 2, 1), set([i])], f3='server')
+            m.tc0.create_child(test_id='c%d' % i, f1=i)
+        # The streamed JSON is the same as encoding to_struct, for the collection, a model and with fields.
+        for obj, fields in ((c, None), (c, ['f1']), (c['t1'], None), (c['t2'], ['f2', 'tc0'])):
+            expected = xjson.loads(xjson.dumps(obj.to_struct(fields=fields)))
+            self.assertEqual(xjson.loads(''.join(chips.iter_json(obj, fields=fields))), expected)
+        self.assertTrue('f3' not in xjson.loads(''.join(chips.iter_json(c['t1']))))
+        # The JSON is joined into chunks of at least chunk_size bytes.
+        chunks = list(chips.iter_json(c, chunk_size=256))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(chunk) >= 256 for chunk in chunks[:-1]))
+
     def test_lazy_field(self):
         class TestLazyFieldModel(chips.Model):
             id_field = chips.RootId('lazy_field_root')
@@ -286,6 +320,143 @@ class TestChipsModel(unittest.TestCase):
         # then there is an assertion failure as there is no support for reparenting.
         self.assertRaises(AssertionError, m.set_silent, lazy_field=t)
 
+    def test_dependent_field(self):
+        loads = []
+        def load_total(m):
+            loads.append('total')
+            return sum(t.f1 for t in m.tc0.itervalues())
+        class TestTrackedCollection(chips.Collection):
+            model_class = TestModel
+            track_dependents = True
+            tracked_fields = frozenset(['f1'])
+        class TestDependentRoot(chips.Model):
+            id_field = chips.RootId('root')
+            fields = frozenset(['total', 'constant'])
+            collections = frozenset(['tc0'])
+            total = chips.DependentField("total", load_total)
+            constant = chips.DependentField("constant", lambda m: 'constant')
+            def load_dependents(self, collection):
+                self.load_dependent_fields(collection)
+
+        r = TestDependentRoot(tc0=TestTrackedCollection('tc0', {'test_id':'id1', 'f1':1}))
+        # A dependent which has never been loaded is loaded before the collection changes so its
+        # previous value is known. Only those which read the collection are marked stale.
+        r.tc0.create_child(test_id='id2', f1=2)
+        self.assertEqual(loads, ['total'])
+        self.assertEqual(r.tc0._stale_dependents, [(r, TestDependentRoot.total, 1)])
+        self.assertEqual(r.total, 3)
+        self.assertEqual(r.constant, 'constant')
+
+        # Changing a tracked field marks the dependent stale, keeping the value which was sent.
+        r.tc0._stale_dependents = None
+        r.tc0['id1'].f1 = 5
+        self.assertEqual(r.tc0._stale_dependents, [(r, TestDependentRoot.total, 3)])
+        self.assertEqual(r.total, 7)
+        self.assertEqual(loads, ['total', 'total', 'total'])
+        # Changing an untracked field or setting a field silently does not.
+        r.tc0._stale_dependents = None
+        r.tc0['id1'].set_silent(f1=10)
+        self.assertEqual(r.tc0._stale_dependents, None)
+        self.assertEqual(r.total, 7)
+        r.tc0.delete_child(r.tc0['id2'])
+        self.assertEqual(r.tc0._stale_dependents, [(r, TestDependentRoot.total, 7)])
+        self.assertEqual(r.total, 10)
+
+    def test_dependent_field_reads(self):
+        loads = []
+        def loader(name, func):
+            def load(m):
+                loads.append(name)
+                return func(m)
+            return load
+        class TestTrackedCollection(chips.Collection):
+            model_class = TestModel
+            track_dependents = True
+        class TestDependentRoot(chips.Model):
+            id_field = chips.RootId('root')
+            fields = frozenset(['total', 'doubled', 'count'])
+            collections = frozenset(['tc0', 'tc1'])
+            total = chips.DependentField("total", loader('total', lambda m: sum(t.f1 for t in m.tc0.itervalues())))
+            # A dependent reading another reads the same collections.
+            doubled = chips.DependentField("doubled", loader('doubled', lambda m: m.total * 2))
+            count = chips.DependentField("count", loader('count', lambda m: len(m.tc1)))
+            def load_dependents(self, collection):
+                self.load_dependent_fields(collection)
+
+        r = TestDependentRoot(tc0=TestTrackedCollection('tc0', {'test_id':'id1', 'f1':1}),
+                              tc1=TestTrackedCollection('tc1'))
+        # Every dependent which has never been loaded is loaded before the first change.
+        r.tc0.create_child(test_id='id2', f1=2)
+        self.assertEqual(sorted(loads), ['count', 'doubled', 'total'])
+        self.assertEqual(sorted((f._wrapped_name, old) for m, f, old in r.tc0._stale_dependents),
+                         [('doubled', 2), ('total', 1)])
+        # The stale dependents are known to only read tc0, so are not loaded before tc1 changes.
+        r.tc0._stale_dependents = None
+        del loads[:]
+        r.tc1.create_child(test_id='id3', f1=0)
+        self.assertEqual(loads, [])
+        self.assertEqual(r.tc1._stale_dependents, [(r, TestDependentRoot.count, 0)])
+        self.assertEqual((r.doubled, r.count), (6, 1))
+
+    def test_dependent_field_threads(self):
+        import threading
+        class TestTrackedCollection(chips.Collection):
+            model_class = TestModel
+            track_dependents = True
+        other = TestTrackedCollection('tc0', {'test_id':'id1', 'f1':1})
+        def load_total(m):
+            # A Collection read by another thread while this loader runs is not a read of this field.
+            reader = threading.Thread(target=lambda: len(other))
+            reader.start()
+            reader.join()
+            return sum(t.f1 for t in m.tc0.itervalues())
+        class TestDependentRoot(chips.Model):
+            id_field = chips.RootId('root')
+            fields = frozenset(['total'])
+            collections = frozenset(['tc0'])
+            total = chips.DependentField("total", load_total)
+
+        r = TestDependentRoot(tc0=TestTrackedCollection('tc0', {'test_id':'id1', 'f1':2}))
+        self.assertEqual(r.total, 2)
+        self.assertEqual(r.tc0._dependents.keys(), [(id(r), 'total')])
+        self.assertEqual(other._dependents, None)
+
+    def test_dependent_field_chips(self):
+        class TestTrackedCollection(chips.Collection):
+            model_class = TestModel
+            track_dependents = True
+        class TestDependentRoot(chips.Model):
+            id_field = chips.RootId('root')
+            fields = frozenset(['total'])
+            collections = frozenset(['tc0'])
+            total = chips.DependentField("total", lambda m: sum(t.f1 for t in m.tc0.itervalues()))
+            # A server only dependent which handles its own changes.
+            largest = chips.DependentField("largest", lambda m: max(t.f1 for t in m.tc0.itervalues()),
+                                           changed=lambda m, old, new: changes.append((old, new)))
+            def load_dependents(self, collection):
+                self.load_dependent_fields(collection)
+
+        changes = []
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = get_user(ctx)
+                since = datetime.utcnow() - timedelta(seconds=1)
+                since = since.replace(microsecond=0)
+
+                r = TestDependentRoot(tc0=TestTrackedCollection('tc0', {'test_id':'id1', 'f1':1}))
+                t = r.tc0.create_child(test_id='id2', f1=0)
+                # The dependent is refreshed once the change has been sent, and only changed values are sent.
+                t.send_chips(ctx, user)
+                c = chips.get_chips(ctx, user, since, datetime.utcnow(), True)
+                self.assertEqual([chip['action'] for chip in c], [chips.ADD])
+                t.f1 = 2
+                t.send_chips(ctx, user)
+                c = chips.get_chips(ctx, user, since, datetime.utcnow(), True)
+                self.assertEqual(len(c), 3)
+                self.assertEqual(c[2]['path'], ['root'])
+                self.assertEqual(c[2]['value'], {'total':3})
+                self.assertEqual(changes, [(1, 2)])
+
     def test_root_obj(self):
         class TestSimpleRoot(chips.Model):
             id_field = chips.RootId('root')
@@ -322,6 +493,49 @@ class TestChipsModel(unittest.TestCase):
              'value': {'child_id': 'child', 'f':'new_value'},
              'time': chip[0]['time']})
 
+    def test_slots(self):
+        class TestSlotsModel(chips.Model):
+            id_field = 'test_id'
+            fields = frozenset(['f1', 'lazy_field', 'computed'])
+            __slots__ = ('_extra',)
+            lazy_field = chips.LazyField("lazy_field", lambda m: "Lazy Loaded")
+            @property
+            def computed(self):
+                return self.f1 * 2
+        class TestSlotsSubModel(TestSlotsModel):
+            fields = frozenset(['f1', 'lazy_field', 'computed', 'f2'])
+
+        # Slots are generated for the fields, id_field and LazyField cached values but not for any field
+        # which is a class attribute.
+        self.assertEqual(set(TestSlotsModel.__slots__), set(['_extra', 'test_id', 'f1', '_lazy_field']))
+        self.assertEqual(TestSlotsModel._required_fields, ('f1',))
+        # Subclasses only add slots for their new fields.
+        self.assertEqual(TestSlotsSubModel.__slots__, ('f2',))
+        self.assertEqual(TestSlotsSubModel._required_fields, ('f1', 'f2'))
+
+        m = TestSlotsSubModel(test_id='id1', f1=1, f2=2)
+        self.assertFalse(hasattr(m, '__dict__'))
+        self.assertEqual(m.lazy_field, "Lazy Loaded")
+        self.assertEqual(m.computed, 2)
+        m._extra = 'extra'
+        def _set_undeclared():
+            m._undeclared = 'value'
+        self.assertRaises(AttributeError, _set_undeclared)
+
+        # The changed fields set is only created when a field changes.
+        self.assertIsNone(m._changed_fields)
+        self.assertEqual(m._pending_chips(), [])
+        m.f2 = 3
+        self.assertEqual(m._changed_fields, set(['f2']))
+
+        def _define_conflicting_cached_name():
+            class TestConflictModel(chips.Model):
+                id_field = 'test_id'
+                fields = frozenset(['f1'])
+                f1 = chips.LazyField("f1", lambda m: None)
+                _f1 = None
+        self.assertRaises(chips.ChipsError, _define_conflicting_cached_name)
+
 class TestChipsCollection(unittest.TestCase):
     def tearDown(self):
         clear_database()
@@ -404,6 +618,31 @@ class TestChipsCollection(unittest.TestCase):
         c1._set_parent(c)
         self.assertEqual(c1._chip_path(), ['root', 'tc0', 'tc1'])
 
+    def test_cached_paths(self):
+        class TestParentModel(chips.Model):
+            fields = frozenset(['f1'])
+            collections = frozenset(['children'])
+            id_field = 'test_id'
+        class TestParentCollection(chips.Collection):
+            model_class = TestParentModel
+
+        r = TestRoot()
+        c1 = TestParentCollection('tc1')
+        c1._set_parent(r)
+        p = c1.create_child(test_id='id1', f1=0, children=TestCollection('children'))
+        t = p.children.create_child(test_id='id2', f1=0)
+        self.assertEqual(t._chip_path(), ['root', 'tc1', 'id1', 'children', 'id2'])
+        # The cached path is copied.
+        t._chip_path().append('extra')
+        self.assertEqual(p.children._chip_path(), ['root', 'tc1', 'id1', 'children'])
+        # Each model builds its path once.
+        self.assert_(t._cached_chip_path() is t._cached_chip_path())
+        # Changing the id of a parent changes the paths below it.
+        p.test_id = 'id3'
+        self.assertEqual(t._chip_path(), ['root', 'tc1', 'id3', 'children', 'id2'])
+        self.assertEqual(t._pending_chips()[0]['path'], ['root', 'tc1', 'id3', 'children', 'id2'])
+        self.assertEqual(p._chip_path(), ['root', 'tc1', 'id3'])
+
     def test_to_struct(self):
         c = TestCollection('tc1')
         c.create_child(test_id='t1', f1='v1')
@@ -504,3 +743,257 @@ class TestChipsInFuture(unittest.TestCase):
                      'transient': 1,
                      'value': {},
                      'time': deliver_at_micros})
+
+    def test_chip_watermark(self):
+        from front.lib import gametime
+        now = datetime.utcnow()
+        gametime.set_now(now)
+        try:
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                with db.conn(ctx) as ctx:
+                    user = get_user(ctx)
+                    root = TestRoot()
+                    # Without any chips there is no watermark and no_chips_since cannot prove anything.
+                    self.assertFalse(chips.no_chips_since(ctx, user.user_id, now - timedelta(minutes=1), now))
+
+                    chips.send(ctx, user, chips.ADD, ['root', 'tc0', 'id0'], {'test_id':'id0', 'f1':0}, now)
+                    deliver_at = now + timedelta(minutes=10)
+                    chips.add_in_future(ctx, user, root.tc0, deliver_at, test_id='id1', f1=1)
+
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                # The chip sent now is only excluded once it has been seen.
+                self.assertFalse(chips.no_chips_since(ctx, user.user_id, now - timedelta(minutes=1), now))
+                self.assertTrue(chips.no_chips_since(ctx, user.user_id, now, now + timedelta(minutes=1)))
+                # The future chip is not excluded once it would be delivered.
+                self.assertFalse(chips.no_chips_since(ctx, user.user_id, now, deliver_at))
+                self.assertEqual(len(chips.get_chips(ctx, user, now, now, True)), 0)
+
+            # Once gametime has passed the future chip it is fetched and the watermark catches up.
+            gametime.set_now(deliver_at + timedelta(minutes=1))
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                self.assertFalse(chips.no_chips_since(ctx, user.user_id, now, gametime.now()))
+                self.assertEqual(len(chips.get_chips(ctx, user, now, gametime.now(), True)), 1)
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                self.assertTrue(chips.no_chips_since(ctx, user.user_id, deliver_at, gametime.now()))
+                count = db.query_count(ctx)
+                self.assertEqual(len(chips.get_chips(ctx, user, deliver_at, gametime.now(), True)), 0)
+                # Only the watermark was read.
+                self.assertEqual(db.query_count(ctx), count + 1)
+        finally:
+            gametime.unset_now()
+
+class TestChipsBuffer(unittest.TestCase):
+    def tearDown(self):
+        clear_database()
+
+    def test_chips_buffered_until_commit(self):
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=1)
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = get_user(ctx)
+                count = db.query_count(ctx)
+                for i in range(5):
+                    chips.send(ctx, user, chips.ADD, ['root', 'tc0', 'id%d' % i], {'test_id':'id%d' % i, 'f1':i}, now)
+                # Sending chips should not have run any queries.
+                self.assertEqual(db.query_count(ctx), count)
+
+                # get_chips flushes the buffer with a single INSERT before selecting and the chips
+                # are returned in the order they were sent.
+                c = chips.get_chips(ctx, user, since, now, True)
+                self.assertEqual(db.query_count(ctx), count + 2)
+                self.assertEqual([chip['value']['f1'] for chip in c], range(5))
+
+                # Chips still buffered at the end of the transaction are inserted before the commit.
+                chips.send(ctx, user, chips.MOD, ['root', 'tc0', 'id0'], {'test_id':'id0', 'f1':'new'}, now)
+
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                c = chips.get_chips(ctx, user, since, now, True)
+                self.assertEqual(len(c), 6)
+                self.assertEqual(c[-1]['value'], {'test_id':'id0', 'f1':'new'})
+
+        # Buffered chips are discarded if the transaction is rolled back.
+        try:
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                with db.conn(ctx) as ctx:
+                    chips.send(ctx, user, chips.DELETE, ['root', 'tc0', 'id1'], {}, now)
+                    raise Exception("Test failure.")
+        except:
+            pass
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                c = chips.get_chips(ctx, user, since, now, True)
+                self.assertEqual(len(c), 6)
+
+    def test_wait_for_chips(self):
+        import threading, time
+        from front.lib import gametime
+        since = gametime.now() - timedelta(seconds=1)
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = get_user(ctx)
+                user_id = user.user_id
+
+        # With no new chips the wait times out.
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            self.assertFalse(chips.wait_for_chips(ctx, user_id, since, 0.2))
+
+        # Chips sent by another request in this process wake the waiting request once committed,
+        # without waiting for the next database recheck.
+        def send_chip():
+            time.sleep(0.2)
+            with db.commit_or_rollback(get_ctx()) as ctx:
+                with db.conn(ctx) as ctx:
+                    chips.send(ctx, user, chips.ADD, ['root', 'tc0', 'id0'], {'test_id':'id0', 'f1':0}, gametime.now())
+        sender = threading.Thread(target=send_chip)
+        sender.start()
+        start = time.time()
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            self.assertTrue(chips.wait_for_chips(ctx, user_id, since, chips.LONG_POLL_MAX_WAIT_SECONDS))
+        self.assertTrue(time.time() - start < chips.LONG_POLL_RECHECK_SECONDS)
+        sender.join()
+
+        # The chip is already there so there is no wait at all.
+        with db.commit_or_rollback(get_ctx()) as ctx:
+            self.assertTrue(chips.wait_for_chips(ctx, user_id, since, 0))
+
+class TestChipsCompaction(unittest.TestCase):
+    """ Replays random chip streams and their compacted form through a model of the client chip applier. """
+    ITERATIONS = 300
+
+    class ClientNode(object):
+        def __init__(self, fields):
+            self.fields = dict(fields)
+            self.collections = {}
+
+        def to_struct(self):
+            return (self.fields, dict((name, dict((i, c.to_struct()) for i, c in children.iteritems()))
+                                      for name, children in self.collections.iteritems() if children))
+
+    def apply_chips(self, root, chip_list):
+        """ Applies chips the way lazy8.chips.RootModel does, raising an error for any invalid chip. """
+        for chip in chip_list:
+            path = chip['path']
+            node = root
+            for i in xrange(1, len(path) - 2, 2):
+                node = node.collections[path[i]][path[i + 1]]
+            if len(path) == 1:
+                self.assertEqual(chip['action'], chips.MOD)
+                node.fields.update(chip['value'])
+                continue
+            collection = node.collections.setdefault(path[-2], {})
+            if chip['action'] == chips.ADD:
+                if path[-1] in collection:
+                    collection[path[-1]].fields.update(chip['value'])
+                else:
+                    collection[path[-1]] = self.ClientNode(chip['value'])
+            elif chip['action'] == chips.MOD:
+                collection[path[-1]].fields.update(chip['value'])
+            else:
+                del collection[path[-1]]
+
+    def last_seen(self, chip_list):
+        return max(int(chip['time']) for chip in chip_list)
+
+    def random_chips(self, rand, root):
+        """ Generate a valid stream of chips against the given client state as the server might. """
+        # Track the server's view of which models exist as paths.
+        existing = [('user',)]
+        for rover_id, rover in root.collections['rovers'].iteritems():
+            existing.append(('user', 'rovers', rover_id))
+            for target_id in rover.collections.get('targets', {}):
+                existing.append(('user', 'rovers', rover_id, 'targets', target_id))
+        chip_list = []
+        for i in xrange(rand.randint(1, 80)):
+            time = str(1000000 + i)
+            path = rand.choice(existing)
+            roll = rand.random()
+            if roll < 0.3 and len(path) < 5:
+                new_path = path + (('rovers',) if len(path) == 1 else ('targets',)) + ('id%d' % i,)
+                value = {'f1': rand.randint(0, 9), 'f2': {'x': i}}
+                chip_list.append({'action': chips.ADD, 'path': list(new_path), 'value': value, 'time': time, 'transient': 1})
+                existing.append(new_path)
+            elif roll < 0.8:
+                value = rand.choice([{'f1': rand.randint(0, 9)}, {'f2': {'y': i}}, {'f1': i, 'f3': 'v%d' % i}])
+                chip_list.append({'action': chips.MOD, 'path': list(path), 'value': value, 'time': time, 'transient': 1})
+            elif len(path) > 1:
+                chip_list.append({'action': chips.DELETE, 'path': list(path), 'value': {}, 'time': time, 'transient': 1})
+                existing = [p for p in existing if p[:len(path)] != path]
+        return chip_list
+
+    def initial_state(self):
+        root = self.ClientNode({'f1': 0})
+        root.collections['rovers'] = {}
+        for rover_id in ('r1', 'r2'):
+            rover = self.ClientNode({'f1': 0})
+            rover.collections['targets'] = {'t1': self.ClientNode({'f1': 0}), 't2': self.ClientNode({'f1': 1})}
+            root.collections['rovers'][rover_id] = rover
+        return root
+
+    def test_compacted_chips_match_raw_chips(self):
+        import random
+        rand = random.Random(1234)
+        raw_total = compacted_total = 0
+        for i in xrange(self.ITERATIONS):
+            chip_list = self.random_chips(rand, self.initial_state())
+            original = repr(chip_list)
+            compacted = chips.compact_chips(chip_list)
+            # The original chips are left as they were.
+            self.assertEqual(repr(chip_list), original)
+            self.assertTrue(len(compacted) <= len(chip_list))
+
+            raw_root, compacted_root = self.initial_state(), self.initial_state()
+            self.apply_chips(raw_root, chip_list)
+            self.apply_chips(compacted_root, compacted)
+            self.assertEqual(compacted_root.to_struct(), raw_root.to_struct())
+            if len(compacted) > 0:
+                self.assertEqual(self.last_seen(compacted), self.last_seen(chip_list))
+            raw_total += len(chip_list)
+            compacted_total += len(compacted)
+        # Random streams touch the same few models often enough that compaction should help.
+        self.assertTrue(compacted_total < raw_total)
+
+    def test_compact_chips(self):
+        path = ['user', 'rovers', 'r1']
+        chip_list = [
+            {'action': chips.ADD, 'path': path, 'value': {'f1': 1}, 'time': '1', 'transient': 1},
+            {'action': chips.MOD, 'path': path, 'value': {'f1': 2}, 'time': '2', 'transient': 1},
+            {'action': chips.MOD, 'path': path, 'value': {'f2': 3}, 'time': '3', 'transient': 1},
+        ]
+        self.assertEqual(chips.compact_chips(chip_list),
+            [{'action': chips.ADD, 'path': path, 'value': {'f1': 2, 'f2': 3}, 'time': '3', 'transient': 1}])
+
+        # Adding then deleting leaves nothing.
+        chip_list.append({'action': chips.DELETE, 'path': path, 'value': {}, 'time': '4', 'transient': 1})
+        self.assertEqual(chips.compact_chips(chip_list), [])
+
+class TestChipsEncoding(unittest.TestCase):
+    def assertRoundTrip(self, action, path, value):
+        content = chips._encode_chip_content(action, path, value)
+        self.assertEqual(chips._decode_chip_content(content), {'action': action, 'path': path, 'value': value})
+        return content
+
+    def test_encode_chip_content(self):
+        content = self.assertRoundTrip(chips.MOD, ['user', 'rovers', 'r1', 'targets', 't1'], {'processed': 1})
+        self.assertTrue(len(content) < len(xjson.dumps({'action': chips.MOD, 'value': {'processed': 1},
+                                                        'path': ['user', 'rovers', 'r1', 'targets', 't1']})))
+        # Integer path elements must not be confused with encoded path words.
+        self.assertRoundTrip(chips.ADD, ['user', 'unknown_collection', 0, 1], {'f1': None})
+        self.assertRoundTrip(chips.DELETE, ['user', 'missions', 'M1'], {})
+
+        # Large values are compressed.
+        value = dict(('field_%d' % i, 'value') for i in range(100))
+        content = self.assertRoundTrip(chips.ADD, ['user', 'species', 's1'], value)
+        self.assertEqual(content[0], chips._CHIP_ZLIB)
+
+    def test_decode_legacy_chip_content(self):
+        chip = {'action': chips.MOD, 'path': ['user', 'rovers', 'r1'], 'value': {'lat': 1.5}}
+        self.assertEqual(chips._decode_chip_content(xjson.dumps(chip)), chip)
+
+        chips.ENCODE_CHIPS = False
+        try:
+            content = self.assertRoundTrip(chip['action'], chip['path'], chip['value'])
+            self.assertEqual(xjson.loads(content), chip)
+        finally:
+            chips.ENCODE_CHIPS = True
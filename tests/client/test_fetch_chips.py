@@ -1,8 +1,10 @@
 # Copyright (c) 2010-2011 Lazy 8 Studios, LLC.
 # All rights reserved.
+import zlib
 from datetime import timedelta
 
-from front.lib import urls, gametime, utils
+from front import resource
+from front.lib import urls, gametime, utils, xjson
 
 from front.tests import base
 from front.tests.base import points
@@ -47,3 +49,25 @@ class TestFetchChips(base.TestCase):
         self.logout_user()
         response = self.fetch_chips(status=400)
         self.assertTrue(len(response['errors']) > 0)
+
+    def test_fetch_chips_gzip(self):
+        self.create_target(**points.FIRST_MOVE)
+        params = {'last_seen_chip_time': utils.usec_js_from_dt(gametime.now() - timedelta(minutes=1))}
+        plain = self.app.get(urls.fetch_chips(), params=params, headers=[xjson.accept])
+        self.assertTrue('Content-Encoding' not in plain.headers)
+        # Compress even the smallest response so the test does not depend on how many chips were sent.
+        gzip_min_bytes, resource.GZIP_MIN_BYTES = resource.GZIP_MIN_BYTES, 0
+        try:
+            # A client which does not accept gzip still gets a plain response.
+            refused = self.app.get(urls.fetch_chips(), params=params,
+                                   headers=[xjson.accept, ('Accept-Encoding', 'identity, gzip;q=0')])
+            self.assertTrue('Content-Encoding' not in refused.headers)
+            self.assertEqual(refused.body, plain.body)
+
+            compressed = self.app.get(urls.fetch_chips(), params=params,
+                                      headers=[xjson.accept, ('Accept-Encoding', 'gzip, deflate')])
+        finally:
+            resource.GZIP_MIN_BYTES = gzip_min_bytes
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(xjson.loads(zlib.decompress(compressed.body, 16 + zlib.MAX_WBITS)), xjson.loads(plain.body))
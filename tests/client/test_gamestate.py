@@ -2,6 +2,7 @@
 # All rights reserved.
 from front.models import chips
 from front.models import species as species_module
+from front.backend import gamestate_cache
 
 from front.tests import base
 from front.tests.base import points, rects
@@ -21,6 +22,35 @@ class TestGamestate(base.TestCase):
         response = self.get_gamestate(status=400)
         self.assertEqual(response['errors'], ['Unauthorized request.'])
 
+    def test_gamestate_snapshot_cache(self):
+        cache = gamestate_cache.LRUSnapshotCache()
+        def assert_cached_gamestate_correct():
+            gamestate_cache.set_cache(cache)
+            try:
+                cached = self.get_gamestate(skip_validation=False)
+            finally:
+                gamestate_cache.set_cache(None)
+            self.assertEqual(cached['user'], self.get_gamestate()['user'])
+            return cached
+
+        assert_cached_gamestate_correct()
+        self.assertEqual(len(cache), 1)
+        # The second request is answered from the snapshot.
+        assert_cached_gamestate_correct()
+
+        # Creating and rendering a target sends chips, including a future chip revealing the images on arrival.
+        self.create_target(arrival_delta=base.SIX_HOURS)
+        gamestate = assert_cached_gamestate_correct()
+        self.assertTrue(self.get_most_recent_target_from_gamestate(gamestate)['images'] == {})
+        self.render_next_target(assert_only_one=True)
+        assert_cached_gamestate_correct()
+        assert_cached_gamestate_correct()
+
+        # The snapshot taken before arrival is not used once the images are visible.
+        self.advance_now(hours=6)
+        gamestate = assert_cached_gamestate_correct()
+        self.assertTrue(len(self.get_most_recent_target_from_gamestate(gamestate)['images']) > 0)
+
     # If these resources ever become more complicated than just having mark_viewed,
     # move them to their own test modules.
     def test_mission_mark_viewed(self):
@@ -90,9 +90,88 @@ class TestDB(base.TestCase):
                 self.assertEqual(len(rows), 1)
                 self.assertEqual(rows[0]['test_field'], 42)
 
+                # Any write clears the cache.
+                db.run(ctx, 'test/insert_test_row', test_field=43)
+                rows = ctx.row_cache.get_rows_from_query('test/select_test_rows')
+                self.assertIsNone(rows)
+
+                # Cache the rows from several queries in a single round trip, under names other than the query names.
+                start_count = db.query_count(ctx)
+                ctx.row_cache.set_rows_from_queries(ctx, [
+                    ('all', lambda r: [], 'test/select_test_rows', {}),
+                    ('by_field', lambda r: [r['test_field']], 'test/select_test_rows_by_test_field', {'test_field': 43})])
+                self.assertEqual(db.query_count(ctx) - start_count, 1)
+                rows = ctx.row_cache.get_rows_from_query('all')
+                self.assertEqual(sorted(r['test_field'] for r in rows), [42, 43])
+                rows = ctx.row_cache.get_rows_from_query('by_field', 43)
+                self.assertEqual(len(rows), 1)
+                self.assertEqual(ctx.row_cache.get_rows_from_query('by_field', 42), [])
+                self.assertIsNone(ctx.row_cache.get_rows_from_query('test/select_test_rows'))
+
+                # Committing clears the cache.
+                db.commit(ctx)
+                self.assertIsNone(ctx.row_cache.get_rows_from_query('all'))
+
+                # Cleanup the test database.
+                db.run(ctx, 'test/drop_test_table')
+
+    def test_multi_rows(self):
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/create_test_table')
+                db.run(ctx, 'test/insert_test_row', test_field=1)
+                db.run(ctx, 'test/insert_test_row', test_field=2)
+
+                start_count = db.query_count(ctx)
+                results = db.multi_rows(ctx, [('test/select_test_rows', {}),
+                                              ('test/select_test_rows_by_test_field', {'test_field': 2}),
+                                              ('test/select_test_rows_by_test_field', {'test_field': 3})])
+                self.assertEqual(db.query_count(ctx) - start_count, 1)
+                self.assertEqual(len(results), 3)
+                self.assertEqual(sorted(r['test_field'] for r in results[0]), [1, 2])
+                self.assertEqual(results[1], [{'test_field': 2}])
+                self.assertEqual(results[2], [])
+                # The connection is usable for single queries afterwards.
+                self.assertEqual(len(db.rows(ctx, 'test/select_test_rows')), 2)
+
                 # Cleanup the test database.
                 db.run(ctx, 'test/drop_test_table')
 
+    def test_iter_rows(self):
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/create_test_table')
+                for i in range(5):
+                    db.run(ctx, 'test/insert_test_row', test_field=i)
+                # The rows are streamed from a separate connection so need to be committed to be seen.
+                db.commit(ctx)
+
+                # Iterate in batches smaller than the result set, running other queries on the
+                # current connection while iterating.
+                seen = []
+                for row in db.iter_rows(ctx, 'test/select_test_rows', batch_size=2):
+                    seen.append(row['test_field'])
+                    self.assertEqual(row.keys(), ['test_field'])
+                    self.assertEqual(row.get('missing'), None)
+                    self.assertEqual(len(db.rows(ctx, 'test/select_test_rows_by_test_field', test_field=row['test_field'])), 1)
+                self.assertEqual(sorted(seen), range(5))
+                self.assertEqual(len(ctx.streaming_connections), 0)
+
+                # Stopping iteration early releases the streaming connection.
+                rows = db.iter_rows(ctx, 'test/select_test_rows', batch_size=2)
+                rows.next()
+                rows.close()
+                self.assertEqual(len(ctx.streaming_connections), 0)
+
+                # A streaming connection which is never iterated is released when the ctx is closed.
+                rows = db.iter_rows(ctx, 'test/select_test_rows')
+                self.assertEqual(len(ctx.streaming_connections), 1)
+        self.assertEqual(len(ctx.streaming_connections), 0)
+
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/drop_test_table')
+
     def test_database_middleware(self):
         # Insert code into the default target_created callback behavior which can optionally
         # raise a known exception. This will be used to test the middleware.
@@ -172,6 +251,71 @@ class TestDB(base.TestCase):
             with db.conn(ctx) as ctx:
                 db.run(ctx, 'test/drop_test_table')
 
+    def test_connection_pool(self):
+        def pool_for_test_db():
+            name = "%s/%s" % (self.get_ctx().get('database.host'), db._dbname(self.get_ctx()))
+            return [s for s in db.pool_stats() if s['name'] == name][0]
+
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/create_test_table')
+                stats = pool_for_test_db()
+                self.assertTrue(stats['checked_out'] >= 1)
+        stats = pool_for_test_db()
+        self.assertEqual(stats['checked_out'], 0)
+        idle = stats['idle']
+        self.assertTrue(idle >= 1)
+        opened = stats['opened']
+
+        # A second request should reuse the idle connection and not open a new one.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/insert_test_row', test_field=0)
+                self.assertEqual(pool_for_test_db()['idle'], idle - 1)
+        stats = pool_for_test_db()
+        self.assertEqual(stats['opened'], opened)
+        self.assertEqual(stats['idle'], idle)
+        self._assert_test_row_count_in_db(1)
+
+        # A connection returned to the pool after an exception must not leak the uncommitted
+        # transaction into the next checkout.
+        try:
+            with db.commit_or_rollback(self.get_ctx()) as ctx:
+                with db.conn(ctx) as ctx:
+                    db.run(ctx, 'test/insert_test_row', test_field=1)
+                    raise Exception("Test failure.")
+        except:
+            pass
+        self._assert_test_row_count_in_db(1)
+
+        # A connection opened with an explicit timeout is never pooled.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx, timeout=10) as ctx:
+                db.run(ctx, 'test/insert_test_row', test_field=2)
+        stats = pool_for_test_db()
+        self.assertEqual(stats['opened'], opened)
+        self._assert_test_row_count_in_db(2)
+
+        # A connection whose rollback fails (e.g. the server went away) is discarded and its pool slot released.
+        discarded = pool_for_test_db().get('discarded', 0)
+        try:
+            with db.commit_or_rollback(self.get_ctx()) as ctx:
+                with db.conn(ctx) as ctx:
+                    db.run(ctx, 'test/insert_test_row', test_field=3)
+                    ctx.current_conn.close()
+                    raise Exception("Test failure.")
+        except:
+            pass
+        stats = pool_for_test_db()
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['discarded'], discarded + 1)
+        self._assert_test_row_count_in_db(2)
+
+        # Cleanup the test database.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                db.run(ctx, 'test/drop_test_table')
+
     def test_migrations(self):
         TEST_DB = 'test_migrations_db'
 
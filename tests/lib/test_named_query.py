@@ -567,11 +567,77 @@ class StaticNamedQueryTester(NamedQueryTestBase):
         nq.refresh()
         self.assertEqual(nq._base_query, orig_query)
 
+    def test_refresh_never(self):
+        # A manager created with NEVER_REFRESH should never look at the filesystem after loading a query.
+        manager = named_query.NamedQueryManager(self.temp_sql_dir, stat_interval_seconds=named_query.NEVER_REFRESH)
+        filename = self.write_temp_sql('never', {'base':"orig_query"})
+        os.utime(filename, (os.path.getatime(filename), os.path.getmtime(filename) - 5))
+        nq = manager.get('never')
+
+        self.write_temp_sql('never', {'base':"new_query"})
+        self.assertTrue(manager.get('never') is nq)
+        self.assertEqual(nq._construct_sql({})[0], "orig_query")
+        os.remove(filename)
+        self.assertTrue(manager.get('never') is nq)
+        self.assertEqual(nq._construct_sql({})[0], "orig_query")
+
+    def test_query_plans_cached_per_options(self):
+        nq = self.named_query_for('case_3', CASE_3)
+        without = nq.sql(self.dbh, {'owner_id':'ZOMG'})
+        with_option = nq.sql(self.dbh, {'owner_id':'ZOMG', 'select_public':True})
+        self.assertNotEqual(without, with_option)
+        # One plan is compiled per combination of selected options and reused.
+        self.assertEqual(len(nq._plans), 2)
+        self.assertEqual(nq.sql(self.dbh, {'owner_id':'ZOMG'}), without)
+        self.assertEqual(nq.sql(self.dbh, {'owner_id':'ZOMG', 'select_public':1}), with_option)
+        self.assertEqual(len(nq._plans), 2)
+
+        # Array slots are expanded per call even though the plan is shared.
+        nq = self.named_query_for('case_10', CASE_10)
+        self.assert_("('abcd','efgh')" in nq.sql(self.dbh, {'id_list':['abcd','efgh']}))
+        self.assert_("('abcd')" in nq.sql(self.dbh, {'id_list':'abcd'}))
+        self.assertEqual(len(nq._plans), 1)
+
+    def test_uuid_and_unicode_params_encoded(self):
+        import uuid
+        nq = self.named_query_for('case_2', CASE_2)
+        owner_id = uuid.uuid4()
+        full_query, params = nq._construct_sql({'owner_id':owner_id, 'unused':u'caf\u00e9'})
+        self.assertEqual(params['owner_id'], owner_id.bytes)
+        full_query, params = nq._construct_sql({'owner_id':u'caf\u00e9'})
+        self.assertEqual(params['owner_id'], 'caf\xc3\xa9')
+
     def test_literal_percent(self):
         query = "SELECT DATE_FORMAT( NOW(), '%h:%i' ) as time"
         nq = self.named_query_for('literal_percents', {'base':query})
         sql = nq.sql(self.dbh, {})
         self.assertEqual(sql, query)
 
+    def test_run_batch(self):
+        executed = []
+        class FakeCursor(object):
+            """ Returns one single column result set per statement, holding the statement number. """
+            def execute(self, sql):
+                executed.append(sql)
+                self.remaining = range(len(sql.split(';\n')))
+                self.description = [('n',)]
+            def fetchall(self):
+                return [(self.remaining[0],)]
+            def nextset(self):
+                self.remaining.pop(0)
+                return True if self.remaining else None
+            def close(self):
+                pass
+        self.dbh.cursor = FakeCursor
+        self.dbh.literal = lambda v: "'%s'" % (v.encode('utf-8') if isinstance(v, unicode) else v)
+        self.dbh.character_set_name = lambda: 'utf8'
+
+        first = self.named_query_for('case_1', {'base': u"SELECT * FROM a WHERE id=:id"})
+        second = self.named_query_for('case_2', {'base': u"SELECT * FROM b WHERE id=:id AND name LIKE '%x'"})
+        result_sets = named_query.run_batch(self.dbh, [(first, {'id': 1}), (second, {'id': u'caf\xe9'})])
+        self.assertEqual(result_sets, [[{'n': 0}], [{'n': 1}]])
+        # Both statements were sent in a single call with their parameters escaped.
+        self.assertEqual(executed, ["SELECT * FROM a WHERE id='1';\nSELECT * FROM b WHERE id='caf\xc3\xa9' AND name LIKE '%x'"])
+
 if __name__ == '__main__':
     unittest.main()
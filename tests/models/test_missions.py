@@ -5,7 +5,8 @@ from front.lib import db
 from front.models import chips
 from front.models import mission as mission_module
 from front.models import region as region_module
-from front.callbacks import mission_callbacks
+from front import callbacks
+from front.callbacks import mission_callbacks, MISSION_CB
 from front.data import audio_regions
 
 from front.tests import base
@@ -116,6 +117,49 @@ class TestMissions(base.TestCase):
         mission = self.get_mission_from_gamestate('MIS_TEST02')
         self.assertEqual(mission['done'], 1)
 
+    def test_callback_dispatch_tables(self):
+        # A callback which was not overridden runs the BaseCallbacks function.
+        func = callbacks._get_callback_func(MISSION_CB, 'target_created', 'MIS_TEST03')
+        self.assertTrue(func.im_func is mission_callbacks.BaseCallbacks.target_created.im_func)
+        self.assertEqual(callbacks.run_callback(MISSION_CB, 'target_created', 'MIS_TEST03', None, None, None, None), False)
+        self.assertTrue(callbacks._get_callback_func(MISSION_CB, 'region_list', 'MIS_TEST03') is not None)
+
+        # Injecting a callback class replaces the previously resolved function.
+        class MIS_TEST03_Callbacks(mission_callbacks.BaseCallbacks):
+            @classmethod
+            def target_created(self, ctx, user, mission, target):
+                return target
+        self.inject_callback(mission_callbacks, MIS_TEST03_Callbacks)
+        self.assertEqual(callbacks.run_callback(MISSION_CB, 'target_created', 'MIS_TEST03', None, None, None, 'target'), 'target')
+        self.assertTrue(MIS_TEST03_Callbacks in callbacks.get_all_callback_classes(MISSION_CB))
+
+        # Only the missions which can react to an event are interested in it.
+        self.assertTrue('MIS_TEST03' in callbacks.interested_subtypes(MISSION_CB, 'target_created'))
+        self.assertFalse('MIS_TEST03' in callbacks.interested_subtypes(MISSION_CB, 'arrived_at_target'))
+        # EVENT_SUBTYPES limits the species a mission reacts to.
+        interested = callbacks.interested_subtypes(MISSION_CB, 'species_identified', 'SPC_ARTIFACT01')
+        self.assertTrue('MIS_ARTIFACT01' in interested and 'MIS_ARTIFACT01_CLOSEUP' in interested)
+        interested = callbacks.interested_subtypes(MISSION_CB, 'species_identified', 'SPC_PLANT001')
+        self.assertFalse('MIS_ARTIFACT01' in interested or 'MIS_ARTIFACT01_CLOSEUP' in interested)
+
+    def test_mission_index(self):
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                user = self.get_logged_in_user(ctx=ctx)
+                self._assert_mission_index(user.missions)
+                # The parts of each mission were sorted when the missions were loaded.
+                for m in user.missions.itervalues():
+                    self.assertEqual(m.parts, sorted(m.parts, key=lambda p: p.sort, reverse=True))
+                    for p in m.parts:
+                        self.assertTrue(p.mission_parent is m)
+
+                # Marking a mission done moves it between the done and not done indexes.
+                m = user.missions.not_done()[0]
+                m.mark_done()
+                self.assertTrue(m in user.missions.done())
+                self.assertFalse(m in user.missions.not_done())
+                self._assert_mission_index(user.missions)
+
     # Test to see that adding a region in region_list_not_done and adding a different region in region_list_done works.
     def test_mission_region_list_different_regions(self):
         class MIS_TEST03_Callbacks(mission_callbacks.BaseCallbacks):
@@ -305,6 +349,18 @@ class TestMissions(base.TestCase):
         self.assertIsNotNone(target['sounds']['SND_TEST_AUDIO'])
 
     ## Tools for injecting test mission definitions and audio regions for unit testing.
+    def _assert_mission_index(self, missions):
+        """ Assert the indexed lookups of the given MissionCollection agree with walking every mission. """
+        all_missions = missions.values()
+        for root_only in (False, True):
+            self.assertEqual(set(missions.done(root_only=root_only)),
+                             set(m for m in all_missions if m.is_done() and (m.is_root_mission() or not root_only)))
+            self.assertEqual(set(missions.not_done(root_only=root_only)),
+                             set(m for m in all_missions if not m.is_done() and (m.is_root_mission() or not root_only)))
+        for m in all_missions:
+            self.assertTrue(missions.get_only_by_definition(m.mission_definition) is m)
+        self.assertIsNone(missions.get_only_by_definition('MIS_NOT_A_MISSION'))
+
     def _inject_test_mission(self, mission_definition, **kwargs):
         mission_module._add_mission_definition(mission_definition, **kwargs)
         self._injected_missions.append(mission_definition)
@@ -0,0 +1,64 @@
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+from front.lib import geometry
+
+from front.tests import base
+from front.tests.base import points, SIX_HOURS
+
+class TestRover(base.TestCase):
+    def setUp(self):
+        super(TestRover, self).setUp()
+        self.create_user('testuser@example.com', 'pw')
+
+    def test_target_index(self):
+        # Enable the capabilities to allow 3 and 4 moves at a time.
+        self.enable_capabilities_on_active_rover(['CAP_S1_ROVER_3_MOVES', 'CAP_S1_ROVER_4_MOVES'])
+        self.create_target(arrival_delta=SIX_HOURS, **points.FIRST_MOVE)
+        self.create_target(arrival_delta=2*SIX_HOURS, **points.SECOND_MOVE)
+        self.create_target(arrival_delta=3*SIX_HOURS, **points.THIRD_MOVE)
+        # Advance until the first new target has been arrived at.
+        self.advance_now(seconds=SIX_HOURS + 60)
+
+        user = self.get_logged_in_user()
+        rover = user.rovers.active()[0]
+        targets = rover.targets
+        expected = sorted(targets.values(), key=lambda t: t.arrival_time)
+        self.assertEqual(targets.by_arrival_time(), expected)
+        self.assertEqual(targets.by_arrival_time(newest_first=True), list(reversed(expected)))
+        self.assertEqual(targets.first(), expected[0])
+        self.assertEqual(targets.last(), expected[-1])
+        arrived = [t for t in expected if t.has_been_arrived_at()]
+        self.assertEqual(targets.arrived_at(), arrived)
+        self.assertEqual(targets.unarrived_at(), [t for t in expected if not t.has_been_arrived_at()])
+        self.assertEqual(len(targets.unarrived_at()), 2)
+        for i, t in enumerate(expected):
+            self.assertEqual(t.previous(), expected[i-1] if i > 0 else None)
+            self.assertEqual(t.next(), expected[i+1] if i < len(expected) - 1 else None)
+            self.assertEqual(targets.split_on_target(t), (expected[:i+1], expected[i+1:]))
+
+        # Distances are the sum of the straight distances between each pair of targets.
+        def total_distance(sorted_targets):
+            return sum(a.straight_distance_between_targets(b) for a, b in zip(sorted_targets, sorted_targets[1:]))
+        self.assertAlmostEqual(rover.distance_traveled(), total_distance(arrived))
+        self.assertAlmostEqual(rover.distance_will_have_traveled(), total_distance(expected))
+
+        # The location at the start and end of each target, and halfway between, is interpolated between the
+        # targets on either side.
+        for prev_target, current_target in zip(expected, expected[1:]):
+            for at_time in (current_target.start_time, current_target.arrival_time,
+                            (current_target.start_time + current_target.arrival_time) / 2):
+                self.assertEqual(rover.location_at_time(at_time),
+                                 geometry.interpolate_between_targets(current_target, prev_target, at_time))
+        # Before the first target and after the last target the rover is at those targets.
+        self.assertEqual(rover.location_at_time(expected[0].start_time - 1),
+                         geometry.interpolate_between_targets(expected[0], expected[0], expected[0].start_time - 1))
+        self.assertEqual(rover.location_at_time(expected[-1].arrival_time + 1),
+                         geometry.interpolate_between_targets(expected[-1], expected[-2], expected[-1].arrival_time + 1))
+
+        # Deleting the newest target, or moving a target, keeps the index up to date.
+        rover.abort_target(expected[-1])
+        self.assertEqual(targets.by_arrival_time(), expected[:-1])
+        self.assertIsNone(expected[-2].next())
+        expected[-2].arrival_time = expected[0].arrival_time - 1
+        self.assertEqual(targets.first(), expected[-2])
+        self.assertEqual(targets.by_arrival_time(), [expected[-2]] + expected[:-2])
@@ -0,0 +1,65 @@
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+from collections import Counter
+
+from front.models import species, species_tally
+
+from front.tests import base
+from front.tests.base import points, rects
+
+class TestSpeciesTally(base.TestCase):
+    def setUp(self):
+        super(TestSpeciesTally, self).setUp()
+        self.create_user('testuser@example.com', 'pw')
+
+    def test_species_tally(self):
+        # Identify species at two targets.
+        for point, species_rects in ((points.FIRST_MOVE, [rects.SPC_PLANT001]),
+                                     (points.SECOND_MOVE, [rects.SPC_PLANT001, rects.SPC_PLANT004])):
+            self.create_target_and_move(**point)
+            target = self.get_most_recent_target_from_gamestate()
+            self.check_species(str(target['urls']['check_species']), species_rects)
+
+        user = self.get_logged_in_user()
+        plant001 = species.get_id_from_key("SPC_PLANT001")
+        plant004 = species.get_id_from_key("SPC_PLANT004")
+        # The tally agrees with the counts from every image_rect.
+        expected = Counter()
+        for target in user.all_picture_targets():
+            expected += target.species_count()
+        self.assertEqual(user.species_count(), expected)
+        self.assertEqual(user.species_count()[plant001], 2)
+        self.assertEqual(user.species_count()[plant004], 1)
+        self.assertEqual(len(user.species[plant001].target_ids), 2)
+        self.assertEqual(len(user.species[plant004].target_ids), 1)
+        self.assertEqual(user.species_tally.rect_count(), len(user.all_image_rects()))
+        self.assertEqual(user.species_tally.rect_with_species_count(), len(user.all_image_rects_with_species()))
+        walked = []
+        for target in user.all_picture_targets():
+            walked += target.image_rects.values()
+        self.assertEqual(set(user.all_image_rects()), set(walked))
+        self.assertEqual(set(user.image_rects_for_species(plant001)), set(r for r in walked if r.species_id == plant001))
+
+        # Each target's image_rects are indexed by species and seq.
+        target = user.all_picture_targets()[-1]
+        self.assertEqual(target.image_rects.next_seq(), len(target.image_rects))
+        self.assertEqual(target.species_count(), Counter({plant001: 1, plant004: 1}))
+        self.assertEqual([r.species_id for r in target.image_rects.rects_for_species(plant004)], [plant004])
+
+        # Changes to the loaded image_rects are reflected in the tally.
+        image_rect = [r for r in user.all_image_rects() if r.species_id == plant004][0]
+        image_rect.species_id = plant001
+        self.assertEqual(user.species_count()[plant001], 3)
+        self.assertEqual(user.species_count()[plant004], 0)
+        self.assertEqual(image_rect.target.species_count(), Counter({plant001: 2}))
+        self.assertEqual(user.image_rects_for_species(plant004), [])
+        image_rect.target.image_rects.delete_child(image_rect)
+        self.assertEqual(user.species_count()[plant001], 2)
+        self.assertEqual(image_rect.target.image_rects.next_seq(), len(image_rect.target.image_rects))
+        tally = user.species_tally
+        tally.verify(user)
+
+        # A stale tally is detected by verify.
+        tally.add_rect(None, None, image_rect)
+        self.assertNotEqual(tally, species_tally.SpeciesTally.from_user(user))
+        self.assertRaises(Exception, tally.verify, user)
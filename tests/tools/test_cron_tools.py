@@ -18,13 +18,21 @@ class TestCronTools(base.TestCase):
         self.user = self.get_logged_in_user()
 
     def test_vacumm_old_chips(self):
+        # The first vacuum creates the chips partitions for the hours ahead.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            vacuum_old_chips.vacuum_chips(ctx, gametime.now() - timedelta(hours=vacuum_old_chips.DELETE_SINCE_HOURS))
+            with db.conn(ctx) as ctx:
+                partitions = vacuum_old_chips.chip_partitions(ctx)
+        self.assertTrue(len(partitions) > vacuum_old_chips.PARTITIONS_AHEAD_HOURS / vacuum_old_chips.PARTITION_HOURS)
+        self.assertEqual(partitions[-1], (vacuum_old_chips.FUTURE_PARTITION, None))
+
         # Send a dummy message and verify there was a chip issued.
         self.send_message_now(self.user, 'MSG_TEST_SIMPLE')
         chip = self.last_chip_for_path(['user', 'messages', '*'])
         self.assertNotEqual(chip, None)
 
-        # Move time forward.
-        self.advance_now(hours=vacuum_old_chips.DELETE_SINCE_HOURS)
+        # Move time forward far enough that the whole partition holding the chip has expired.
+        self.advance_now(hours=vacuum_old_chips.DELETE_SINCE_HOURS + vacuum_old_chips.PARTITION_HOURS)
 
         # Vacuum the chips older than DELETE_SINCE_HOURS ago.
         with db.commit_or_rollback(self.get_ctx()) as ctx:
@@ -33,9 +41,16 @@ class TestCronTools(base.TestCase):
 
         # Get any messages chips for the last DELETE_SINCE_HOURS hours + 30 seconds ago.
         chip = self.last_chip_for_path(['user', 'messages', '*'],
-                                       seconds_ago=utils.in_seconds(hours=vacuum_old_chips.DELETE_SINCE_HOURS)+30)
+                                       seconds_ago=utils.in_seconds(hours=vacuum_old_chips.DELETE_SINCE_HOURS +
+                                                                    vacuum_old_chips.PARTITION_HOURS)+30)
         # There should be no messages chips as they were vacuumed.
         self.assertEqual(chip, None)
+        # The oldest partitions were dropped and new partitions were added to stay ahead of now.
+        with db.commit_or_rollback(self.get_ctx()) as ctx:
+            with db.conn(ctx) as ctx:
+                vacuumed_partitions = vacuum_old_chips.chip_partitions(ctx)
+        self.assertTrue(partitions[0] not in vacuumed_partitions)
+        self.assertTrue(vacuumed_partitions[-2][1] > partitions[-2][1])
 
     def test_cleanup_target_render_metadata(self):
         # This process runs on real time, not gametime, so it's no easy to simulate the conditions
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the number of database round trips and wall clock time spent by the operation behind each
+of the UserModel.load_row_cache presets, with the lazy loaders each running their own queries and with
+the preset loaded first in a single round trip.
+The user measured is a throwaway user who has replayed the fastest_game_story, which is deleted afterwards.
+"""
+import os, sys, time
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from datetime import timedelta
+from optparse import OptionParser
+
+from front import read_config_and_init, debug
+from front.lib import db, gametime, email_module
+from front.models import user as user_module
+from front.backend import activity, renderer
+from front.debug.stories import fastest_game_story
+from front.tools import replay_game
+
+BENCHMARK_EMAIL = "benchmark_bulk_load@example.com"
+
+def create_benchmark_user(conf):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            replay_game.ReplayGame(ctx, BENCHMARK_EMAIL, route_structs=fastest_game_story.routes(),
+                                   beats=fastest_game_story.beats(), verbose=False).run(no_prompt=True)
+            return debug.get_user_by_email(ctx, BENCHMARK_EMAIL).user_id
+
+def delete_benchmark_user(conf, user_id):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            debug.delete_user_and_data(ctx, user_id)
+
+def gamestate_operation(ctx, user):
+    user.to_struct()
+
+def renderer_operation(ctx, user):
+    rover = user.rovers.values()[0]
+    renderer.process_target_struct(user, rover.targets.last())
+
+def notifications_operation(ctx, user):
+    now = gametime.now()
+    activity.recent_activity_for_user(ctx, user, since=now - timedelta(days=7), until=now)
+    activity.lure_activity_for_user(ctx, user)
+
+def callbacks_only_operation(ctx, user):
+    for collection in (user.messages, user.missions, user.progress, user.achievements, user.capabilities):
+        len(collection)
+    user.metadata
+    user.current_voucher_level
+
+# The operation measured for each preset, see user.BULK_LOAD_PRESETS.
+OPERATIONS = [
+    ('gamestate', gamestate_operation),
+    ('renderer', renderer_operation),
+    ('notifications', notifications_operation),
+    ('callbacks-only', callbacks_only_operation)
+]
+
+def time_operation(conf, user_id, operation, preset):
+    """ Run the operation for a freshly loaded user and return the (round trips, seconds) it took. """
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            start_count = db.query_count(ctx)
+            start = time.time()
+            user = user_module.user_from_context(ctx, user_id)
+            if preset is not None:
+                user.load_row_cache(preset)
+            operation(ctx, user)
+            elapsed = time.time() - start
+            round_trips = db.query_count(ctx) - start_count
+            db.rollback(ctx)
+            return round_trips, elapsed
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=20,
+                      help="Number of times to run each operation per mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_id = create_benchmark_user(conf)
+    try:
+        for preset, operation in OPERATIONS:
+            for use_preset in (None, preset):
+                # Warm up the named query caches.
+                time_operation(conf, user_id, operation, use_preset)
+                results = [time_operation(conf, user_id, operation, use_preset) for i in range(options.iterations)]
+                round_trips = sum(r[0] for r in results) / float(len(results))
+                millis = sum(r[1] for r in results) / len(results) * 1000
+                print "%-14s load_row_cache=%-14s %6.1f round trips %8.2f ms" % (
+                    preset, use_preset, round_trips, millis)
+    finally:
+        delete_benchmark_user(conf, user_id)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the size and encode/decode time of chip content stored as JSON objects against the compact
+encoding (chips.ENCODE_CHIPS), and the size of a fetch_chips response with and without gzip.
+The chips measured are those sent to a throwaway user while replaying the fastest_game_story,
+which is deleted afterwards.
+"""
+import os, sys, time, zlib
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from datetime import timedelta
+from optparse import OptionParser
+
+from front import read_config_and_init, debug, resource
+from front.lib import db, gametime, utils, xjson, email_module
+from front.models import chips
+from front.debug.stories import fastest_game_story
+from front.tools import replay_game
+
+BENCHMARK_EMAIL = "benchmark_chip_encoding@example.com"
+
+def replay_story(conf):
+    """ Replay the story for a new user and return all of the chips they were sent, without the time fields. """
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            replay_game.ReplayGame(ctx, BENCHMARK_EMAIL, route_structs=fastest_game_story.routes(),
+                                   beats=fastest_game_story.beats(), verbose=False).run(no_prompt=True)
+            user = debug.get_user_by_email(ctx, BENCHMARK_EMAIL)
+            # Include every chip which was sent to be delivered in the future as well.
+            all_chips = chips.get_chips(ctx, user, utils.usec_dt_from_db(0),
+                                        gametime.now() + timedelta(days=365), True)
+            debug.delete_user_and_data(ctx, user.user_id)
+    return [dict(action=c['action'], path=c['path'], value=c['value']) for c in all_chips]
+
+def measure(all_chips, encode_chips, iterations):
+    """ Return the (bytes, encode microseconds, decode microseconds) per chip for the given mode. """
+    chips.ENCODE_CHIPS = encode_chips
+    start = time.time()
+    for i in xrange(iterations):
+        encoded = [chips._encode_chip_content(c['action'], c['path'], c['value']) for c in all_chips]
+    encode_usec = (time.time() - start) * 1000000 / (iterations * len(all_chips))
+    start = time.time()
+    for i in xrange(iterations):
+        for content in encoded:
+            chips._decode_chip_content(content)
+    decode_usec = (time.time() - start) * 1000000 / (iterations * len(all_chips))
+    size = sum(len(content) for content in encoded) / float(len(all_chips))
+    return size, encode_usec, decode_usec
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=20,
+                      help="Number of times to encode and decode every chip per mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    all_chips = replay_story(conf)
+    print "%d chips sent while replaying fastest_game_story" % len(all_chips)
+
+    for encode_chips in (False, True):
+        size, encode_usec, decode_usec = measure(all_chips, encode_chips, options.iterations)
+        print "ENCODE_CHIPS=%-5s %8.1f bytes/chip  encode %7.2f us/chip  decode %7.2f us/chip" % (
+            encode_chips, size, encode_usec, decode_usec)
+    chips.ENCODE_CHIPS = True
+
+    # The response the client would receive if it fetched every chip at once.
+    body = xjson.dumps({'chips': all_chips})
+    compressor = zlib.compressobj(resource.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    start = time.time()
+    compressed = compressor.compress(body) + compressor.flush()
+    elapsed = time.time() - start
+    print "fetch_chips response %8.1f bytes/chip plain  %8.1f bytes/chip gzip  (%.2f ms to compress)" % (
+        len(body) / float(len(all_chips)), len(compressed) / float(len(all_chips)), elapsed * 1000)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
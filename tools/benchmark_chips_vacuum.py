@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark vacuuming expired chips by deleting rows from an unpartitioned table against dropping
+hourly partitions (see cron/vacuum_old_chips.py), while other threads keep inserting chips as the
+game servers would. Reports how long the vacuum took and the insert latency seen while it ran.
+The benchmark uses its own scratch tables, which are dropped afterwards, but it should still only
+be run against a development database.
+"""
+import os, sys, time, uuid, threading
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from datetime import timedelta
+from optparse import OptionParser
+
+from front import read_config_and_init
+from front.lib import db, gametime, utils
+from front.cron import vacuum_old_chips
+
+DELETE_TABLE = "_benchmark_chips_delete"
+PARTITIONED_TABLE = "_benchmark_chips_partitioned"
+CREATE_TABLE = """CREATE TABLE %s (
+  user_id binary(16) NOT NULL,
+  transient tinyint(1) NOT NULL DEFAULT '1',
+  content blob NOT NULL,
+  seq bigint(20) NOT NULL AUTO_INCREMENT,
+  `time` bigint(20) unsigned NOT NULL,
+  PRIMARY KEY (seq,`time`),
+  KEY user_id_time (user_id,`time`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8"""
+CHIP_CONTENT = '{"action":"m","path":["user","rovers","%s","targets","%s"],"value":{"processed":1}}' % (
+    uuid.uuid1(), uuid.uuid1())
+INSERT_BATCH_SIZE = 1000
+
+def fresh_ctx(conf):
+    """ Returns a copy of the config without any database state so it can be used from another thread. """
+    return dict((k, v) for k, v in conf.iteritems() if not k.startswith('_'))
+
+def create_tables(conf, hours):
+    with db.commit_or_rollback(fresh_ctx(conf)) as ctx:
+        with db.conn(ctx) as ctx:
+            for table_name in (DELETE_TABLE, PARTITIONED_TABLE):
+                db.run_ddl(ctx, "DROP TABLE IF EXISTS %s" % table_name)
+                db.run_ddl(ctx, CREATE_TABLE % table_name)
+            db.run_ddl(ctx, "ALTER TABLE %s PARTITION BY RANGE (`time`) (PARTITION %s VALUES LESS THAN MAXVALUE)" % (
+                PARTITIONED_TABLE, vacuum_old_chips.FUTURE_PARTITION))
+            # Create the hourly partitions as if the vacuum cron had been running since the oldest chip.
+            now = gametime.now()
+            gametime.set_now(now - timedelta(hours=hours))
+            try:
+                vacuum_old_chips.add_chip_partitions(ctx, vacuum_old_chips.chip_partitions(ctx, PARTITIONED_TABLE),
+                    now + timedelta(hours=vacuum_old_chips.PARTITIONS_AHEAD_HOURS), table_name=PARTITIONED_TABLE)
+            finally:
+                gametime.unset_now()
+
+def drop_tables(conf):
+    with db.commit_or_rollback(fresh_ctx(conf)) as ctx:
+        with db.conn(ctx) as ctx:
+            for table_name in (DELETE_TABLE, PARTITIONED_TABLE):
+                db.run_ddl(ctx, "DROP TABLE IF EXISTS %s" % table_name)
+
+def fill_table(conf, table_name, rows, hours):
+    """ Insert rows chips spread evenly over the hours before they would be vacuumed. """
+    oldest = utils.usec_db_from_dt(gametime.now() - timedelta(hours=hours + vacuum_old_chips.DELETE_SINCE_HOURS))
+    step = hours * 3600 * 1000000 / rows
+    user_ids = [uuid.uuid1() for i in range(100)]
+    for start in xrange(0, rows, INSERT_BATCH_SIZE):
+        chips = [(user_ids[i % len(user_ids)], CHIP_CONTENT, 1, oldest + i * step)
+                 for i in xrange(start, min(start + INSERT_BATCH_SIZE, rows))]
+        with db.commit_or_rollback(fresh_ctx(conf)) as ctx:
+            with db.conn(ctx) as ctx:
+                db._run_query_string(ctx, "INSERT INTO %s (user_id, content, transient, time) VALUES @:chips" % table_name,
+                                     chips=chips)
+
+class Inserter(threading.Thread):
+    """ Insert one chip per transaction into the given table until stopped, recording the latency of each. """
+    def __init__(self, conf, table_name):
+        super(Inserter, self).__init__()
+        self.ctx = fresh_ctx(conf)
+        self.table_name = table_name
+        self.latencies = []
+        self.running = True
+
+    def run(self):
+        user_id = uuid.uuid1()
+        while self.running:
+            start = time.time()
+            with db.commit_or_rollback(self.ctx) as ctx:
+                with db.conn(ctx) as ctx:
+                    db._run_query_string(ctx, "INSERT INTO %s SET user_id=:user_id, content=:content, transient=1, time=:time"
+                                         % self.table_name, user_id=user_id, content=CHIP_CONTENT,
+                                         time=utils.usec_db_from_dt(gametime.now()))
+            self.latencies.append(time.time() - start)
+
+def vacuum(conf, table_name, since):
+    with db.commit_or_rollback(fresh_ctx(conf)) as ctx:
+        with db.conn(ctx) as ctx:
+            if table_name == PARTITIONED_TABLE:
+                partitions = vacuum_old_chips.chip_partitions(ctx, table_name)
+                vacuum_old_chips.drop_chip_partitions(ctx, partitions, since, table_name=table_name)
+            else:
+                db._run_query_string(ctx, "DELETE FROM %s WHERE time <= :since" % table_name,
+                                     since=utils.usec_db_from_dt(since))
+
+def benchmark(conf, table_name, rows, hours, threads):
+    fill_table(conf, table_name, rows, hours)
+    inserters = [Inserter(conf, table_name) for i in range(threads)]
+    for inserter in inserters:
+        inserter.start()
+    # Let the inserters reach a steady state before vacuuming.
+    time.sleep(1)
+    for inserter in inserters:
+        inserter.latencies = []
+    start = time.time()
+    vacuum(conf, table_name, gametime.now() - timedelta(hours=vacuum_old_chips.DELETE_SINCE_HOURS))
+    elapsed = time.time() - start
+    for inserter in inserters:
+        inserter.running = False
+    for inserter in inserters:
+        inserter.join()
+
+    latencies = sorted(l for inserter in inserters for l in inserter.latencies)
+    if len(latencies) == 0:
+        latencies = [0]
+    print "%-28s vacuum %8.3f s  %6d inserts during vacuum  p50 %7.2f ms  p99 %7.2f ms  max %7.2f ms" % (
+        table_name, elapsed, len(latencies), latencies[len(latencies) / 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000, latencies[-1] * 1000)
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-r", "--rows", dest="rows", type="int", default=500000,
+                      help="Number of expired chips to vacuum.")
+    parser.add_option("-H", "--hours", dest="hours", type="int", default=24,
+                      help="Number of hours the expired chips are spread over.")
+    parser.add_option("-t", "--threads", dest="threads", type="int", default=4,
+                      help="Number of threads inserting chips during the vacuum.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    conf = read_config_and_init(args[0])
+    create_tables(conf, options.hours + vacuum_old_chips.DELETE_SINCE_HOURS)
+    try:
+        for table_name in (DELETE_TABLE, PARTITIONED_TABLE):
+            benchmark(conf, table_name, options.rows, options.hours, options.threads)
+    finally:
+        drop_tables(conf)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
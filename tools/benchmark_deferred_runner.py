@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the throughput of running a backlog of deferred actions (default 10000, spread over 100 users),
+comparing run_deferred_since in a single process, which is how cron/run_deferred_actions.py runs them while
+holding the global lock, against several worker processes running deferred.run_deferred_claimed.
+The deferred rows are TIMER actions for a subtype with no callback so that only the cost of running the
+deferred system is measured. Their run_at times are far in the past and only deferreds older than those are
+run, so deferreds belonging to other users are left alone. The throwaway users are deleted afterwards.
+"""
+import os, sys, time, uuid
+from datetime import datetime, timedelta
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init, debug
+from front.lib import db, email_module
+from front.models import user as user_module
+from front.backend import deferred
+
+BENCHMARK_EMAIL = "benchmark_deferred_runner_%d@example.com"
+BENCHMARK_SUBTYPE = "TMR_BENCHMARK"
+# Every benchmark deferred runs before this time.
+RUN_AT_START = datetime(2000, 1, 1)
+SINCE = datetime(2000, 2, 1)
+INSERT_BATCH_SIZE = 500
+
+def create_benchmark_users(conf, user_count):
+    user_ids = []
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            for i in range(user_count):
+                email = BENCHMARK_EMAIL % i
+                existing_user = debug.get_user_by_email(ctx, email)
+                if existing_user is not None:
+                    debug.delete_user_and_data(ctx, existing_user.user_id)
+                user = user_module.create_and_setup_password_user(ctx, email, "benchmark", "Bench", "Mark")
+                user_ids.append(user.user_id)
+    return user_ids
+
+def delete_benchmark_users(conf, user_ids):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            for user_id in user_ids:
+                debug.delete_user_and_data(ctx, user_id)
+
+def queue_deferreds(conf, user_ids, row_count):
+    """ Queue row_count TIMER deferreds, interleaving the users as a real backlog would. """
+    for start in xrange(0, row_count, INSERT_BATCH_SIZE):
+        rows = []
+        for i in xrange(start, min(start + INSERT_BATCH_SIZE, row_count)):
+            rows.append((uuid.uuid1(), user_ids[i % len(user_ids)], deferred.types.TIMER, BENCHMARK_SUBTYPE,
+                         RUN_AT_START + timedelta(seconds=i), None))
+        with db.commit_or_rollback(conf) as ctx:
+            with db.conn(ctx) as ctx:
+                db._run_query_string(ctx, "INSERT INTO deferred (deferred_id, user_id, deferred_type, subtype, run_at, "
+                    "payload) VALUES @:rows", rows=rows)
+
+def queued_count(conf):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            return db._run_query_string(ctx, "SELECT COUNT(*) AS queued FROM deferred WHERE run_at <= :since",
+                                        since=SINCE)[0]['queued']
+
+def run_locked(conf, workers):
+    with db.commit_or_rollback(conf) as ctx:
+        deferred.run_deferred_since(ctx, SINCE)
+
+def run_claimed(conf, workers):
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                with db.commit_or_rollback(conf) as ctx:
+                    deferred.run_deferred_claimed(ctx, SINCE, deferred.worker_name())
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+MODES = [
+    ('locked', run_locked),
+    ('claimed', run_claimed)
+]
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-r", "--rows", dest="rows", type="int", default=10000,
+                      help="Number of deferred rows to queue per run.")
+    parser.add_option("-u", "--users", dest="users", type="int", default=100,
+                      help="Number of throwaway users to spread the deferred rows over.")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=4,
+                      help="Number of worker processes for the claimed mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_ids = create_benchmark_users(conf, options.users)
+    try:
+        for name, run in MODES:
+            queue_deferreds(conf, user_ids, options.rows)
+            # Forked workers must not share the parent's pooled connections.
+            db.close_pools()
+            start = time.time()
+            run(conf, options.workers)
+            elapsed = time.time() - start
+            remaining = queued_count(conf)
+            print "%-8s %8.1f deferreds/sec %8.1f sec (%d rows, %d users, %d workers, %d left queued)" % (
+                name, (options.rows - remaining) / elapsed, elapsed, options.rows, options.users,
+                options.workers if name == 'claimed' else 1, remaining)
+    finally:
+        delete_benchmark_users(conf, user_ids)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
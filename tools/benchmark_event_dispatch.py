@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark lib/event.dispatch for a user with many open missions and unachieved achievements (default 60 and 80).
+Three ways of dispatching are compared: resolving every callback class and function by name on each call, which
+is how run_callback and run_all_callbacks were implemented before the callback dispatch tables existed; running
+every mission and achievement callback through the dispatch tables; and only running the callbacks which are
+interested in the event (see callbacks.interested_subtypes), which is how dispatch works now.
+The target_en_route event is dispatched and the missions and achievements are chosen from those whose
+target_en_route callback is the base class no-op, so only the cost of dispatching is measured. The user,
+missions and achievements are in memory stand-ins and nothing is written to the database.
+"""
+import os, sys, time, inspect, itertools
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init, callbacks
+from front.callbacks import mission_callbacks, achievement_callbacks, target_callbacks
+from front.lib import event
+from front.models import mission as mission_module
+from front.models import achievement as achievement_module
+
+EVENT_TYPE = event.types.TARGET_EN_ROUTE
+
+class BenchmarkMission(object):
+    def __init__(self, mission_definition):
+        self.mission_definition = mission_definition
+        self.done = 0
+
+class BenchmarkAchievement(object):
+    def __init__(self, achievement_key):
+        self.achievement_key = achievement_key
+
+    def was_achieved(self):
+        return False
+
+class BenchmarkMissions(object):
+    def __init__(self, missions):
+        self._missions = missions
+
+    def not_done(self):
+        return list(self._missions)
+
+    def not_done_with_definitions(self, mission_definitions):
+        return [m for m in self._missions if m.mission_definition in mission_definitions]
+
+class BenchmarkAchievements(object):
+    def __init__(self, achievements):
+        self._achievements = achievements
+
+    def not_achieved(self):
+        return list(self._achievements)
+
+    def not_achieved_with_keys(self, achievement_keys):
+        return [a for a in self._achievements if a.achievement_key in achievement_keys]
+
+class BenchmarkUser(object):
+    def __init__(self, missions, achievements):
+        self.missions = BenchmarkMissions(missions)
+        self.achievements = BenchmarkAchievements(achievements)
+
+def previous_run_callback(module_name, callback_name, subtype=None, *args, **kwargs):
+    """ run_callback as it was implemented before the dispatch tables. """
+    module = callbacks._get_module_from_name(module_name)
+    callback_class = getattr(module, subtype + callbacks.CALLBACK_PREFIX, None)
+    if callback_class is None:
+        callback_class = getattr(module, callbacks.BASE_CALLBACKS_CLASS)
+    return getattr(callback_class, callback_name)(*args, **kwargs)
+
+def previous_run_all_callbacks(module_name, callback_name, ctx, user, *args, **kwargs):
+    """ run_all_callbacks as it was implemented before the dispatch tables. """
+    module = callbacks._get_module_from_name(module_name)
+    return_values = []
+    for name, callback_class in inspect.getmembers(module):
+        if name.endswith(callbacks.CALLBACK_PREFIX) and inspect.isclass(callback_class):
+            return_values.append(getattr(callback_class, callback_name)(ctx, user, *args, **kwargs))
+    return return_values
+
+# Every mission definition and achievement key, see every_subtype_interested. Set once the data is loaded.
+EVERY_SUBTYPE = frozenset()
+
+def every_subtype_interested(module_name, callback_name, event_subtype=None):
+    """ interested_subtypes for dispatching to every mission and achievement. """
+    return EVERY_SUBTYPE
+
+MODES = [
+    ('previous', previous_run_callback, previous_run_all_callbacks, every_subtype_interested),
+    ('tables', callbacks.run_callback, callbacks.run_all_callbacks, every_subtype_interested),
+    ('interest', callbacks.run_callback, callbacks.run_all_callbacks, callbacks.interested_subtypes)
+]
+
+def inherits_base(callback_module, subtype):
+    """ Returns True if the EVENT_TYPE callback for the given subtype is the module's BaseCallbacks function. """
+    callback_class = getattr(callback_module, subtype + callbacks.CALLBACK_PREFIX, callback_module.BaseCallbacks)
+    return getattr(callback_class, EVENT_TYPE).im_func is getattr(callback_module.BaseCallbacks, EVENT_TYPE).im_func
+
+def create_benchmark_user(mission_count, achievement_count):
+    definitions = sorted(d for d in mission_module._get_all_mission_definitions() if inherits_base(mission_callbacks, d))
+    keys = sorted(k for k in achievement_module.all_achievement_definitions() if inherits_base(achievement_callbacks, k))
+    # There may be fewer definitions than requested, in which case they are repeated.
+    missions = [BenchmarkMission(d) for d in itertools.islice(itertools.cycle(definitions), mission_count)]
+    achievements = [BenchmarkAchievement(k) for k in itertools.islice(itertools.cycle(keys), achievement_count)]
+    return BenchmarkUser(missions, achievements)
+
+def time_dispatch(user, iterations, mode):
+    """ Dispatch EVENT_TYPE iterations times using the callback functions of the given mode, returning the
+        elapsed seconds. """
+    original = event.run_callback, event.run_all_callbacks, event.interested_subtypes
+    event.run_callback, event.run_all_callbacks, event.interested_subtypes = mode[1:]
+    try:
+        start = time.time()
+        for i in xrange(iterations):
+            event.dispatch(None, user, EVENT_TYPE, None, None)
+        return time.time() - start
+    finally:
+        event.run_callback, event.run_all_callbacks, event.interested_subtypes = original
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-m", "--missions", dest="missions", type="int", default=60,
+                      help="Number of open missions to give the benchmark user.")
+    parser.add_option("-a", "--achievements", dest="achievements", type="int", default=80,
+                      help="Number of unachieved achievements to give the benchmark user.")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=2000,
+                      help="Number of events to dispatch per mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    read_config_and_init(args[0])
+    global EVERY_SUBTYPE
+    EVERY_SUBTYPE = frozenset(mission_module._get_all_mission_definitions()).union(
+        achievement_module.all_achievement_definitions())
+    # Every target callback class is run for each event so they must all do nothing for it.
+    for callback_class in callbacks.get_all_callback_classes(callbacks.TARGET_CB):
+        assert inherits_base(target_callbacks, callbacks.callback_key_from_class(callback_class))
+
+    user = create_benchmark_user(options.missions, options.achievements)
+    for mode in MODES:
+        name = mode[0]
+        # Warm up the dispatch tables and module lookups before timing.
+        time_dispatch(user, 1, mode)
+        elapsed = min(time_dispatch(user, options.iterations, mode) for i in range(3))
+        print "%-8s %8.1f usec per dispatch (%d missions, %d achievements)" % (
+            name, elapsed * 1000000 / options.iterations, options.missions, options.achievements)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark encoding the 'user' namespace of the gamestate for a large user, comparing building the
+to_struct tree and then calling xjson.dumps against streaming it with chips.iter_json.
+Reported for each is the time until the first byte of JSON is available, the total time and the peak
+memory used. Every run happens in a forked process so that the peak memory of each is measured separately.
+The throwaway user is the same synthetic user as benchmark_model_memory and is deleted afterwards.
+"""
+import os, sys, time, resource, marshal
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init
+from front.lib import db, xjson, email_module
+from front.models import chips
+from front.models import user as user_module
+from front.tools import benchmark_model_memory
+
+def built_json(user):
+    """ The previous gamestate encoding, yields the JSON as a single string. """
+    yield xjson.dumps(user.to_struct())
+
+def streamed_json(user):
+    return chips.iter_json(user)
+
+MODES = [
+    ('built', built_json),
+    ('streamed', streamed_json)
+]
+
+def encode_user(conf, user_id, encode):
+    """ Load the user and encode their gamestate, returning (first byte seconds, total seconds, bytes, peak bytes). """
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            start_rss = benchmark_model_memory.resident_bytes()
+            start = time.time()
+            user = user_module.user_from_context(ctx, user_id)
+            user.load_row_cache('gamestate')
+            first_byte = None
+            length = 0
+            # Discard each chunk as a WSGI server would once it has been written.
+            for chunk in encode(user):
+                if first_byte is None:
+                    first_byte = time.time() - start
+                length += len(chunk)
+            elapsed = time.time() - start
+            db.rollback(ctx)
+    # ru_maxrss is in kilobytes on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - start_rss
+    return first_byte, elapsed, length, peak
+
+def encode_user_in_child(conf, user_id, encode):
+    """ Run encode_user in a forked process and return its result. """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            os.write(write_fd, marshal.dumps(encode_user(conf, user_id, encode)))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    data = ''
+    while True:
+        read = os.read(read_fd, 4096)
+        if not read:
+            break
+        data += read
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return marshal.loads(data)
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-t", "--targets", dest="targets", type="int", default=5000,
+                      help="Number of synthetic targets to give the benchmark user.")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=3,
+                      help="Number of times to encode the gamestate per mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_id = benchmark_model_memory.create_benchmark_user(conf, options.targets)
+    try:
+        for name, encode in MODES:
+            results = [encode_user_in_child(conf, user_id, encode) for i in range(options.iterations)]
+            first_byte = min(r[0] for r in results)
+            elapsed = min(r[1] for r in results)
+            length = results[0][2]
+            peak = max(r[3] for r in results)
+            print "%-8s first byte %8.1f ms total %8.1f ms %6.1f MB of JSON, peak memory grew by %6.1f MB" % (
+                name, first_byte * 1000, elapsed * 1000, length / (1024.0 * 1024.0), peak / (1024.0 * 1024.0))
+    finally:
+        benchmark_model_memory.delete_benchmark_user(conf, user_id)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
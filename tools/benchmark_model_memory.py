@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the memory used by, and time taken to load, the chips.Model instances of a large gamestate.
+A throwaway user is created and given a number of synthetic picture targets (default 5000), each with
+images, image_rects and metadata, and then every rover, target, image_rect and sound is loaded.
+Run this against two revisions to compare chips.Model implementations. The user is deleted afterwards.
+"""
+import os, sys, time, gc, uuid
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init, debug
+from front.lib import db, gametime, email_module
+from front.models import user as user_module
+
+BENCHMARK_EMAIL = "benchmark_model_memory@example.com"
+IMAGE_RECTS_PER_TARGET = 2
+INSERT_BATCH_SIZE = 500
+
+def create_benchmark_user(conf, target_count):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            existing_user = debug.get_user_by_email(ctx, BENCHMARK_EMAIL)
+            if existing_user is not None:
+                debug.delete_user_and_data(ctx, existing_user.user_id)
+            user = user_module.create_and_setup_password_user(ctx, BENCHMARK_EMAIL, "benchmark", "Bench", "Mark")
+            rover = user.rovers.active()[0]
+            last = rover.targets.last()
+            user_id, rover_id = user.user_id, rover.rover_id
+            start_time, lat, lng = last.arrival_time, last.lat, last.lng
+
+    now = gametime.now()
+    for start in xrange(0, target_count, INSERT_BATCH_SIZE):
+        targets, images, rects, metadata = [], [], [], []
+        for i in xrange(start, min(start + INSERT_BATCH_SIZE, target_count)):
+            target_id = uuid.uuid1()
+            arrival_time = start_time + (i + 1) * 60
+            targets.append((target_id, user_id, rover_id, 0, lat + i * 0.00001, lng + i * 0.00001, 0.0, 0.0,
+                            arrival_time - 60, arrival_time, 1, 1, now, now))
+            for image_type in ('PHOTO', 'THUMB', 'WALLPAPER'):
+                images.append((target_id, user_id, image_type, "http://example.com/%s/%s.jpg" % (target_id, image_type), now))
+            for seq in range(IMAGE_RECTS_PER_TARGET):
+                rects.append((target_id, user_id, seq, 0.1, 0.1, 0.2, 0.2, None, None, None))
+            metadata.append((target_id, user_id, "TGT_BENCHMARK", "value"))
+        with db.commit_or_rollback(conf) as ctx:
+            with db.conn(ctx) as ctx:
+                db._run_query_string(ctx, "INSERT INTO targets (target_id, user_id, rover_id, seq, lat, lng, yaw, pitch, "
+                    "start_time, arrival_time, processed, picture, created, render_at) VALUES @:targets", targets=targets)
+                db._run_query_string(ctx, "INSERT INTO target_images (target_id, user_id, type, url, created) "
+                    "VALUES @:images", images=images)
+                db._run_query_string(ctx, "INSERT INTO target_image_rects (target_id, user_id, seq, xmin, ymin, xmax, ymax, "
+                    "density, species_id, subspecies_id) VALUES @:rects", rects=rects)
+                db._run_query_string(ctx, "INSERT INTO target_metadata (target_id, user_id, `key`, value) "
+                    "VALUES @:metadata", metadata=metadata)
+    return user_id
+
+def delete_benchmark_user(conf, user_id):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            debug.delete_user_and_data(ctx, user_id)
+
+def resident_bytes():
+    """ The resident set size of this process. Only supported on Linux. """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def instance_bytes(model):
+    """ The memory used by the model instance itself, not including its field values. """
+    size = sys.getsizeof(model)
+    if hasattr(model, '__dict__'):
+        size += sys.getsizeof(model.__dict__)
+    return size
+
+def load_models(conf, user_id):
+    """ Load every rover, target, image_rect and sound for the user and return (user, seconds, models). """
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            start = time.time()
+            user = user_module.user_from_context(ctx, user_id)
+            user.load_row_cache('rovers', 'targets')
+            models = []
+            for rover in user.rovers.itervalues():
+                models.append(rover)
+                for target in rover.targets.itervalues():
+                    target.images
+                    target.metadata
+                    models.append(target)
+                    models.extend(target.image_rects.itervalues())
+                    models.extend(target.sounds.itervalues())
+            elapsed = time.time() - start
+            db.rollback(ctx)
+    return user, elapsed, models
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-t", "--targets", dest="targets", type="int", default=5000,
+                      help="Number of synthetic targets to give the benchmark user.")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=5,
+                      help="Number of times to load the user's models.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_id = create_benchmark_user(conf, options.targets)
+    try:
+        # Warm up the named query caches.
+        load_models(conf, user_id)
+        timings = []
+        for i in range(options.iterations):
+            gc.collect()
+            before = resident_bytes()
+            user, elapsed, models = load_models(conf, user_id)
+            gc.collect()
+            used = resident_bytes() - before
+            timings.append(elapsed)
+            del user, models
+        # Report on the models from the last load.
+        user, elapsed, models = load_models(conf, user_id)
+        by_class = {}
+        for m in models:
+            by_class.setdefault(m.__class__.__name__, []).append(instance_bytes(m))
+        print "%d models loaded in %.1f ms (best of %d), resident memory grew by %.1f MB" % (
+            len(models), min(timings) * 1000, options.iterations, used / (1024.0 * 1024.0))
+        for name, sizes in sorted(by_class.iteritems()):
+            print "%-12s %6d instances %6.1f bytes per instance (without field values)" % (
+                name, len(sizes), sum(sizes) / float(len(sizes)))
+    finally:
+        delete_benchmark_user(conf, user_id)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
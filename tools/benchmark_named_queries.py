@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Micro-benchmark the per-call overhead of preparing every named query in lib/db/queries for
+execution (NamedQuery._construct_sql), without needing a database connection.
+Parameter values are synthesized from the placeholders in each query.
+"""
+import os, sys, re, time, uuid, json
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front.lib.db import named_query
+
+QUERY_DIR = os.path.join(os.path.dirname(__file__), "..", "lib", "db", "queries")
+_PLACEHOLDER = re.compile(r"([@#%]?):([a-zA-Z][a-zA-Z0-9_-]*)")
+
+def synthesize_params(contents):
+    """ Return a parameters dict with a plausible value for every placeholder used in the query contents. """
+    text = json.dumps(contents)
+    params = {}
+    for prefix, key in _PLACEHOLDER.findall(text):
+        if prefix == '@':
+            params[key] = [uuid.uuid1(), uuid.uuid1(), uuid.uuid1()]
+        elif prefix == '#' or key in ('time', 'since', 'before', 'limit', 'count', 'offset'):
+            params[key] = 1234
+        elif key.endswith('_id'):
+            params[key] = uuid.uuid1()
+        else:
+            params[key] = u"value \u00e9"
+    for key, option in contents.get('dynamic_where', {}).iteritems():
+        if isinstance(option, basestring):
+            params[key] = True
+    return params
+
+def load_queries(manager):
+    queries = []
+    for dirpath, dirnames, filenames in os.walk(QUERY_DIR):
+        for filename in sorted(filenames):
+            if not filename.endswith(named_query.NAMED_QUERY_SUFFIX):
+                continue
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, QUERY_DIR)[:-len(named_query.NAMED_QUERY_SUFFIX)]
+            with open(path) as f:
+                contents = json.load(f)
+            queries.append((manager.get(name), synthesize_params(contents)))
+    return queries
+
+def benchmark(queries, iterations):
+    """ Returns the average number of microseconds spent constructing a single query. """
+    start = time.time()
+    for i in xrange(iterations):
+        for nq, params in queries:
+            nq._construct_sql(params.copy())
+    elapsed = time.time() - start
+    return elapsed / (iterations * len(queries)) * 1000000
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=200,
+                      help="Number of passes over every named query.")
+    parser.add_option("-s", "--stat-interval", dest="stat_interval", type="int", default=5,
+                      help="The stat_interval_seconds for the NamedQueryManager.")
+    (options, args) = parser.parse_args(argv)
+
+    manager = named_query.NamedQueryManager(QUERY_DIR, stat_interval_seconds=options.stat_interval)
+    queries = load_queries(manager)
+    # Warm up any caches.
+    benchmark(queries, 1)
+    per_call = benchmark(queries, options.iterations)
+    print "%d named queries, %d iterations: %.2f usec per _construct_sql call" % (
+        len(queries), options.iterations, per_call)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
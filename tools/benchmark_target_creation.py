@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the number of database statements and wall clock time spent by
+target.create_new_target_with_constraints, with chips buffered and inserted at commit
+(chips.BUFFER_CHIPS = True) and inserted one at a time as they are sent.
+A throwaway user is created for the benchmark and every target creation is rolled back,
+so each iteration starts from the same gamestate.
+"""
+import os, sys, time
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init, debug
+from front.lib import db, email_module
+from front.models import chips
+from front.models import target as target_module
+from front.models import user as user_module
+
+BENCHMARK_EMAIL = "benchmark_target_creation@example.com"
+
+def create_benchmark_user(conf):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            existing_user = debug.get_user_by_email(ctx, BENCHMARK_EMAIL)
+            if existing_user is not None:
+                debug.delete_user_and_data(ctx, existing_user.user_id)
+            user = user_module.create_and_setup_password_user(ctx, BENCHMARK_EMAIL, "benchmark", "Bench", "Mark")
+            return user.user_id
+
+def delete_benchmark_user(conf, user_id):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            debug.delete_user_and_data(ctx, user_id)
+
+def time_target_creation(conf, user_id):
+    """ Create a single target and return the (statements, seconds) it took, including flushing any chips. """
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            user = user_module.user_from_context(ctx, user_id)
+            rover = user.rovers.active()[0]
+            last_target = rover.targets.last()
+
+            start_count = db.query_count(ctx)
+            start = time.time()
+            target = target_module.create_new_target_with_constraints(ctx, rover,
+                lat=last_target.lat + 0.00005, lng=last_target.lng + 0.00005, yaw=0.0,
+                arrival_delta=rover.min_target_seconds, metadata={})
+            db.flush(ctx)
+            elapsed = time.time() - start
+            statements = db.query_count(ctx) - start_count
+
+            db.rollback(ctx)
+            if target is None:
+                raise Exception("Target creation was refused by validate_new_target_params.")
+            return statements, elapsed
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=20,
+                      help="Number of targets to create per mode.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_id = create_benchmark_user(conf)
+    try:
+        for buffered in (False, True):
+            chips.BUFFER_CHIPS = buffered
+            # Warm up the named query and user loading caches.
+            time_target_creation(conf, user_id)
+            results = [time_target_creation(conf, user_id) for i in range(options.iterations)]
+            statements = sum(r[0] for r in results) / float(len(results))
+            millis = sum(r[1] for r in results) / len(results) * 1000
+            print "BUFFER_CHIPS=%-5s %5.1f statements %8.2f ms per create_new_target_with_constraints" % (
+                buffered, statements, millis)
+    finally:
+        delete_benchmark_user(conf, user_id)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2014 Lazy 8 Studios, LLC.
+# All rights reserved.
+"""
+Benchmark the TargetCollection queries backed by its arrival_time index against the equivalent
+sort and scan of every target, which is how they were implemented before the index existed.
+A throwaway user's active rover is given a number of synthetic targets (default 2000), half of which
+have been arrived at. The user is deleted afterwards.
+"""
+import os, sys, time, uuid
+BASEDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.append(BASEDIR)
+
+from optparse import OptionParser
+
+from front import read_config_and_init, debug
+from front.lib import db, gametime, geometry, email_module
+from front.models import user as user_module
+
+BENCHMARK_EMAIL = "benchmark_target_index@example.com"
+INSERT_BATCH_SIZE = 500
+# Seconds between each synthetic target.
+TARGET_INTERVAL = 60
+
+def create_benchmark_user(conf, target_count):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            existing_user = debug.get_user_by_email(ctx, BENCHMARK_EMAIL)
+            if existing_user is not None:
+                debug.delete_user_and_data(ctx, existing_user.user_id)
+            user = user_module.create_and_setup_password_user(ctx, BENCHMARK_EMAIL, "benchmark", "Bench", "Mark")
+            rover = user.rovers.active()[0]
+            last = rover.targets.last()
+            user_id, rover_id = user.user_id, rover.rover_id
+            lat, lng = last.lat, last.lng
+            # Half of the targets will have been arrived at.
+            start_time = user.epoch_now - (target_count / 2) * TARGET_INTERVAL
+
+    now = gametime.now()
+    for start in xrange(0, target_count, INSERT_BATCH_SIZE):
+        targets = []
+        for i in xrange(start, min(start + INSERT_BATCH_SIZE, target_count)):
+            arrival_time = start_time + (i + 1) * TARGET_INTERVAL
+            targets.append((uuid.uuid1(), user_id, rover_id, 0, lat + i * 0.00001, lng + i * 0.00001, 0.0, 0.0,
+                            arrival_time - TARGET_INTERVAL, arrival_time, 1, 1, now, now))
+        with db.commit_or_rollback(conf) as ctx:
+            with db.conn(ctx) as ctx:
+                db._run_query_string(ctx, "INSERT INTO targets (target_id, user_id, rover_id, seq, lat, lng, yaw, pitch, "
+                    "start_time, arrival_time, processed, picture, created, render_at) VALUES @:targets", targets=targets)
+    return user_id
+
+def delete_benchmark_user(conf, user_id):
+    with db.commit_or_rollback(conf) as ctx:
+        with db.conn(ctx) as ctx:
+            debug.delete_user_and_data(ctx, user_id)
+
+## The operations measured, each as (indexed, scanned) implementations taking the rover.
+def by_arrival_time_indexed(rover):
+    rover.targets.by_arrival_time()
+
+def by_arrival_time_scanned(rover):
+    sorted(rover.targets.values(), key=lambda t: t.arrival_time)
+
+def arrived_at_indexed(rover):
+    rover.targets.arrived_at()
+
+def arrived_at_scanned(rover):
+    arrived_at_scanned_list(rover)
+
+def arrived_at_scanned_list(rover, newest_first=False):
+    return [t for t in sorted(rover.targets.values(), key=lambda t: t.arrival_time, reverse=newest_first)
+            if t.has_been_arrived_at()]
+
+def next_indexed(rover):
+    # Walk back from the last arrived at target, as the renderer and callbacks do.
+    for t in rover.targets.arrived_at(newest_first=True)[:100]:
+        t.next()
+        t.previous()
+
+def next_scanned(rover):
+    for t in arrived_at_scanned_list(rover, newest_first=True)[:100]:
+        targets = sorted(rover.targets.values(), key=lambda t: t.arrival_time)
+        index = targets.index(t)
+        targets[index + 1] if index + 1 < len(targets) else None
+        targets[index - 1] if index > 0 else None
+
+def location_at_time_indexed(rover):
+    rover.location_at_time(rover.user.epoch_now)
+
+def location_at_time_scanned(rover):
+    at_time = rover.user.epoch_now
+    sorted_targets = sorted(rover.targets.values(), key=lambda t: t.arrival_time)
+    index = 0
+    for index, target in enumerate(sorted_targets):
+        if target.start_time > at_time:
+            break
+    if sorted_targets[index].start_time <= at_time:
+        index += 1
+    geometry.interpolate_between_targets(sorted_targets[max(0, index-1)], sorted_targets[max(0, index-2)], at_time)
+
+def distance_traveled_indexed(rover):
+    rover.distance_traveled()
+
+def distance_traveled_scanned(rover):
+    sorted_targets = arrived_at_scanned_list(rover)
+    distance = 0
+    for t, next_target in zip(sorted_targets, sorted_targets[1:]):
+        distance += t.straight_distance_between_targets(next_target)
+
+OPERATIONS = [
+    ('by_arrival_time', by_arrival_time_indexed, by_arrival_time_scanned),
+    ('arrived_at', arrived_at_indexed, arrived_at_scanned),
+    ('next/previous x100', next_indexed, next_scanned),
+    ('location_at_time', location_at_time_indexed, location_at_time_scanned),
+    ('distance_traveled', distance_traveled_indexed, distance_traveled_scanned)
+]
+
+def time_operation(rover, operation, iterations):
+    """ Return the average number of seconds taken by the operation. """
+    # Build the index, if the operation uses it, before timing.
+    operation(rover)
+    start = time.time()
+    for i in range(iterations):
+        operation(rover)
+    return (time.time() - start) / iterations
+
+def main(argv):
+    parser = OptionParser(usage="usage: %prog [options] <deployment>")
+    parser.add_option("-t", "--targets", dest="targets", type="int", default=2000,
+                      help="Number of synthetic targets to give the benchmark user's rover.")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int", default=50,
+                      help="Number of times to run each operation.")
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify deployment name, e.g. development")
+
+    # Silence the email sending system.
+    email_module.set_echo_dispatcher(quiet=True)
+    conf = read_config_and_init(args[0])
+    user_id = create_benchmark_user(conf, options.targets)
+    try:
+        with db.commit_or_rollback(conf) as ctx:
+            with db.conn(ctx) as ctx:
+                user = user_module.user_from_context(ctx, user_id)
+                rover = user.rovers.active()[0]
+                print "%d targets, %d arrived at" % (len(rover.targets), len(rover.targets.arrived_at()))
+                for name, indexed, scanned in OPERATIONS:
+                    indexed_millis = time_operation(rover, indexed, options.iterations) * 1000
+                    scanned_millis = time_operation(rover, scanned, options.iterations) * 1000
+                    print "%-20s indexed %8.3f ms scanned %8.3f ms" % (name, indexed_millis, scanned_millis)
+                db.rollback(ctx)
+    finally:
+        delete_benchmark_user(conf, user_id)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])